@@ -0,0 +1,82 @@
+import random
+import string
+import argparse
+
+DISTRIBUTIONS = ['sequential', 'random', 'clustered']
+DEFAULT_FIELD_WIDTHS = {'name': 12, 'city': 10, 'score': 6}
+KEY_GAP = 4 # key space per row, so inserts can find unused keys between existing ones
+NUM_CLUSTERS = 8
+
+class Generator:
+    """ generates reproducible synthetic records: an integer primary key followed by fields
+        of random letters and digits, each at most field_widths[field] long.
+
+        key_distribution decides which keys exist, out of a key space of KEY_GAP keys per row:
+            sequential  evenly spaced keys, written in order
+            random      keys spread uniformly over the key space, written shuffled
+            clustered   keys packed into NUM_CLUSTERS dense hot ranges, written shuffled
+    """
+    def __init__(self, num_rows, field_widths=DEFAULT_FIELD_WIDTHS, key_distribution='sequential', seed=0):
+        assert key_distribution in DISTRIBUTIONS
+        self.num_rows = num_rows
+        self.field_widths = dict(field_widths)
+        self.key_distribution = key_distribution
+        self.random = random.Random(seed)
+        self.key_space = max(num_rows, 1) * KEY_GAP
+        self.cluster_size = -(-num_rows // NUM_CLUSTERS) # ceiling
+        self.cluster_starts = [i * (self.key_space // NUM_CLUSTERS) for i in range(NUM_CLUSTERS)]
+
+    @property
+    def fields(self):
+        return ['id'] + list(self.field_widths)
+
+    def keys(self):
+        """ returns the keys of the rows, in the order they are written """
+        if self.key_distribution == 'sequential':
+            return [i * KEY_GAP + 1 for i in range(self.num_rows)]
+
+        if self.key_distribution == 'random':
+            keys = self.random.sample(range(self.key_space), self.num_rows)
+        else:
+            keys = [key for start in self.cluster_starts for key in range(start, start + self.cluster_size)]
+            keys = keys[:self.num_rows]
+        self.random.shuffle(keys)
+        return keys
+
+    def key(self):
+        """ returns a random key from the distribution, which may or may not exist.
+            clustered keys fall in the hot ranges or just after them, where the free keys are
+        """
+        if self.key_distribution == 'clustered':
+            start = self.random.choice(self.cluster_starts)
+            return self.random.randrange(start, start + 2 * self.cluster_size)
+        return self.random.randrange(self.key_space)
+
+    def record(self, key):
+        """ returns a record with key and random values that fit field_widths """
+        return [str(key)] + [self.value(width) for width in self.field_widths.values()]
+
+    def value(self, width):
+        return ''.join(self.random.choices(string.ascii_letters + string.digits, k=self.random.randint(1, width)))
+
+    def write_csv(self, path):
+        """ writes the header and num_rows records to path. returns the keys written """
+        keys = self.keys()
+        with open(path, 'w') as f:
+            f.write(','.join(self.fields) + '\n')
+            f.writelines(','.join(self.record(key)) + '\n' for key in keys)
+        return keys
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='writes a synthetic csv file to import')
+    parser.add_argument('path')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='sequential')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--widths', help='field widths, e.g. name:12,city:10 (default: %(default)s)',
+                        default=','.join(f'{f}:{w}' for f, w in DEFAULT_FIELD_WIDTHS.items()))
+    args = parser.parse_args()
+
+    widths = {field: int(width) for field, width in (spec.split(':') for spec in args.widths.split(','))}
+    Generator(args.rows, widths, args.distribution, args.seed).write_csv(args.path)
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from file_database.database import Database
+from file_database.util import *
+from benchmarks.generate import Generator, DISTRIBUTIONS, DEFAULT_FIELD_WIDTHS
+
+DATABASE_NAME = 'bench'
+MISS_RATE = 0.1 # share of point lookups for keys that do not exist
+SCAN_RECORDS = 100 # records read by each range scan
+MIX = [('find', 0.7), ('scan', 0.1), ('insert', 0.1), ('update', 0.05), ('delete', 0.05)]
+PERCENTILES = [50, 90, 99]
+
+class Benchmark:
+    """ times workloads against a Database built from a synthetic csv file, see Generator.
+
+        the import scenario imports the csv file. every other scenario runs num_ops operations
+        on its own copy of the imported database, and reports
+            ops_per_second      operations over the time spent in them
+            latency_us          percentiles and maximum of single operation latencies
+            bytes_read          bytes read and written by read/write system calls, from /proc/self/io,
+            bytes_written       including closing the database. reads through mmap are not counted.
+                                None where /proc/self/io is not available
+            errors              operations that raised, e.g. an insert that did not fit the field widths
+            stats               the counters of Database.stats(), e.g. slots_read and slots_written
+    """
+    SCENARIOS = ['import', 'point_lookup', 'range_scan', 'insert_heavy', 'delete_heavy', 'mixed']
+
+    def __init__(self, num_rows, num_ops, field_widths=DEFAULT_FIELD_WIDTHS, key_distribution='sequential', seed=0, work_dir=None):
+        self.num_rows = num_rows
+        self.num_ops = num_ops
+        self.generator = Generator(num_rows, field_widths, key_distribution, seed)
+        self.work_dir = work_dir
+        self.keys = None # keys of the imported database
+
+    def run(self, scenarios=SCENARIOS):
+        """ runs scenarios and returns the results as a JSON-serializable dict """
+        assert all(scenario in self.SCENARIOS for scenario in scenarios)
+        results = {
+            'config': {
+                'rows': self.num_rows,
+                'ops': self.num_ops,
+                'field_widths': self.generator.field_widths,
+                'key_distribution': self.generator.key_distribution,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'scenarios': {},
+        }
+
+        with tempfile.TemporaryDirectory(dir=self.work_dir) as tmp_dir:
+            # every scenario needs the imported database, so the import always runs
+            results['scenarios']['import'] = self.run_import(tmp_dir)
+            base_dir = os.path.join(tmp_dir, 'import')
+            for scenario in scenarios:
+                if scenario == 'import':
+                    continue
+                scenario_dir = os.path.join(tmp_dir, scenario)
+                shutil.copytree(base_dir, scenario_dir)
+                results['scenarios'][scenario] = self.run_scenario(scenario, scenario_dir)
+                shutil.rmtree(scenario_dir)
+
+        if 'import' not in scenarios:
+            del results['scenarios']['import']
+        return results
+
+    def run_import(self, tmp_dir):
+        csv_path = os.path.join(tmp_dir, f'{DATABASE_NAME}.csv')
+        self.keys = self.generator.write_csv(csv_path)
+        csv_bytes = os.path.getsize(csv_path)
+
+        io_before = io_counters()
+        start = time.perf_counter()
+        database = Database(os.path.join(tmp_dir, 'import'))
+        database.import_data(DATABASE_NAME, csv_path)
+        seconds = time.perf_counter() - start
+        io_after = io_counters()
+
+        # the first open builds the index files, which every scenario's copy then loads
+        database.open()
+        database.close()
+
+        return {
+            'rows': self.num_rows,
+            'seconds': seconds,
+            'rows_per_second': self.num_rows / seconds if seconds else None,
+            'csv_bytes': csv_bytes,
+            **io_deltas(io_before, io_after),
+        }
+
+    def run_scenario(self, scenario, database_dir):
+        database = Database(database_dir)
+        database.open()
+        database.stats(reset=True)
+        workload = Workload(database, self.generator, self.keys)
+        ops = {
+            'point_lookup': lambda: [workload.find] * self.num_ops,
+            'range_scan':   lambda: [workload.scan] * self.num_ops,
+            'insert_heavy': lambda: [workload.insert] * self.num_ops,
+            'delete_heavy': lambda: [workload.delete] * self.num_ops,
+            'mixed':        lambda: workload.mix(self.num_ops),
+        }[scenario]()
+
+        latencies = []
+        errors = 0
+        io_before = io_counters()
+        for op in ops:
+            start = time.perf_counter_ns()
+            try:
+                op()
+            except (RecordNotFoundError, InvalidRecordSizeError, DuplicatePrimaryKeyError):
+                errors += 1
+            latencies.append(time.perf_counter_ns() - start)
+        database.close()
+        stats = database.stats()
+        io_after = io_counters()
+
+        seconds = sum(latencies) / 1e9
+        return {
+            'ops': len(latencies),
+            'seconds': seconds,
+            'ops_per_second': len(latencies) / seconds if seconds else None,
+            'latency_us': latency_summary(latencies),
+            'errors': errors,
+            **io_deltas(io_before, io_after),
+            'stats': stats['counters'],
+        }
+
+
+class Workload:
+    """ single operations on database, keeping track of which keys exist """
+    def __init__(self, database, generator, keys):
+        self.database = database
+        self.generator = generator
+        self.random = generator.random
+        self.keys = list(keys)
+        self.key_set = set(keys)
+
+    def mix(self, num_ops):
+        """ returns num_ops operations drawn according to MIX """
+        ops, weights = zip(*MIX)
+        return [getattr(self, op) for op in self.random.choices(ops, weights, k=num_ops)]
+
+    def find(self):
+        """ finds an existing key, or a missing one MISS_RATE of the time """
+        if self.random.random() < MISS_RATE or not self.keys:
+            key = self._new_key()
+            try:
+                self.database.find(key)
+            except RecordNotFoundError:
+                pass
+        else:
+            self.database.find(self.random.choice(self.keys))
+
+    def scan(self):
+        start_key = self.random.choice(self.keys) if self.keys else None
+        for _ in self.database.scan(start_key, limit=SCAN_RECORDS):
+            pass
+
+    def insert(self):
+        key = self._new_key()
+        self.database.insert(self.generator.record(key))
+        self.keys.append(key)
+        self.key_set.add(key)
+
+    def update(self):
+        if not self.keys:
+            raise RecordNotFoundError()
+        index, record = self.database.find(self.random.choice(self.keys))
+        field = self.random.choice(self.database.fields[1:])
+        self.database.update(index, record, field, self.generator.value(self.generator.field_widths[field]))
+
+    def delete(self):
+        if not self.keys:
+            raise RecordNotFoundError()
+        # swap the deleted key to the end, so removing it is O(1)
+        i = self.random.randrange(len(self.keys))
+        self.keys[i], self.keys[-1] = self.keys[-1], self.keys[i]
+        key = self.keys.pop()
+        self.key_set.remove(key)
+        index, record = self.database.find(key)
+        self.database.delete(index, record)
+
+    def _new_key(self):
+        while True:
+            key = self.generator.key()
+            if key not in self.key_set:
+                return key
+
+
+def latency_summary(latencies_ns):
+    """ returns the PERCENTILES and maximum of latencies_ns, in microseconds """
+    if not latencies_ns:
+        return {}
+    ordered = sorted(latencies_ns)
+    summary = {}
+    for percentile in PERCENTILES:
+        rank = max(1, -(-percentile * len(ordered) // 100)) # nearest rank
+        summary[f'p{percentile}'] = ordered[rank - 1] / 1000
+    summary['max'] = ordered[-1] / 1000
+    return summary
+
+def io_counters():
+    """ returns (bytes read, bytes written) by this process's read and write system calls,
+        or None if the platform does not report them
+    """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def io_deltas(before, after):
+    if before is None or after is None:
+        return {'bytes_read': None, 'bytes_written': None}
+    return {'bytes_read': after[0] - before[0], 'bytes_written': after[1] - before[1]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmarks a database built from synthetic data. prints the results as JSON')
+    parser.add_argument('--rows', type=int, default=100000, help='rows imported (default: %(default)s)')
+    parser.add_argument('--ops', type=int, default=10000, help='operations per scenario (default: %(default)s)')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='sequential')
+    parser.add_argument('--widths', help='field widths, e.g. name:12,city:10 (default: %(default)s)',
+                        default=','.join(f'{f}:{w}' for f, w in DEFAULT_FIELD_WIDTHS.items()))
+    parser.add_argument('--scenarios', default=','.join(Benchmark.SCENARIOS), help='comma-separated (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='where to build the databases (default: the system temporary directory)')
+    parser.add_argument('--output', help='file to write the results to (default: standard output)')
+    args = parser.parse_args()
+
+    widths = {field: int(width) for field, width in (spec.split(':') for spec in args.widths.split(','))}
+    benchmark = Benchmark(args.rows, args.ops, widths, args.distribution, args.seed, args.work_dir)
+    results = benchmark.run(args.scenarios.split(','))
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
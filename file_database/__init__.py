@@ -1 +1,3 @@
-from .cli import CommandLineInterface
\ No newline at end of file
+from .cli import CommandLineInterface
+from .server import DatabaseServer
+from .client import DatabaseClient
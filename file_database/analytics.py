@@ -0,0 +1,269 @@
+from .util import *
+from .query import OPERATORS
+from .record_format import TextFormat, INT64_OFFSET, SPILL_MARKER
+
+try:
+    import numpy as np
+except ImportError: # analytics are only available with numpy installed
+    np = None
+
+AGGREGATES = ['count', 'sum', 'min', 'max']
+
+class Analytics:
+    """ vectorized queries over a data file, mapped with np.memmap as a structured array whose
+        fields are the fixed-width byte fields of the records. nothing is parsed per record:
+        blank slots are masked out by comparing whole lines with BLANK_RECORD (or by the status
+        byte of binary records), and a field is converted to numbers, with whole-column
+        arithmetic, only when a query needs it. usage:
+            analytics = database.analytics()
+            mask = analytics.where('score', '>=', 500) & analytics.where('city', '==', 'city7')
+            analytics.count(mask), analytics.sum('score', mask), analytics.group_by('city', 'max', 'score')
+
+        masks are boolean arrays with one entry per slot, False for blank slots, combined with &, | and ~.
+        the data file must stay open while the Analytics is used. it sees the records as of its
+        creation; writes made after it may or may not show, so create another to query them.
+        raises ImportError if numpy is not installed
+    """
+    def __init__(self, data_file):
+        if np is None:
+            raise ImportError('analytics require numpy')
+
+        self.fields = data_file.fields
+        self.record_format = data_file.record_format
+        self.line_size = data_file.line_size
+        self.dtype = self._dtype(data_file.record_format)
+
+        with data_file.lock.read():
+            num_records = len(data_file)
+            if num_records == 0:
+                self.rows = np.zeros(0, self.dtype)
+            else:
+                self.rows = np.memmap(data_file.data_path, self.dtype, mode='r', shape=(num_records,))
+
+            # lines written since the last checkpoint are not in the file yet
+            slots = sorted(data_file.dirty)
+            self.patch_slots = np.array(slots, dtype=np.int64)
+            self.patch_rows = np.frombuffer(b''.join(data_file.dirty[i] for i in slots), self.dtype)
+            blank = data_file.BLANK_RECORD
+
+        # whole lines, and whether each slot holds a record
+        self.lines = self.rows.view(f'V{self.line_size}')
+        self.patch_lines = self.patch_rows.view(f'V{self.line_size}')
+        if isinstance(self.record_format, TextFormat):
+            blank = np.frombuffer(blank, f'V{self.line_size}')[0]
+            self.present = self.lines != blank
+            self.present[self.patch_slots] = self.patch_lines != blank
+        else:
+            self.present = self._column('_status') != 0
+
+        self.columns = {} # field: raw bytes of the field in every slot
+        self.numbers = {} # field: field converted to numbers in every slot, 0 in blank slots
+
+    def __len__(self):
+        return self.count()
+
+    def where(self, field, op, value):
+        """ returns a mask of the records whose field compares to value with op: ==, !=, <, <=, > or >=.
+            numeric fields, and text fields compared with an int or float value, are compared as numbers.
+            raises InvalidInputError if op is unknown or field is not numeric where a number is needed
+        """
+        if op not in OPERATORS:
+            raise InvalidInputError(f'unknown operator {op}')
+
+        if self._is_numeric(field) or isinstance(value, (int, float)):
+            try:
+                value = float(value) if isinstance(value, str) else value
+            except ValueError:
+                raise InvalidInputError(f'{value} is not a number')
+            return OPERATORS[op](self.values(field), value) & self.present
+
+        return OPERATORS[op](self._raw(field), self._encode(field, value)) & self.present
+
+    def count(self, mask=None):
+        return int(np.count_nonzero(self._mask(mask)))
+
+    def sum(self, field, mask=None):
+        return self.values(field)[self._mask(mask)].sum().item()
+
+    def min(self, field, mask=None):
+        """ returns None if no record matches mask """
+        values = self.values(field)[self._mask(mask)]
+        return values.min().item() if len(values) else None
+
+    def max(self, field, mask=None):
+        """ returns None if no record matches mask """
+        values = self.values(field)[self._mask(mask)]
+        return values.max().item() if len(values) else None
+
+    def group_by(self, field, aggregate='count', value_field=None, mask=None):
+        """ returns {value of field: aggregate of value_field over the records with that value},
+            aggregate being count, sum, min or max. value_field is not needed to count
+        """
+        if aggregate not in AGGREGATES:
+            raise InvalidInputError(f'unknown aggregate {aggregate}')
+        assert aggregate == 'count' or value_field is not None
+
+        mask = self._mask(mask)
+        groups = self.values(field) if self._is_numeric(field) else self._raw(field)
+        group_values, group_numbers = np.unique(groups[mask], return_inverse=True)
+        keys = [self._decode(field, value) for value in group_values.tolist()]
+
+        if aggregate == 'count':
+            results = np.bincount(group_numbers, minlength=len(group_values))
+        else:
+            values = self.values(value_field)[mask]
+            if aggregate == 'sum':
+                results = np.zeros(len(group_values), values.dtype)
+                np.add.at(results, group_numbers, values)
+            else:
+                # sort by group, then by value: each group's first or last entry is its extreme
+                order = np.lexsort((values, group_numbers))
+                starts = np.searchsorted(group_numbers[order], np.arange(len(group_values)))
+                ends = np.append(starts[1:], len(order)) - 1
+                results = values[order][starts if aggregate == 'min' else ends]
+        return dict(zip(keys, results.tolist()))
+
+    def keys(self, mask=None):
+        """ returns the primary keys of the records in mask, in key order """
+        return self.values(self.fields[0])[self._mask(mask)].tolist()
+
+    def records(self, mask=None, limit=None):
+        """ returns the records in mask, in key order, at most limit of them. only these records are parsed """
+        slots = np.flatnonzero(self._mask(mask))[:limit]
+        return [self._record(slot) for slot in slots.tolist()]
+
+    def values(self, field):
+        """ returns field as numbers in every slot, converted on first use, 0 in blank slots.
+            raises InvalidInputError if a record's field is not a number
+        """
+        if field not in self.numbers:
+            self.numbers[field] = self._convert(field)
+        return self.numbers[field]
+
+
+    def _dtype(self, record_format):
+        """ returns the structured dtype of a line of record_format """
+        names, formats, offsets = [], [], []
+        if isinstance(record_format, TextFormat):
+            offset = 0
+            for field, width in record_format.field_to_length.items():
+                names.append(field)
+                formats.append(f'S{width}')
+                offsets.append(offset)
+                offset += width
+        else:
+            names.append('_status')
+            formats.append('u1')
+            offsets.append(0)
+            offset = 1
+            for field, (name, n) in zip(record_format.field_to_type, record_format.types):
+                if name == 'varchar':
+                    names.append(f'_{field}_length')
+                    formats.append('>u2')
+                    offsets.append(offset)
+                    offset += 2
+                names.append(field)
+                formats.append({'int64': '>u8', 'float64': '>f8'}.get(name, f'S{n}'))
+                offsets.append(offset)
+                offset += {'int64': 8, 'float64': 8}.get(name, n)
+        return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': record_format.line_size})
+
+    def _column(self, name):
+        """ returns a copy of column name of the structured array, with the lines not yet checkpointed """
+        column = np.array(self.rows[name])
+        if len(self.patch_slots):
+            column[self.patch_slots] = self.patch_rows[name]
+        return column
+
+    def _raw(self, field):
+        if field not in self.columns:
+            column = self._column(field)
+            if self.fields.index(field) in self.record_format.spill_fields:
+                column = self._load_spilled(column)
+            self.columns[field] = column
+        return self.columns[field]
+
+    def _load_spilled(self, column):
+        """ returns column of a variable-length field with the values stored in the overflow heap
+            in place of their references. the column then holds bytes objects
+        """
+        spilled = np.flatnonzero(np.char.startswith(column, SPILL_MARKER.encode()) & self.present)
+        if len(spilled) == 0:
+            return column
+        column = column.astype(object)
+        for i in spilled.tolist():
+            column[i] = self.record_format.load(column[i].decode().strip()).encode()
+        return column
+
+    def _is_numeric(self, field):
+        if isinstance(self.record_format, TextFormat):
+            return field == self.fields[0] # the primary key is always an integer
+        name, _ = self.record_format.types[self.fields.index(field)]
+        return name in ['int64', 'float64']
+
+    def _convert(self, field):
+        column = self._raw(field)
+        if not isinstance(self.record_format, TextFormat):
+            name, _ = self.record_format.types[self.fields.index(field)]
+            if name == 'int64':
+                return (column.astype(np.uint64) ^ np.uint64(INT64_OFFSET)).view(np.int64) # undo the offset
+            if name == 'float64':
+                return column.astype(np.float64)
+            raise InvalidInputError(f'{field} is not a number')
+
+        values = None if column.dtype == object else _parse_ints(column, self.present)
+        if values is None:
+            values = np.zeros(len(column), np.float64)
+            try:
+                values[self.present] = column[self.present].astype(np.float64)
+            except ValueError:
+                raise InvalidInputError(f'{field} is not a number')
+        return values
+
+    def _encode(self, field, value):
+        """ returns value as stored in field, so it compares with the raw column like the values do """
+        if isinstance(self.record_format, TextFormat):
+            return pad(value, self.record_format.field_to_length[field]).encode()
+        return value.encode()
+
+    def _decode(self, field, value):
+        if isinstance(value, bytes):
+            return value.decode().strip()
+        return value
+
+    def _mask(self, mask):
+        return self.present if mask is None else mask & self.present
+
+    def _record(self, slot):
+        i = np.searchsorted(self.patch_slots, slot)
+        if i < len(self.patch_slots) and self.patch_slots[i] == slot:
+            return self.record_format.parse(self.patch_lines[i].tobytes())
+        return self.record_format.parse(self.lines[slot].tobytes())
+
+
+def _parse_ints(column, present):
+    """ returns the integers stored as space padded text in column, an array of bytes, with
+        0 for slots that are not present. the digits are read one position at a time over the
+        whole column. returns None if a present value is not an integer
+    """
+    width = column.dtype.itemsize
+    chars = np.frombuffer(column.tobytes(), np.uint8).reshape(len(column), width)
+    digits = chars - np.uint8(ord('0')) # non-digits wrap around to 10 or more
+    is_digit = digits < 10
+    is_minus = chars == ord('-')
+
+    # a value is an optional minus followed by digits, padded with spaces on the right
+    is_space = (chars == ord(' ')) | (chars == 0)
+    ends = np.where(is_space.all(axis=1), 0, width - np.argmin(is_space[:, ::-1], axis=1))
+    position = np.arange(width)
+    inside = position < ends[:, None]
+    valid = (is_digit | (is_minus & (position == 0)) | ~inside).all(axis=1) & (is_digit & inside).any(axis=1)
+    if not valid[present].all():
+        return None
+
+    values = np.zeros(len(column), np.int64)
+    for j in range(width):
+        values = np.where(is_digit[:, j] & inside[:, j], values * 10 + digits[:, j], values)
+    values = np.where(is_minus[:, 0], -values, values)
+    values[~present] = 0
+    return values
@@ -0,0 +1,90 @@
+import math
+from array import array
+from .util import *
+
+MASK64 = 2**64 - 1
+
+class BloomFilter:
+    """ bit array telling whether a primary key may be in a data file, kept in {name}.bloom.
+        a key that was added is always reported present; any other key is reported absent with
+        probability about 1 - false_positive_rate, which answers most lookups for missing keys
+        without searching the key index. bits of removed keys are not cleared, so the filter is
+        rebuilt with the data file, and when more keys were added than it was sized for
+    """
+    MIN_CAPACITY = 1024
+
+    def __init__(self, path, false_positive_rate):
+        assert 0 < false_positive_rate < 1
+        self.path = path
+        self.false_positive_rate = false_positive_rate
+        self.bits = bytearray()
+        self.num_bits = 0
+        self.num_hashes = 0
+        self.capacity = 0 # keys the filter holds at false_positive_rate
+        self.num_keys = 0 # keys added since it was reset
+
+    def __contains__(self, key):
+        if self.num_bits == 0:
+            return True # not built. every key may be present
+        bits, num_bits = self.bits, self.num_bits
+        h1, h2 = _hashes(key)
+        for _ in range(self.num_hashes):
+            bit = h1 % num_bits
+            if not bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+            h1 += h2
+        return True
+
+    def add(self, key):
+        bits, num_bits = self.bits, self.num_bits
+        h1, h2 = _hashes(key)
+        for _ in range(self.num_hashes):
+            bit = h1 % num_bits
+            bits[bit >> 3] |= 1 << (bit & 7)
+            h1 += h2
+        self.num_keys += 1
+
+    def is_full(self):
+        """ returns True if more keys were added than the filter was sized for """
+        return self.num_keys > self.capacity
+
+    def reset(self, keys):
+        """ replaces the filter with one holding keys, sized for twice as many """
+        self.capacity = max(2 * len(keys), self.MIN_CAPACITY)
+        self.num_bits = math.ceil(-self.capacity * math.log(self.false_positive_rate) / math.log(2)**2)
+        self.num_bits += -self.num_bits % 8
+        self.num_hashes = max(round(self.num_bits / self.capacity * math.log(2)), 1)
+        self.bits = bytearray(self.num_bits // 8)
+        self.num_keys = 0
+        for key in keys:
+            self.add(key)
+
+    def load(self, fingerprint):
+        """ loads the filter from self.path. returns False if it is missing, was saved for a
+            different version of the data file or with a different false positive rate
+        """
+        try:
+            saved_fingerprint, rate, sizes, bits = load_arrays(self.path, 'q', 'd', 'q', 'B')
+        except (FileNotFoundError, EOFError):
+            return False
+
+        if list(saved_fingerprint) != fingerprint or list(rate) != [self.false_positive_rate] or len(sizes) != 3:
+            return False
+
+        self.capacity, self.num_hashes, self.num_keys = sizes
+        self.bits = bytearray(bits)
+        self.num_bits = len(self.bits) * 8
+        return True
+
+    def save(self, fingerprint):
+        save_arrays(self.path, array('q', fingerprint), array('d', [self.false_positive_rate]),
+                    array('q', [self.capacity, self.num_hashes, self.num_keys]), array('B', self.bits))
+
+
+def _hashes(key):
+    """ returns two independent 64-bit hashes of an integer key. bit i of a key is h1 + i * h2
+        (double hashing). they do not depend on the process, unlike hash() of strings
+    """
+    h1 = (key * 0x9E3779B97F4A7C15) & MASK64
+    h2 = (((h1 ^ (h1 >> 31)) * 0xBF58476D1CE4E5B9) & MASK64) | 1
+    return h1, h2
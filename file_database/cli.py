@@ -1,5 +1,7 @@
 import os
 from .database_manager import DatabaseManager
+from .export import FORMATS, EXTENSIONS, report_lines, report_widths
+from .stats import traced
 from .util import *
 
 class CommandLineInterface:
@@ -11,10 +13,13 @@ class CommandLineInterface:
             "open database":        self.open_database,
             "close database":       self.close_database,
             "display record":       self.display_record,
+            "find records":         self.find_records,
             "update record":        self.update_record,
             "create report":        self.create_report,
             "add record":           self.add_record,
             "delete record":        self.delete_record,
+            "create index":         self.create_index,
+            "stats":                self.show_stats,
             "quit":                 self.quit,
         }
 
@@ -35,7 +40,8 @@ class CommandLineInterface:
                 except (InvalidInputError, EmptyInputError):
                     self.print_input_error()
                 else:
-                    self.NAME_TO_COMMAND[command_name]()
+                    with traced(f'cli:{command_name}'):
+                        self.NAME_TO_COMMAND[command_name]()
                     input_received = True
 
     # user commands
@@ -75,8 +81,13 @@ class CommandLineInterface:
                     )
                 except (InvalidInputError, EmptyInputError):
                     print_error("Empty or invalid database selected. Aborting.")
-                else:
+                    return
+
+                try:
                     self.database_manager.open_database(db_name)
+                except DatabaseLockedError:
+                    print_error(f"Database {db_name} is in use by another process. Aborting.")
+                else:
                     print(f"Using database {db_name}.")
 
     def close_database(self):
@@ -89,6 +100,34 @@ class CommandLineInterface:
         if record is not None: # error messages already printed
             self.print_record(record)
 
+    def find_records(self):
+        if self.no_databases_open():
+            return
+
+        db = self.database_manager.current_database
+        try:
+            field = get_option_from_user("Enter the field to search: ", db.fields)
+        except (InvalidInputError, EmptyInputError):
+            print_error("Empty or invalid field. Aborting.")
+            return
+
+        low = input(f"Enter the lowest {field} to find (no limit): ") or None
+        high = input(f"Enter the highest {field} to find (no limit): ") or None
+
+        try:
+            if low is not None and low == high:
+                matches = db.find_by(field, low)
+            else:
+                matches = db.find_range(field, low, high)
+        except InvalidInputError:
+            print_error(f"Invalid {field}. Aborting.")
+            return
+
+        if len(matches) == 0:
+            print_error("No records found.")
+        else:
+            print(self.format_records([record for _, record in matches]))
+
     def update_record(self):
         index, record = self.prompt_user_to_find_record("update")
         if record is None:
@@ -130,14 +169,25 @@ class CommandLineInterface:
         if self.no_databases_open():
             return
         
-        default_path = os.path.join(self.get_main_dir(), 'report.txt')
-        path = input(f"Enter the file path of the report to generate ({default_path}): ") or default_path
+        export_format = input(f"Enter the report format ({', '.join(FORMATS)}) (text): ").lower() or 'text'
+        if export_format not in FORMATS:
+            print_error("Invalid report format. Aborting.")
+            return
+
+        try:
+            start_key = input("Enter the first primary key to include (no limit): ") or None
+            end_key = input("Enter the last primary key to include (no limit): ") or None
+            start_key = None if start_key is None else int(start_key)
+            end_key = None if end_key is None else int(end_key)
+        except ValueError:
+            print_error("Invalid key. Aborting.")
+            return
 
-        records = self.database_manager.current_database.find_first_n_records(10)
-        with open(path, 'w') as f:
-            f.write(self.format_records(records))
+        default_path = os.path.join(self.get_main_dir(), f'report.{EXTENSIONS[export_format]}')
+        path = input(f"Enter the file path of the report to generate ({default_path}): ") or default_path
 
-        print(f'Report generated at {path}.')
+        count = self.database_manager.current_database.export(path, export_format, start_key, end_key)
+        print(f'Report of {count} records generated at {path}.')
 
     def add_record(self):
         if self.no_databases_open():
@@ -175,7 +225,34 @@ class CommandLineInterface:
         
         prompt = f"Are you sure you want to delete this record? [Y/n] "
         if confirm(prompt, default='y'):
-            self.database_manager.current_database.delete(index)
+            self.database_manager.current_database.delete(index, record)
+
+    def create_index(self):
+        if self.no_databases_open():
+            return
+
+        db = self.database_manager.current_database
+        try:
+            field = get_option_from_user("Enter the field to index: ", db.fields)
+        except (InvalidInputError, EmptyInputError):
+            print_error("Empty or invalid field. Aborting.")
+            return
+
+        db.create_index(field)
+        print(f"Created index of {field}.")
+
+    def show_stats(self):
+        if self.no_databases_open():
+            return
+
+        db = self.database_manager.current_database
+        stats = db.stats()
+        print(f"Statistics of {db.name} since it was loaded:")
+        for name, count in sorted(stats['counters'].items()):
+            print(f"  {name:<24}{count:>14,}")
+        for name, timer in sorted(stats['timers'].items()):
+            calls, seconds = timer['calls'], timer['seconds']
+            print(f"  {name + ' time':<24}{seconds:>14.6f}s  {calls:,} calls, {seconds / calls * 1e6:,.1f}us each")
 
     def quit(self):
         if confirm("Are you sure you want to quit? [Y/n] ", default='y'):
@@ -191,26 +268,15 @@ class CommandLineInterface:
         print_options(list(self.NAME_TO_COMMAND.keys()))
 
     def print_input_error(self):
-        print('Empty or invalid command. Select an integer from 1-9 or type the name of a command.')
+        print(f'Empty or invalid command. Select an integer from 1-{len(self.NAME_TO_COMMAND)} or type the name of a command.')
 
     def print_record(self, record):
         print(self.format_records([record]))
 
     def format_records(self, records):
-        spacing = 2
         db = self.database_manager.current_database
-        data = []
-        data.append(db.fields)
-        data.extend(records)
-        max_column_widths = [max_len([x[i] for x in data]) for i in range(db.num_fields)]
-
-        output = ''
-        for row in data:
-            for i in range(db.num_fields):
-                output += pad(row[i], max_column_widths[i]+spacing)
-            output += '\n'
-
-        return output
+        widths = report_widths(db.fields, db.data_file.field_to_length)
+        return ''.join(report_lines(db.fields, widths, records))
 
     def prompt_user_to_find_record(self, verb):
         """ prompts the user to find a record by primary key
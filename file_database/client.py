@@ -0,0 +1,210 @@
+import json
+import queue
+import socket
+import threading
+from contextlib import contextmanager
+from .util import errors
+from .util import *
+from .server import DEFAULT_HOST, DEFAULT_PORT, MAX_SCAN_RECORDS
+
+class Connection:
+    """ one connection to a DatabaseServer """
+    def __init__(self, host, port, timeout=None):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.socket.makefile('rb')
+        self.writer = self.socket.makefile('wb')
+
+    def request(self, requests):
+        """ sends requests, a list of (op, args), without waiting between them and returns
+            their responses in order. a thread sends a batch while its responses are read,
+            so neither side stalls on a full socket buffer
+        """
+        lines = [(json.dumps({'id': i, 'op': op, **args}) + '\n').encode() for i, (op, args) in enumerate(requests)]
+        if len(lines) == 1:
+            self._send(lines)
+        else:
+            sender = threading.Thread(target=self._send, args=(lines,), daemon=True)
+            sender.start()
+
+        responses = []
+        for i in range(len(lines)):
+            line = self.reader.readline()
+            if not line:
+                raise ConnectionError('server closed the connection')
+            response = json.loads(line)
+            assert response.get('id') == i
+            responses.append(response)
+
+        if len(lines) > 1:
+            sender.join()
+        return responses
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+        self.socket.close()
+
+    def _send(self, lines):
+        try:
+            self.writer.writelines(lines)
+            self.writer.flush()
+        except OSError:
+            pass # the reader sees the connection close
+
+
+class Operations:
+    """ the operations of a DatabaseServer. subclasses implement _call """
+    def list_databases(self):
+        return self._call('list', {})
+
+    def create_database(self, name, csv_path):
+        """ csv_path is a path on the server """
+        return self._call('create', {'name': name, 'csv_path': csv_path})
+
+    def find(self, database, key):
+        """ returns the record with primary key key. raises RecordNotFoundError """
+        return self._call('find', {'database': database, 'key': key})
+
+    def find_by(self, database, field, value):
+        return self._call('find_by', {'database': database, 'field': field, 'value': value})
+
+    def find_range(self, database, field, low=None, high=None):
+        return self._call('find_range', {'database': database, 'field': field, 'low': low, 'high': high})
+
+    def insert(self, database, record):
+        return self._call('insert', {'database': database, 'record': record})
+
+    def insert_many(self, database, records):
+        """ returns a list with one entry per record: None if it was inserted, or the error that kept it out """
+        return self._call('insert_many', {'database': database, 'records': records}, convert=_errors)
+
+    def update(self, database, key, field, value):
+        return self._call('update', {'database': database, 'key': key, 'field': field, 'value': value})
+
+    def delete(self, database, key):
+        return self._call('delete', {'database': database, 'key': key})
+
+    def create_index(self, database, field):
+        return self._call('create_index', {'database': database, 'field': field})
+
+    def stats(self, database, reset=False):
+        """ returns the server's Database.stats() of database """
+        return self._call('stats', {'database': database, 'reset': reset})
+
+
+class DatabaseClient(Operations):
+    """ thread-safe client for a DatabaseServer.
+        each call borrows a connection from a pool of at most pool_size connections, opened as
+        needed and kept open for reuse. errors raised on the server are raised again here
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=8, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle_connections = queue.LifoQueue() # most recently used first, so spare connections can time out
+        self.available = threading.BoundedSemaphore(pool_size)
+
+    def scan(self, database, start_key=None, end_key=None, limit=None):
+        """ yields records with start_key <= key <= end_key in key order, at most limit of them.
+            records are fetched MAX_SCAN_RECORDS at a time
+        """
+        count = 0
+        while limit is None or count < limit:
+            page_size = MAX_SCAN_RECORDS if limit is None else min(MAX_SCAN_RECORDS, limit - count)
+            records = self._call('scan', {'database': database, 'start_key': start_key, 'end_key': end_key, 'limit': page_size})
+            yield from records
+            count += len(records)
+            if len(records) < page_size:
+                return
+            start_key = get_key(records[-1]) + 1
+
+    def pipeline(self):
+        """ returns a Pipeline that sends calls in one batch """
+        return Pipeline(self)
+
+    def close(self):
+        """ closes idle connections """
+        while True:
+            try:
+                self.idle_connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def execute(self, calls):
+        """ sends calls, a list of (op, args), on one connection. returns their responses """
+        with self._connection() as connection:
+            return connection.request(calls)
+
+    def _call(self, op, args, convert=None):
+        response = self.execute([(op, args)])[0]
+        result = _result(response)
+        return result if convert is None else convert(result)
+
+    @contextmanager
+    def _connection(self):
+        self.available.acquire()
+        try:
+            try:
+                connection = self.idle_connections.get_nowait()
+            except queue.Empty:
+                connection = Connection(self.host, self.port, self.timeout)
+
+            try:
+                yield connection
+            except BaseException:
+                connection.close() # the connection may be left mid-response
+                raise
+            self.idle_connections.put(connection)
+        finally:
+            self.available.release()
+
+
+class Pipeline(Operations):
+    """ collects calls and sends them together on one connection, so a batch of calls costs
+        one round trip. usage:
+            pipeline = client.pipeline()
+            pipeline.insert('people', record)
+            pipeline.find('people', 42)
+            results = pipeline.execute()
+    """
+    def __init__(self, client):
+        self.client = client
+        self.calls = [] # (op, args, convert)
+
+    def execute(self):
+        """ sends the calls collected so far. returns their results in order, with the error
+            in place of the result of each call that failed
+        """
+        calls, self.calls = self.calls, []
+        responses = self.client.execute([(op, args) for op, args, _ in calls])
+
+        results = []
+        for (_, _, convert), response in zip(calls, responses):
+            try:
+                result = _result(response)
+            except Exception as e:
+                results.append(e)
+            else:
+                results.append(result if convert is None else convert(result))
+        return results
+
+    def _call(self, op, args, convert=None):
+        self.calls.append((op, args, convert))
+
+
+def _result(response):
+    """ returns the result of response, or raises the error it reports """
+    if 'error' not in response:
+        return response['result']
+    raise _error(response['error'], response.get('message', ''))
+
+def _error(name, message=''):
+    """ returns an instance of the error class called name, or ServerError if there is none """
+    error_class = getattr(errors, name, None)
+    if not (isinstance(error_class, type) and issubclass(error_class, Exception)):
+        return ServerError(f'{name}: {message}')
+    return error_class(message) if message else error_class()
+
+def _errors(names):
+    return [None if name is None else _error(name) for name in names]
@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from .util import *
+from .csv_import import WRITE_BUFFER_SIZE
+
+class Compactor:
+    """ compacts a data file while it stays open: copies its records in key order, step_records
+        at a time, into a new file laid out with the configured fill factors, then switches
+        the data file over to it. each step holds the data file's read lock only while reading,
+        and io_budget (bytes per second, None for unlimited) throttles the copy.
+
+        records changed while the copy runs are patched into the new file just before the switch.
+        the compaction is abandoned if the data file is rewritten meanwhile, as a rewrite
+        compacts it anyway.
+
+        record_format, if given, is the format of the new file, e.g. one with a wider field
+        (see Database.widen_field). every record must fit it.
+
+        afterwards old_size, new_size and reclaimed_bytes report the result, and
+        completed is False if the compaction was abandoned or cancelled
+    """
+    DEFAULT_STEP_RECORDS = 4096
+
+    def __init__(self, data_file, io_budget=None, step_records=DEFAULT_STEP_RECORDS, record_format=None):
+        self.data_file = data_file
+        self.io_budget = io_budget
+        self.step_records = step_records
+        self.record_format = record_format
+
+        self.thread = None
+        self.cancelled = threading.Event()
+        self.completed = False
+        self.old_size = 0
+        self.new_size = 0
+        self.reclaimed_bytes = 0
+
+    def start(self):
+        """ runs the compaction in a background thread """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        df = self.data_file
+        with df.lock.write():
+            self.generation = df.generation
+            self.old_size = len(df) * df.line_size
+            record_format = df.record_format if self.record_format is None else self.record_format
+            df._open_overflow(record_format)
+            record_format = record_format.with_overflow(df.overflow)
+            df.changed_keys = set()
+
+        tmp_path = df.data_path + '.compact'
+        try:
+            with open(tmp_path, 'w+b', buffering=WRITE_BUFFER_SIZE) as f:
+                num_records, index_pairs = df._write_spread(f, self._copy_records(), record_format)
+                with df.lock.write():
+                    if self._interrupted():
+                        return
+                    num_records = self._patch(f, num_records, index_pairs, record_format)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    df._replace_file(tmp_path, num_records, index_pairs, record_format)
+        finally:
+            with df.lock.write():
+                df.changed_keys = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.new_size = num_records * record_format.line_size
+        self.reclaimed_bytes = self.old_size - self.new_size
+        self.completed = True
+        df.stats.count('compactions')
+        df.stats.count('bytes_written', self.new_size)
+
+    def _interrupted(self):
+        return self.cancelled.is_set() or self.data_file.generation != self.generation
+
+    def _copy_records(self):
+        """ yields the data file's records in key order, step_records at a time """
+        df = self.data_file
+        start_time = time.monotonic()
+        bytes_copied = 0
+        last_key = None
+        while True:
+            with df.lock.read():
+                if self._interrupted():
+                    return
+                first = 0 if last_key is None else df.key_index.position_after(last_key)
+                slots = df.key_index.slots[first:first + self.step_records]
+                if len(slots) == 0:
+                    return
+                records = [record for _, record in df.scan(slots[0], slots[-1] + 1)]
+
+            yield from records
+            last_key = get_key(records[-1])
+
+            # read and written once each
+            bytes_copied += 2 * (slots[-1] + 1 - slots[0]) * df.line_size
+            if self.io_budget:
+                ahead = bytes_copied / self.io_budget - (time.monotonic() - start_time)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def _patch(self, f, num_lines, index_pairs, record_format):
+        """ brings records changed during the copy up to date in the new file of num_lines lines
+            and index_pairs. returns the new number of lines
+        """
+        df = self.data_file
+        keys = [key for key, _ in index_pairs]
+        slots = [slot for _, slot in index_pairs]
+
+        for key in sorted(df.changed_keys):
+            try:
+                record = df[df.key_index.find(key)]
+            except RecordNotFoundError:
+                record = None
+
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                slot = slots[i]
+                if record is None:
+                    del keys[i]
+                    del slots[i]
+            elif record is not None:
+                low = slots[i - 1] if i > 0 else -1
+                high = slots[i] if i < len(slots) else num_lines
+                if high - low < 2:
+                    num_lines = self._shift_right(f, slots, i, num_lines, record_format)
+                    high = slots[i] if i < len(slots) else num_lines
+                slot = (low + high) // 2
+                keys.insert(i, key)
+                slots.insert(i, slot)
+            else:
+                continue
+
+            f.seek(slot * record_format.line_size)
+            f.write(record_format.blank if record is None else record_format.format(record))
+
+        index_pairs[:] = list(zip(keys, slots))
+        return num_lines
+
+    def _shift_right(self, f, slots, i, num_lines, record_format):
+        """ frees the slot before slots[i] by moving records i onwards up to the next gap one slot
+            right, growing the file by a line if there is no gap. returns the new number of lines
+        """
+        j = i
+        while j < len(slots) and (slots[j + 1] if j + 1 < len(slots) else num_lines) == slots[j] + 1:
+            j += 1
+
+        if j == len(slots):
+            f.seek(num_lines * record_format.line_size)
+            f.write(record_format.blank)
+            num_lines += 1
+
+        for k in range(min(j, len(slots) - 1), i - 1, -1):
+            f.seek(slots[k] * record_format.line_size)
+            line = f.read(record_format.line_size)
+            f.seek(slots[k] * record_format.line_size)
+            f.write(record_format.blank + line)
+            slots[k] += 1
+        return num_lines
@@ -0,0 +1,110 @@
+import os
+import heapq
+import shutil
+import tempfile
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from .util import *
+
+CHUNK_SIZE = 64 * 1024 * 1024 # bytes of csv parsed and sorted in memory by one worker
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class SortedCsv:
+    """ reads a csv file once, in byte-range chunks parsed by a process pool.
+        each worker sorts its chunk by key and spills it to a run file, and records are
+        streamed back in key order by merging the runs, so files larger than memory can be imported.
+        usage:
+            with SortedCsv(csv_path, tmp_dir) as csv:
+                csv.fields, csv.max_column_widths, csv.column_width_counts, csv.num_records, csv.records()
+    """
+    def __init__(self, csv_path, tmp_dir, workers=None, chunk_size=CHUNK_SIZE):
+        self.csv_path = csv_path
+        self.tmp_dir = tmp_dir # where sorted runs are spilled
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.run_dir = None
+        self.run_paths = []
+
+    def __enter__(self):
+        self.run_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        try:
+            self._sort_chunks()
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def records(self):
+        """ yields every record of the csv file, sorted by key """
+        runs = [_read_run(path) for path in self.run_paths]
+        return heapq.merge(*runs, key=get_key)
+
+    def _sort_chunks(self):
+        with open(self.csv_path, 'r') as csv:
+            self.fields = parse_csv_line(csv.readline())
+            header_size = csv.tell()
+
+        jobs = [
+            (self.csv_path, start, end, os.path.join(self.run_dir, f'{i}.run'))
+            for i, (start, end) in enumerate(self._chunk_ranges(header_size))
+        ]
+        if len(jobs) > 1 and self.workers > 1:
+            # spawned rather than forked, as the importing process may have threads (e.g. a server's)
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = list(pool.map(_sort_chunk, jobs))
+        else:
+            results = [_sort_chunk(job) for job in jobs]
+
+        self.column_width_counts = [Counter() for _ in self.fields] # {width: number of values}
+        self.num_records = 0
+        for width_counts, num_records in results:
+            if num_records == 0:
+                continue
+            for total, counts in zip(self.column_width_counts, width_counts):
+                total.update(counts)
+            self.num_records += num_records
+        self.max_column_widths = [max(counts, default=0) for counts in self.column_width_counts]
+        self.run_paths = [job[-1] for job in jobs]
+
+    def _chunk_ranges(self, start):
+        """ splits the csv file after start into byte ranges that end on line boundaries """
+        size = os.path.getsize(self.csv_path)
+        ranges = []
+        with open(self.csv_path, 'rb') as f:
+            while start < size:
+                f.seek(min(start + self.chunk_size, size))
+                f.readline() # finish the current line
+                end = min(f.tell(), size)
+                ranges.append((start, end))
+                start = end
+        return ranges
+
+
+def _sort_chunk(job):
+    """ parses byte range [start, end) of a csv file, writes its records sorted by key to run_path.
+        returns the number of values of each width in each column, and the number of records in the range
+    """
+    csv_path, start, end, run_path = job
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).decode().split('\n')
+
+    records = [parse_csv_line(line) for line in lines if line.strip()]
+    records.sort(key=get_key)
+
+    width_counts = [Counter(map(len, column)) for column in zip(*records)]
+    with open(run_path, 'w', buffering=WRITE_BUFFER_SIZE) as run:
+        for record in records:
+            run.write(','.join(record))
+            run.write('\n')
+
+    return width_counts, len(records)
+
+def _read_run(path):
+    with open(path, 'r', buffering=WRITE_BUFFER_SIZE) as run:
+        for line in run:
+            yield parse_csv_line(line)
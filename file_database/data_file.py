@@ -1,7 +1,28 @@
 import os
+import mmap
+import math
+import time
+import weakref
 from .util import *
+from .rw_lock import FileReadWriteLock
+from .key_index import KeyIndex
+from .field_index import FieldIndex
+from .bloom_filter import BloomFilter
+from .occupancy import OccupancyMap
+from .csv_import import SortedCsv, WRITE_BUFFER_SIZE
+from .page_cache import PageCache
+from .overflow import OverflowHeap
+from .snapshot import Snapshot
+from .stats import Stats
+from .wal import WriteAheadLog
+from .record_format import make_record_format, MIN_SPILL_WIDTH
 import shutil
 
+try:
+    import fcntl
+except ImportError: # not available on windows. databases are then not locked against other processes
+    fcntl = None
+
 """ NOTE
     this does not handle files with commas or newlines in values
     illegal characters: , \n
@@ -9,31 +30,173 @@ import shutil
 
 class DataFile:
     """ class that manages a data file. this provides a python list-like interface """
-    def __init__(self, data_path, config_path):
+
+    DEFAULT_FILL_FACTOR = 0.5 # one blank line per record
+    DEFAULT_MAX_DENSITY = 0.75
+    LEAF_WINDOW = 16 # size of the smallest window redistributed by insert_and_rebalance
+    READ_BLOCK_SIZE = 256 * 1024 # bytes read at a time by scan
+    CACHE_PAGE_SIZE = 4096
+    DEFAULT_CACHE_BYTES = 8 * 1024 * 1024
+    CHECKPOINT_BYTES = 16 * 1024 * 1024 # size of the write-ahead log that triggers a checkpoint
+    WRITE_THROUGH_LINES = 4096 # writes of more lines go straight to the data file, not through self.dirty
+    DEFAULT_FALSE_POSITIVE_RATE = 0.01 # of the bloom filter over primary keys
+
+    def __init__(self, data_path, config_path, use_mmap=True, cache_bytes=DEFAULT_CACHE_BYTES):
         self.data_path = data_path
         self.config_path = config_path
-        
+        self.use_mmap = use_mmap
+
+        # recently read pages of slots. cache_bytes=0 disables the cache
+        self.page_cache = PageCache(cache_bytes)
+
+        # layout: fraction of slots holding records after an import or rewrite,
+        # [(low key, high key, fill factor)] for key ranges that need more slack,
+        # and the density above which the file is grown instead of rebalanced
+        self.fill_factor = self.DEFAULT_FILL_FACTOR
+        self.hot_ranges = []
+        self.max_density = self.DEFAULT_MAX_DENSITY
+
         # file to read / write from
         self.file = None
+
+        # read-only mapping of self.file. slots are served from self.view by offset
+        self.mmap = None
+        self.view = None
+
+        # sorted (primary key, slot) pairs, kept in {name}.index next to the data file
+        self.key_index = KeyIndex(os.path.splitext(data_path)[0] + '.index')
+
+        # which keys may be present, kept in {name}.bloom next to the data file. checked before the key index
+        self.false_positive_rate = self.DEFAULT_FALSE_POSITIVE_RATE
+        self.bloom_filter = None # made once the config is loaded
+
+        # field: FieldIndex of (value, primary key) for fields passed to create_index
+        self.field_indexes = {}
+
+        # values too long for their slot in variable-length fields, kept in {name}.overflow next to the
+        # data file. only opened if the record format has such fields
+        self.overflow = OverflowHeap(os.path.splitext(data_path)[0] + '.overflow')
+
+        # which slots hold records, kept in {name}.occupancy next to the data file
+        self.occupancy = OccupancyMap(os.path.splitext(data_path)[0] + '.occupancy')
+
+        # writes go to {name}.wal and self.dirty (slot: line), and reach the data file at checkpoints
+        self.wal = WriteAheadLog(os.path.splitext(data_path)[0] + '.wal')
+        self.dirty = {}
+
+        # threads hold lock.read() to read and lock.write() to change the data file, its indexes
+        # or its layout. generation counts replacements of the data file, which move every record,
+        # and moves counts rebalances, which move the records of a window in place
+        self.lock = FileReadWriteLock()
+        self.generation = 0
+        self.moves = 0
+
+        # {name}.lock is locked exclusively by the process writing the data file for as long as it
+        # has it open, so there is one writer at a time. lock also locks {name}.rwlock around its
+        # sections: shared around the reads of processes that opened the data file read only, and
+        # exclusively around the writer's writes. read_only is set by open
+        self.lock_path = os.path.splitext(data_path)[0] + '.lock'
+        self.lock_file = None
+        self.sections_lock_path = os.path.splitext(data_path)[0] + '.rwlock'
+        self.read_only = False
+
+        # (log header, offset) of the write-ahead log as far as a read only data file has replayed
+        # it. the reader catches up with the lines the writer logs since, see _catch_up
+        self.log_read = None
+
+        # keys changed since a compaction started copying the file, None if none is running
+        self.changed_keys = None
+
+        # snapshots reading this file, which keep the lines a checkpoint overwrites
+        self.snapshots = weakref.WeakSet()
+
+        # counters and timers of the work done, see Database.stats
+        self.stats = Stats()
         
         try:
             self._load_config()
             self.initialized = True
         except FileNotFoundError:
             self.initialized = False
+        self.bloom_filter = self._make_bloom_filter()
 
     def __getitem__(self, index):
-        self._seek_to(index)
-        return self._parse(self.file.readline())
+        if self.page_cache.budget == 0:
+            return self._parse_line(self._read_line(index))
+
+        if not self._is_valid_index(index):
+            raise IndexError()
+
+        page_number, offset = divmod(index, self.page_lines)
+        page = self.page_cache.get(page_number)
+        if page is None:
+            start = page_number * self.page_lines
+            end = min(start + self.page_lines, len(self))
+            page = self.page_cache.put(page_number, bytes(self._read_lines(start, end)))
+
+        if offset not in page.records:
+            line = page.raw[offset * self.line_size:(offset + 1) * self.line_size]
+            page.records[offset] = self._parse_line(line)
+
+        record = page.records[offset]
+        return None if record is None else record.copy() # callers may modify the record
 
     def __setitem__(self, index, record):
-        """ writes a record in the data file at specified location (or current location if index is None) """
-        self._seek_to(index)
+        """ writes a record in the data file at slot index. raises IndexError if there is no such slot """
+        if not self._is_valid_index(index):
+            raise IndexError()
         # make sure field sizes are legal
         if not self._fields_correct_length(record):
             raise InvalidRecordSizeError()
 
-        self.file.write(self._format(record))
+        key = get_key(record)
+        old_record = self[index]
+        if self.has_key(key) and (old_record is None or get_key(old_record) != key):
+            raise DuplicatePrimaryKeyError()
+
+        self._write_lines(index, self._format(record))
+        if old_record is not None:
+            self.key_index.remove(get_key(old_record))
+            self._note_change(get_key(old_record))
+            self._unindex_fields(old_record)
+        self.key_index.add(key, index)
+        self._add_to_bloom_filter(key)
+        self.occupancy.set(index)
+        self._note_change(key)
+        self._index_fields(record)
+
+    def find_slot(self, key):
+        """ returns the slot of the record with primary key key. raises RecordNotFoundError.
+            the bloom filter answers most misses without searching the key index
+        """
+        if key not in self.bloom_filter:
+            self.stats.count('bloom_filter_negatives')
+            raise RecordNotFoundError()
+        try:
+            return self.key_index.find(key)
+        except RecordNotFoundError:
+            self.stats.count('bloom_filter_false_positives')
+            raise
+
+    def has_key(self, key):
+        """ returns True if a record has primary key key, checking the bloom filter first like find_slot """
+        if key not in self.bloom_filter:
+            self.stats.count('bloom_filter_negatives')
+            return False
+        if key in self.key_index:
+            return True
+        self.stats.count('bloom_filter_false_positives')
+        return False
+
+    def __delitem__(self, index):
+        """ blanks out the record at index """
+        old_record = self[index]
+        self._write_lines(index, self.BLANK_RECORD)
+        if old_record is not None:
+            self.key_index.remove(get_key(old_record))
+            self._note_change(get_key(old_record))
+            self._unindex_fields(old_record)
+        self.occupancy.clear(index)
 
     def __len__(self):
         return self.num_records
@@ -54,133 +217,597 @@ class DataFile:
     def num_fields(self):
         return len(self.fields)
 
-    def open(self):
-        self.file = open(self.data_path, 'r+')
-        self._seek_to(0)
+    def open(self, read_only=False):
+        """ opens the data file for reading and writing, or only for reading if read_only is True.
+            any number of processes can read it while one process writes it. raises
+            DatabaseLockedError if read_only is False and another process has it open for writing
+        """
+        self.read_only = read_only
+        self._lock_file()
+        self.lock.lock_file(self.sections_lock_path, shared=read_only)
+        with self.lock.read() if read_only else self.lock.write():
+            self._load()
+        if read_only:
+            self.lock.stale = self._writer_changes
+            self.lock.catch_up = self._catch_up
+
+    def _load(self):
+        """ opens the files, replays the write-ahead log and loads or rebuilds the indexes """
+        self._open_file()
+        self._open_overflow(self.record_format)
+        self.wal.open(self.read_only)
+        self._recover()
+        self.page_cache.clear()
+
+        # lines replayed into self.dirty by a read only open are not in the sidecars, although
+        # the data file, and so its fingerprint, is unchanged. they are rebuilt in memory then
+        stale = bool(self.dirty) # read only closes do not save them
+        fingerprint = file_fingerprint(self.data_path)
+        if stale or not self.key_index.load(fingerprint):
+            self.key_index.rebuild(self)
+        if stale or not self.occupancy.load(fingerprint, self.num_records):
+            self.occupancy.reset(self.num_records, self.key_index.slots)
+        if stale or not self.bloom_filter.load(fingerprint):
+            self.bloom_filter.reset(self.key_index.keys)
+        for field_index in self.field_indexes.values():
+            if stale or not field_index.load(fingerprint):
+                field_index.rebuild(self)
 
     def is_open(self):
         return self.file is not None
 
+    def attach(self, dirty):
+        """ opens the data file for reading on behalf of the process that has it open, e.g. in a
+            worker of its process pool, without locking it or loading its indexes. dirty is that
+            process's self.dirty, and it must not write the data file until this one is closed
+        """
+        self.read_only = True
+        self._open_file()
+        self._open_overflow(self.record_format)
+        self.num_records = os.path.getsize(self.data_path) // self.line_size
+        self.dirty = dirty
+
     def close(self):
-        self.file.close()
-        self.file = None
+        self.lock.unlock_file()
+        if self.read_only:
+            self._close_file()
+            self.overflow.close()
+            self.wal.close()
+            self._unlock_file()
+            return
 
-    def insert_and_rewrite(self, record_to_insert):
-        """ rewrite the entire file, inserting the record, and leaving blank lines between entries """
-        key = get_key(record_to_insert)
-        inserted = False
-        num_records = 0
+        self.checkpoint()
+        self._close_file()
+        self.overflow.close()
+        self.wal.close()
+        self._unlock_file()
+        fingerprint = file_fingerprint(self.data_path)
+        self.key_index.save(fingerprint)
+        self.occupancy.save(fingerprint)
+        self.bloom_filter.save(fingerprint)
+        for field_index in self.field_indexes.values():
+            field_index.save(fingerprint)
 
-        self._seek_to(0)
-        tmp_path = self.data_path + '.tmp'
-        with open(tmp_path, 'w') as f:
-            f.write(self.BLANK_RECORD)
-            num_records += 1
-            for i in range(self.num_records):
-                record = self[i]
+    def commit(self, sync=False):
+        """ ends a mutation, syncing the write-ahead log at once if sync is True. returns the
+            number of the mutation, to pass to wait_durable once the lock is released
+        """
+        if sync:
+            self.wal.sync()
+            mutation = 0
+        else:
+            mutation = self.wal.commit()
+
+        if self.wal.num_bytes >= self.CHECKPOINT_BYTES:
+            self.checkpoint()
+        return mutation
+
+    def wait_durable(self, mutation):
+        """ blocks until the mutation numbered mutation by commit is durable, fsyncing the log
+            for its group unless another writer already is
+        """
+        self.wal.wait(mutation)
+
+    def checkpoint(self):
+        """ writes the lines logged since the last checkpoint into the data file and empties the log """
+        self.wal.sync()
+
+        with self.stats.timed('checkpoint'):
+            slots = sorted(self.dirty)
+            for snapshot in list(self.snapshots):
+                snapshot.preserve(slots)
+
+            # write runs of consecutive slots with one write each
+            run_start = 0
+            for i in range(1, len(slots) + 1):
+                if i == len(slots) or slots[i] != slots[i - 1] + 1:
+                    self.file.seek(slots[run_start] * self.line_size)
+                    self.file.write(b''.join(self.dirty[slot] for slot in slots[run_start:i]))
+                    run_start = i
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.stats.count('bytes_written', len(slots) * self.line_size)
+
+        self.wal.reset(os.fstat(self.file.fileno()).st_ino)
+        self.dirty.clear()
+
+    def snapshot(self):
+        """ returns a Snapshot of the data file as it is now. hold self.lock while calling """
+        snapshot = Snapshot(self)
+        self.snapshots.add(snapshot)
+        return snapshot
+
+    def scan(self, start=0, end=None, generation=None):
+        """ yields index, record of every nonblank slot in [start, end).
+            slots are read in blocks of whole lines aligned to multiples of the block size,
+            and only nonblank lines are decoded. scans bypass the page cache so they do not evict hot pages.
+            raises DataFileReplacedError if the data file is replaced, or records are moved by a rebalance,
+            after generation, the (generation, moves) read with start and end. None means when the first block is read
+        """
+        for block_start, block, first, last in self._read_blocks(start, end, generation):
+            blank = 0
+            for i in range(first, last):
+                offset = (i - block_start) * self.line_size
+                record = self._parse_line(block[offset:offset + self.line_size])
                 if record is not None:
-                    if get_key(record) > key and not inserted:
-                        f.write(self._format(record_to_insert))
-                        f.write(self.BLANK_RECORD)
-                        inserted = True
-                        num_records += 2
-
-                    f.write(self._format(record))
-                    f.write(self.BLANK_RECORD)
-                    num_records += 2
-            
-            # insert at end
-            if not inserted:
-                f.write(self._format(record_to_insert))
-                f.write(self.BLANK_RECORD)
-                num_records += 2
+                    yield i, record
+                else:
+                    blank += 1
+            self.stats.count('blank_slots_skipped', blank)
 
-        shutil.move(tmp_path, self.data_path)
-        self.close()
-        self.open() # update self.file
-        self.num_records = num_records
+    def select(self, query, start=0, end=None, generation=None):
+        """ yields index, key, selected fields of every record in [start, end) that matches query,
+            a Query compiled for this file's record format. blank slots are skipped with one
+            comparison each, and only matching records have their selected fields decoded.
+            raises DataFileReplacedError like scan
+        """
+        blank_line = self.BLANK_RECORD
+        line_size = self.line_size
+        match, project, key = query.match, query.project, query.key
+        for block_start, block, first, last in self._read_blocks(start, end, generation):
+            block = bytes(block)
+            blank = 0
+            for i in range(first, last):
+                offset = (i - block_start) * line_size
+                line = block[offset:offset + line_size]
+                if line == blank_line:
+                    blank += 1
+                elif match(line):
+                    yield i, key(line), project(line)
+            self.stats.count('blank_slots_skipped', blank)
+
+    def create_index(self, field):
+        """ builds and keeps a FieldIndex of field, which is maintained from then on """
+        assert field in self.fields
+        if field in self.field_indexes:
+            return
+
+        field_index = self._make_field_index(field)
+        field_index.rebuild(self)
+        self.field_indexes[field] = field_index
         self._save_config()
 
-    def import_data(self, name, csv_path):
-        """ imports data from a csv file into the data file """
+    def configure_layout(self, fill_factor=None, hot_ranges=None, max_density=None):
+        """ changes the layout used by import_data, insert_and_rewrite and insert_and_rebalance.
+            hot_ranges is a list of (low key, high key, fill factor), keys inclusive
+        """
+        fill_factor = self.fill_factor if fill_factor is None else fill_factor
+        hot_ranges = self.hot_ranges if hot_ranges is None else list(hot_ranges)
+        max_density = self.max_density if max_density is None else max_density
+
+        # a rewrite must leave the file below max_density, or the next insert grows it again
+        assert 0 < max_density <= 1
+        assert all(0 < f <= max_density for f in [fill_factor] + [f for _, _, f in hot_ranges])
+
+        self.fill_factor = fill_factor
+        self.hot_ranges = hot_ranges
+        self.max_density = max_density
+        if self.initialized:
+            self._save_config()
+
+    def configure_bloom_filter(self, false_positive_rate):
+        """ sets the false positive rate of the bloom filter over primary keys, rebuilding it if the file is open """
+        self.false_positive_rate = false_positive_rate
+        self.bloom_filter = self._make_bloom_filter()
+        if self.is_open():
+            self.bloom_filter.reset(self.key_index.keys)
+        if self.initialized:
+            self._save_config()
+
+    def insert_and_rebalance(self, record_to_insert):
+        """ inserts a record that has no free slot between its neighbours by evenly
+            redistributing the smallest surrounding window whose density stays under its
+            threshold. thresholds fall from 1 for the smallest windows to self.max_density
+            for the whole file (as in a packed memory array). if the whole file is too dense,
+            it is grown with insert_and_rewrite
+        """
+        if not self._fields_correct_length(record_to_insert):
+            raise InvalidRecordSizeError()
+
+        key = get_key(record_to_insert)
+        if self.has_key(key):
+            raise DuplicatePrimaryKeyError()
+
+        # any slot next to the record's future neighbours identifies the windows it belongs to
+        position = self.key_index.position(key)
+        if position > 0:
+            anchor = self.key_index.slots[position - 1]
+        elif position < len(self.key_index):
+            anchor = self.key_index.slots[position]
+        else:
+            anchor = self.MAX_INDEX // 2
+
+        height = max(math.ceil(math.log2(max(len(self) / self.LEAF_WINDOW, 1))), 1)
+        size = self.LEAF_WINDOW
+        for level in range(height + 1):
+            start = (anchor // size) * size
+            end = min(start + size, len(self))
+            if level == height:
+                start, end = 0, len(self)
+
+            threshold = 1 - (1 - self.max_density) * level / height
+            if self.occupancy.count(start, end) + 1 <= threshold * (end - start):
+                with self.stats.timed('rebalance'):
+                    return self._redistribute(start, end, record_to_insert)
+            size *= 2
+
+        self.insert_and_rewrite(record_to_insert)
+
+    def insert_many(self, records):
+        """ inserts a batch of records in one sequential pass.
+            records land in the free slots between their neighbours when every run of new
+            records fits its gap; otherwise the batch is merged in with a single rewrite.
+            returns a list with one entry per record: None if it was inserted, or the
+            DuplicatePrimaryKeyError or InvalidRecordSizeError that kept it out
+        """
+        results = [None] * len(records)
+        batch = {} # key: record, for the records that can be inserted
+        for i, record in enumerate(records):
+            key = get_key(record)
+            if not self._fields_correct_length(record):
+                results[i] = InvalidRecordSizeError()
+            elif key in batch or self.has_key(key):
+                results[i] = DuplicatePrimaryKeyError()
+            else:
+                batch[key] = record
+
+        # group new records by the gap between existing records they fall into
+        gaps = {} # key_index position: sorted records
+        for key in sorted(batch):
+            gaps.setdefault(self.key_index.position(key), []).append(batch[key])
+
+        placements = [] # (slot, record)
+        for position, gap_records in gaps.items():
+            low = self.key_index.slots[position - 1] if position > 0 else -1
+            high = self.key_index.slots[position] if position < len(self.key_index) else len(self)
+            free = high - low - 1
+            if free < len(gap_records):
+                self.insert_and_rewrite(*[batch[key] for key in sorted(batch)])
+                return results
+
+            for j, record in enumerate(gap_records):
+                placements.append((low + 1 + (2*j + 1) * free // (2 * len(gap_records)), record))
+
+        for slot, record in placements:
+            self._write_lines(slot, self._format(record))
+
+        self.key_index.add_many([(get_key(record), slot) for slot, record in placements])
+        for slot, record in placements:
+            self._add_to_bloom_filter(get_key(record))
+            self.occupancy.set(slot)
+            self._note_change(get_key(record))
+            self._index_fields(record)
+        return results
+
+    def convert_format(self, schema):
+        """ rewrites the data file in the format described by schema: {field: width} for text,
+            or {field: type} for binary (see BinaryFormat).
+            raises InvalidRecordSizeError, leaving the file unchanged, if a record does not fit
+        """
+        assert list(schema) == self.fields
+        self._rewrite((record for _, record in self.scan()), make_record_format(schema))
+
+        # values are compared differently in the new format
+        for field in self.field_indexes:
+            self.field_indexes[field] = self._make_field_index(field)
+            self.field_indexes[field].rebuild(self)
+
+    def insert_and_rewrite(self, *records_to_insert):
+        """ rewrite the entire file, inserting the records (sorted by key), and leaving blank
+            lines between entries according to the fill factor of their keys
+        """
+        def records():
+            j = 0
+            for _, record in self.scan():
+                while j < len(records_to_insert) and get_key(records_to_insert[j]) < get_key(record):
+                    yield records_to_insert[j]
+                    j += 1
+                yield record
+
+            # insert at end
+            yield from records_to_insert[j:]
+
+        self._rewrite(records(), self.record_format)
+        for record in records_to_insert:
+            self._index_fields(record)
+
+    def import_records(self, name, records, record_format):
+        """ lays out sorted records in record_format as a new data file, like import_data.
+            set the layout and bloom filter beforehand with configure_layout and configure_bloom_filter
+        """
         assert not self.initialized
 
         self.name = name
+        self.num_records = 0 # set once the data is laid out
+        self._set_record_format(record_format)
+        self._save_config()
+        self._open_overflow(self.record_format, truncate=True)
+        with open(self.data_path, 'wb', buffering=WRITE_BUFFER_SIZE) as data:
+            self.num_records, _ = self._write_spread(data, records, self.record_format)
+        self._close_overflow()
+        self._save_config()
+        self.initialized = True
 
-        fields = None
-        max_column_widths = None
-        with open(csv_path, 'r') as csv:
-            # find field names and max column widths
-            num_records = 0
-            for i, line in enumerate(csv):
-                values = parse_csv_line(line)
-                if i == 0:
-                    fields = values
-                    max_column_widths = [0]*len(values)
-                else:
-                    widths = [len(x) for x in values]
-                    max_column_widths = [max(x,y) for x,y in zip(max_column_widths, widths)]
-                    num_records += 1
+    def import_data(self, name, csv_path, fill_factor=None, hot_ranges=None, workers=None, field_types=None, false_positive_rate=None, inline_fraction=None):
+        """ imports data from a csv file into the data file, sorted by key.
+            workers is the number of processes parsing the csv (default: one per cpu).
+            field_types ({field: type}) stores the data in binary, see BinaryFormat.
+            false_positive_rate is that of the bloom filter over primary keys.
+            inline_fraction (e.g. 0.99) sizes text fields for that fraction of their values
+            rather than the longest, making fields variable-length where that is narrower
+        """
+        assert not self.initialized
 
-            self.num_records = num_records*2 + 1
-            self.field_to_length = {f: w for f, w in zip(fields, max_column_widths)}
+        self.name = name
+        self.configure_layout(fill_factor, hot_ranges)
+        if false_positive_rate is not None:
+            self.configure_bloom_filter(false_positive_rate)
+
+        with SortedCsv(csv_path, os.path.dirname(self.data_path), workers) as csv:
+            self.num_records = 0 # set once the data is laid out
+            if field_types is not None:
+                self._set_record_format(make_record_format({f: field_types[f] for f in csv.fields}))
+            elif inline_fraction is not None:
+                self._set_record_format(make_record_format(_inline_widths(csv, inline_fraction)))
+            else:
+                self._set_record_format(make_record_format(dict(zip(csv.fields, csv.max_column_widths))))
             self._save_config()
-            self._load_config()
 
             # write data from csv file to data file
-            csv.seek(0)
-            with open(self.data_path, 'w') as data:
-                data.write(self.BLANK_RECORD)
-                for i, line in enumerate(csv):
-                    if i != 0:
-                        data.write(self._format(parse_csv_line(line)))
-                        data.write(self.BLANK_RECORD)
+            self._open_overflow(self.record_format, truncate=True)
+            try:
+                with open(self.data_path, 'wb', buffering=WRITE_BUFFER_SIZE) as data:
+                    self.num_records, _ = self._write_spread(data, csv.records(), self.record_format)
+            except InvalidRecordSizeError:
+                self._close_overflow()
+                for path in [self.data_path, self.config_path, self.overflow.path]:
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            self._close_overflow()
 
+        self._save_config()
         self.initialized = True
 
 
-    def _parse(self, line):
-        """ returns list of fields from line in database data file. removes newline at end """
-        try:
-            values = []
-            i = 0
-            for length in self.field_to_length.values():
-                values.append(line[i:i+length].strip())
-                i+=length
-            assert not all(x == '' for x in values)
-        except (AssertionError, IndexError):
-            return None
-        else:
-            return values
+    def _rewrite(self, records, record_format):
+        """ replaces the data file with sorted records laid out by fill factor in record_format """
+        self._open_overflow(record_format)
+        record_format = record_format.with_overflow(self.overflow)
+        tmp_path = self.data_path + '.tmp'
+        with self.stats.timed('rewrite'):
+            try:
+                with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                    num_records, index_pairs = self._write_spread(f, records, record_format)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except InvalidRecordSizeError:
+                os.remove(tmp_path)
+                raise
 
-    def _format(self, record):
-        """ values is a list of strings to store
-            widths is a list of int length of each field
-            returns a string that is padded with the correct field widths
+            self._replace_file(tmp_path, num_records, index_pairs, record_format)
+        self.stats.count('bytes_written', num_records * record_format.line_size)
+
+    def _replace_file(self, tmp_path, num_records, index_pairs, record_format):
+        """ replaces the data file with tmp_path, a file already synced to disk that holds
+            num_records lines in record_format and the records in index_pairs
+        """
+        self.overflow.sync() # the new file may refer to values appended while laying it out
+        shutil.move(tmp_path, self.data_path)
+        self.generation += 1
+        self.snapshots = weakref.WeakSet() # they keep reading the old file, which is no longer written
+        self.page_cache.clear()
+        self._set_record_format(record_format)
+        self.num_records = num_records
+        self._close_file()
+        self._open_file() # update self.file and remap the new file
+
+        # the new file holds every logged write, and the log's inode no longer matches it
+        self.wal.reset(os.fstat(self.file.fileno()).st_ino)
+        self.dirty.clear()
+        self.key_index.reset(index_pairs)
+        self.occupancy.reset(num_records, self.key_index.slots)
+        self.bloom_filter.reset(self.key_index.keys)
+        self._save_config()
+
+    def _redistribute(self, start, end, record_to_insert):
+        """ rewrites slots [start, end) in place with their records and record_to_insert evenly spaced """
+        records = [record for _, record in self.scan(start, end)]
+
+        key = get_key(record_to_insert)
+        position = sum(1 for record in records if get_key(record) < key)
+        records.insert(position, record_to_insert)
+
+        size = end - start
+        lines = [self.BLANK_RECORD] * size
+        index_pairs = []
+        for j, record in enumerate(records):
+            slot = (2*j + 1) * size // (2 * len(records)) # centre of the record's share
+            lines[slot] = self._format(record)
+            index_pairs.append((get_key(record), start + slot))
+
+        self._write_lines(start, b''.join(lines))
+        self.moves += 1
+        self._note_change(key)
+        self._index_fields(record_to_insert)
+        self.key_index.add(key, start)
+        self.key_index.move(index_pairs)
+        self._add_to_bloom_filter(key)
+        self.occupancy.clear_range(start, end)
+        for _, slot in index_pairs:
+            self.occupancy.set(slot)
+
+    def _write_spread(self, f, records, record_format):
+        """ writes sorted records to f in record_format, leaving blank lines between them
+            according to the fill factor of each record's key.
+            returns the number of lines written and the (key, slot) of every record.
+            raises InvalidRecordSizeError if a record does not fit record_format
         """
+        index_pairs = []
+        num_lines = 0
+        position = 0.0
+        for record in records:
+            key = get_key(record)
+            share = 1 / self._fill_factor(key) # slots per record
+            slot = int(position + share / 2)
+            if not record_format.fits(record):
+                raise InvalidRecordSizeError()
+            f.write(record_format.blank * (slot - num_lines))
+            f.write(record_format.format(record))
+            index_pairs.append((key, slot))
+            num_lines = slot + 1
+            position += share
 
-        return ''.join([pad(x, l) for x, l in zip(record, self.field_to_length.values())]) + '\n'
+        total_lines = max(math.ceil(position), 1)
+        f.write(record_format.blank * (total_lines - num_lines))
+        return total_lines, index_pairs
+
+    def _read_blocks(self, start, end, generation=None):
+        """ yields (first slot of the block, raw lines of the block, first slot, end slot) for
+            blocks of whole lines aligned to multiples of the block size, the slots being those
+            of the block in [start, end). the last block stops at end. raises DataFileReplacedError if the data file is
+            replaced, or records are moved by a rebalance, after generation (see scan)
+        """
+        end = len(self) if end is None else min(end, len(self))
+        block_lines = max(self.READ_BLOCK_SIZE // self.line_size, 1)
+
+        block_start = (start // block_lines) * block_lines
+        while block_start < end:
+            with self.lock.read():
+                if generation is None:
+                    generation = self.generation, self.moves
+                if (self.generation, self.moves) != generation:
+                    raise DataFileReplacedError()
+                block_end = min(block_start + block_lines, end, len(self))
+                block = self._read_lines(block_start, block_end)
+            yield block_start, block, max(start, block_start), block_end
+            block_start = block_end
+
+    def _open_overflow(self, record_format, truncate=False):
+        """ opens the overflow heap if record_format has variable-length fields and it is not open yet.
+            truncate empties it, for a new data file
+        """
+        if record_format.spill_fields and not self.overflow.is_open():
+            self.overflow.open(self.read_only, truncate)
+
+    def _close_overflow(self):
+        self.overflow.sync()
+        self.overflow.close()
+
+    def _add_to_bloom_filter(self, key):
+        self.bloom_filter.add(key)
+        if self.bloom_filter.is_full():
+            self.bloom_filter.reset(self.key_index.keys)
+
+    def _make_bloom_filter(self):
+        return BloomFilter(os.path.splitext(self.data_path)[0] + '.bloom', self.false_positive_rate)
+
+    def _note_change(self, key):
+        if self.changed_keys is not None:
+            self.changed_keys.add(key)
+
+    def _index_fields(self, record):
+        for field_index in self.field_indexes.values():
+            field_index.add(record)
+
+    def _unindex_fields(self, record):
+        for field_index in self.field_indexes.values():
+            field_index.remove(record)
+
+    def _make_field_index(self, field):
+        path = os.path.splitext(self.data_path)[0] + f'.{field}.index'
+        return FieldIndex(path, self.fields.index(field), self.record_format.sort_value)
+
+    def _fill_factor(self, key):
+        for low, high, fill_factor in self.hot_ranges:
+            if low <= key <= high:
+                return fill_factor
+        return self.fill_factor
+
+    def _parse_line(self, line):
+        """ returns record stored in raw line, or None if it is blank. decodes nonblank lines only """
+        if line == self.BLANK_RECORD:
+            return None
+        return self.record_format.parse(line)
+
+    def _format(self, record):
+        """ returns bytes of record in the data file's format """
+        return self.record_format.format(record)
 
     def _load_config(self):
         """ reads config file and initializes
-                self.field_to_length
+                self.record_format (see _set_record_format)
                 self.name
                 self.num_records
-                self.line_size
-                self.BLANK_RECORD
+                self.fill_factor, self.max_density, self.false_positive_rate, self.hot_ranges (if stored)
+                self.field_indexes (if stored, not loaded until open)
         """
         with open(self.config_path, 'r') as f:
             self.name = f.readline().strip()
             self.num_records = int(f.readline().strip())
-            field_lengths = f.readline().strip().split(",")
+            field_specs = f.readline().strip().split(",")
+
+            schema = {}  # dict of {field:length} for text or {field:type} for binary
+            for field_spec in field_specs:
+                field, spec = field_spec.split(':')
+                schema[field] = int(spec) if spec.isdigit() else spec
+
+            # layout lines were added later, so older configs may not have them
+            layout = f.readline().strip()
+            if layout:
+                settings = dict(setting.split(':') for setting in layout.split(','))
+                self.fill_factor = float(settings['fill_factor'])
+                self.max_density = float(settings['max_density'])
+                self.false_positive_rate = float(settings.get('false_positive_rate', self.false_positive_rate))
 
-            self.field_to_length = {}  # dict of {field:length}
-            for field_length in field_lengths:
-                field, length = field_length.split(':')
-                self.field_to_length[field] = int(length)
+            hot_ranges = f.readline().strip()
+            if hot_ranges:
+                self.hot_ranges = []
+                for hot_range in hot_ranges.split(','):
+                    low, high, fill_factor = hot_range.split(':')
+                    self.hot_ranges.append((int(low), int(high), float(fill_factor)))
 
-        self.line_size = sum(x for x in self.field_to_length.values()) + 1 # newline
-        self.BLANK_RECORD = self._format(['']*self.num_fields)
+            indexed_fields = f.readline().strip()
+
+        self._set_record_format(make_record_format(schema))
+        if indexed_fields:
+            for field in indexed_fields.split(','):
+                self.field_indexes[field] = self._make_field_index(field)
+
+    def _set_record_format(self, record_format):
+        """ initializes
+                self.record_format
+                self.field_to_length (display widths for binary formats)
+                self.line_size
+                self.BLANK_RECORD
+                self.page_lines
+            the record format spills long values into self.overflow
+        """
+        self.record_format = record_format.with_overflow(self.overflow)
+        self.field_to_length = record_format.field_to_length
+        self.line_size = record_format.line_size
+        self.BLANK_RECORD = record_format.blank
+        self.page_lines = max(self.CACHE_PAGE_SIZE // self.line_size, 1)
 
     def _save_config(self):
         """ stores configuration in self.config_path """
@@ -189,17 +816,258 @@ class DataFile:
             config.write('\n')
             config.write(str(self.num_records))
             config.write('\n')
+            config.write(self.record_format.schema())
+            config.write('\n')
+            config.write(f'fill_factor:{self.fill_factor},max_density:{self.max_density},false_positive_rate:{self.false_positive_rate}')
+            config.write('\n')
             config.write(','.join([
-                f'{f}:{w}' for f, w in self.field_to_length.items()
+                f'{low}:{high}:{f}' for low, high, f in self.hot_ranges
             ]))
+            config.write('\n')
+            config.write(','.join(self.field_indexes))
+
+    def _recover(self):
+        """ replays lines logged before a crash into the data file, then empties the log.
+            when read only, the lines are replayed into self.dirty instead
+        """
+        inode = os.fstat(self.file.fileno()).st_ino
+        entries, log_end = self.wal.entries(inode)
+        if self.read_only:
+            for slot, payload in entries:
+                for i in range(len(payload) // self.line_size):
+                    self.dirty[slot + i] = payload[i * self.line_size:(i + 1) * self.line_size]
+            self.num_records = os.path.getsize(self.data_path) // self.line_size
+            self.log_read = self.wal.header(), log_end
+            return
+
+        for slot, payload in entries:
+            self.file.seek(slot * self.line_size)
+            self.file.write(payload)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.wal.reset(inode)
+
+        # a crash between replacing the data file and saving the config leaves num_records stale
+        self.num_records = os.path.getsize(self.data_path) // self.line_size
+
+    def _writer_changes(self):
+        """ returns what the process writing the data file has changed since a read only data file
+            last read the write-ahead log: 'replaced' if it has replaced or checkpointed the data
+            file, 'logged' if it has only logged lines, or None
+        """
+        if self.wal.file is None:
+            return 'replaced' if os.path.exists(self.wal.path) else None
+        header, offset = self.log_read
+        if os.stat(self.data_path).st_ino != os.fstat(self.file.fileno()).st_ino or self.wal.header() != header:
+            return 'replaced'
+        return 'logged' if header is not None and self.wal.size() > offset else None
+
+    def _catch_up(self):
+        """ brings a read only data file up to date with the process writing it. called with
+            self.lock held for writing, and {name}.rwlock shared, so the writer waits meanwhile
+        """
+        changes = self._writer_changes()
+        if changes == 'replaced':
+            # lines not read yet may have been checkpointed into any slot, so everything is reloaded
+            self._close_file()
+            self.overflow.close()
+            self.wal.close()
+            self.dirty.clear()
+            self.field_indexes = {}
+            self._load_config()
+            self.bloom_filter = self._make_bloom_filter()
+            self._load()
+            self.generation += 1
+        elif changes == 'logged':
+            header, offset = self.log_read
+            entries, offset = self.wal.entries(header[0], offset)
+            for slot, payload in entries:
+                self._replay_lines(slot, payload)
+            self.log_read = header, offset
+            self.moves += 1
+
+    def _replay_lines(self, index, data):
+        """ puts lines logged by the process writing the data file, starting at slot index, into
+            self.dirty, and updates the indexes of a read only data file to match
+        """
+        end = index + len(data) // self.line_size
+        old_data = bytes(self._read_lines(index, end))
+        removed = {} # key: record no longer at its slot
+        added = {} # key: (slot, record) at a new slot
+        for i in range(index, end):
+            offset = (i - index) * self.line_size
+            line = data[offset:offset + self.line_size]
+            old_line = old_data[offset:offset + self.line_size]
+            if line == old_line:
+                continue
+            self.dirty[i] = line
+            old_record, record = self._parse_line(old_line), self._parse_line(line)
+            if old_record is not None:
+                removed[get_key(old_record)] = old_record
+            if record is None:
+                self.occupancy.clear(i)
+            else:
+                added[get_key(record)] = i, record
+                self.occupancy.set(i)
+
+        moved = []
+        for key, old_record in removed.items():
+            if key in added and added[key][1] == old_record: # moved by a rebalance
+                moved.append((key, added.pop(key)[0]))
+            else:
+                self.key_index.remove(key)
+                self._unindex_fields(old_record)
+        self.key_index.move(sorted(moved))
+        for key, (i, record) in added.items():
+            self.key_index.add(key, i)
+            self._add_to_bloom_filter(key)
+            self._index_fields(record)
+        self.page_cache.invalidate(index // self.page_lines, (end - 1) // self.page_lines + 1)
+
+    def _open_file(self):
+        self.file = open(self.data_path, 'rb' if self.read_only else 'r+b')
+        self._map()
+
+    def _lock_file(self):
+        """ locks {name}.lock exclusively unless read only. raises DatabaseLockedError """
+        if fcntl is None or self.read_only:
+            return
+        self.lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._unlock_file()
+            raise DatabaseLockedError()
+
+    def _unlock_file(self):
+        if self.lock_file is not None:
+            self.lock_file.close() # releases the lock
+            self.lock_file = None
+
+    def _close_file(self):
+        self._unmap()
+        self.file.close()
+        self.file = None
 
-    def _seek_to(self, line_num):
-        if not self._is_valid_index(line_num):
+    def _map(self):
+        """ maps self.file into memory if mmap reads are enabled """
+        if not self.use_mmap or os.path.getsize(self.data_path) == 0:
+            return
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+    def _unmap(self):
+        if self.mmap is None:
+            return
+        self.view.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass # a scan still holds a block of this mapping. it is unmapped when the block is released
+        self.view = None
+        self.mmap = None
+
+    def _read_line(self, index):
+        """ returns the raw bytes stored in slot index, without decoding them """
+        return self._read_lines(index, index + 1)
+
+    def _read_lines(self, start, end):
+        """ returns the raw bytes stored in slots [start, end), without decoding them """
+        if not (self._is_valid_index(start) and self._is_valid_index(end - 1)):
             raise IndexError()
-        self.file.seek(line_num * self.line_size)
+
+        started = time.perf_counter_ns()
+        if self.view is None:
+            # positional read, so concurrent readers do not share the file position
+            block = memoryview(os.pread(self.file.fileno(), (end - start) * self.line_size, start * self.line_size))
+        else:
+            block = self.view[start * self.line_size:end * self.line_size]
+
+        if self.dirty:
+            block = self._overlay_dirty(start, end, block)
+
+        self.stats.add_time('read', time.perf_counter_ns() - started)
+        self.stats.count('slots_read', end - start)
+        self.stats.count('bytes_read', len(block))
+        return block
+
+    def _overlay_dirty(self, start, end, block):
+        """ returns block of slots [start, end) with the lines written since the last checkpoint """
+        if end - start <= len(self.dirty):
+            slots = [i for i in range(start, end) if i in self.dirty]
+        else:
+            slots = [i for i in self.dirty if start <= i < end]
+        if not slots:
+            return block
+
+        block = bytearray(block)
+        for i in slots:
+            offset = (i - start) * self.line_size
+            block[offset:offset + self.line_size] = self.dirty[i]
+        return memoryview(block)
+
+    def _write_lines(self, index, data):
+        """ writes one or more consecutive lines starting at slot index.
+            the lines are logged and kept in self.dirty until the next checkpoint, unless there
+            are more than WRITE_THROUGH_LINES of them (see _write_through)
+        """
+        end = index + len(data) // self.line_size
+        if not (self._is_valid_index(index) and self._is_valid_index(end - 1)):
+            raise IndexError()
+
+        self.overflow.sync() # values the lines refer to must be durable before the lines are
+        self.stats.count('slots_written', end - index)
+        self.stats.count('bytes_logged', len(data))
+        if end - index > self.WRITE_THROUGH_LINES:
+            self._write_through(index, data)
+        else:
+            self.wal.append(index, data)
+            for i in range(index, end):
+                offset = (i - index) * self.line_size
+                self.dirty[i] = data[offset:offset + self.line_size]
+
+        self.page_cache.invalidate(index // self.page_lines, (end - 1) // self.page_lines + 1)
+
+    def _write_through(self, index, data):
+        """ writes lines starting at slot index into the data file at once, so that a large
+            rebalance is neither held in self.dirty nor left in the log until the next checkpoint.
+            the log is checkpointed first and only holds the lines while they are written, so a
+            crash part way through the write is repaired by replaying it
+        """
+        self.checkpoint()
+        self.wal.append(index, data)
+        self.wal.sync()
+
+        for snapshot in list(self.snapshots):
+            snapshot.preserve(list(range(index, index + len(data) // self.line_size)))
+        self.file.seek(index * self.line_size)
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.stats.count('bytes_written', len(data))
+
+        self.wal.reset(os.fstat(self.file.fileno()).st_ino)
 
     def _is_valid_index(self, index):
         return index >= 0 and index < len(self)
 
     def _fields_correct_length(self, record):
-        return all(l >= len(v) for l, v in zip(self.field_to_length.values(), record))
+        return self.record_format.fits(record)
+
+
+def _inline_widths(csv, inline_fraction):
+    """ returns the text schema of csv with each field as wide as inline_fraction of its values
+        need, made variable-length if that is narrower than its longest value. the primary key
+        keeps its full width
+    """
+    schema = {}
+    for i, (field, counts) in enumerate(zip(csv.fields, csv.column_width_counts)):
+        width = max_width = max(counts, default=0)
+        covered = 0
+        for w in sorted(counts):
+            covered += counts[w]
+            if covered >= inline_fraction * csv.num_records:
+                width = max(w, MIN_SPILL_WIDTH)
+                break
+        schema[field] = f'{width}+' if i > 0 and width < max_width else max_width
+    return schema
@@ -1,12 +1,17 @@
 import os
 from .util import *
 from .data_file import DataFile
+from .compaction import Compactor
+from .stats import operation
+from .analytics import Analytics
+from .query import Query
 
 class Database:
     """ class that manages data using a directory """
     def __init__(self, data_dir):
         self.dir = data_dir
         makedir(self.dir)
+        self.compactor = None
         self._init_datafile()
 
     @property
@@ -25,96 +30,370 @@ class Database:
         return self.data_file.num_fields
     
 
-    def open(self):
+    def open(self, read_only=False):
+        """ opens the database for reading and writing, or only for reading if read_only is True.
+            any number of processes can read a database while one process writes it, and
+            readers see each of the writer's changes from their next read after it. raises
+            DatabaseLockedError if read_only is False and another process has it open for writing
+        """
         assert not self.is_open()
-        self.data_file.open()
+        self.data_file.open(read_only)
 
     def is_open(self):
         return self.data_file.is_open()
 
     def close(self):
         assert self.is_open()
-        self.data_file.close()
-
-
-    def import_data(self, name, csv_path):
+        if self.compactor is not None:
+            self.compactor.cancel()
+        with self.data_file.lock.write():
+            self.data_file.close()
+
+
+    @operation('import_data')
+    def import_data(self, name, csv_path, fill_factor=None, hot_ranges=None, field_types=None, false_positive_rate=None, inline_fraction=None):
+        """ fill_factor and hot_ranges set the layout, see DataFile.configure_layout.
+            field_types ({field: type}) stores the data in binary, see BinaryFormat.
+            false_positive_rate is that of the bloom filter over primary keys (default 0.01).
+            inline_fraction (e.g. 0.99) sizes text fields for that fraction of their values
+            instead of the longest one, storing longer values in an overflow file, see TextFormat
+        """
         assert self.data_file == None
         config_path = os.path.join(self.dir, f'{name}.config')
         data_path = os.path.join(self.dir, f'{name}.data')
         self.data_file = DataFile(data_path, config_path)
-        self.data_file.import_data(name, csv_path)
+        self.data_file.import_data(name, csv_path, fill_factor, hot_ranges, field_types=field_types, false_positive_rate=false_positive_rate, inline_fraction=inline_fraction)
+
+    @operation('convert_format')
+    def convert_format(self, schema):
+        """ converts the data file to text ({field: width}) or binary ({field: type}) records """
+        self._assert_writable()
+        with self.data_file.lock.write():
+            self.data_file.convert_format(schema)
+
+    def compact(self, background=True, io_budget=None, step_records=Compactor.DEFAULT_STEP_RECORDS):
+        """ reclaims blank slots and restores the configured fill factors while the database
+            stays open. io_budget limits the copy to that many bytes per second.
+            returns the Compactor, which reports reclaimed_bytes once it is done
+        """
+        self._assert_writable()
+        if self.compactor is not None and self.compactor.is_running():
+            return self.compactor
+
+        self.compactor = Compactor(self.data_file, io_budget, step_records)
+        if background:
+            self.compactor.start()
+        else:
+            self.compactor.run()
+        return self.compactor
+
+    def widen_field(self, field, width, background=True, io_budget=None, step_records=Compactor.DEFAULT_STEP_RECORDS):
+        """ makes field width wide (the width of its inline values if it is variable-length, see
+            TextFormat) while the database stays open, by copying the records into the wider
+            layout the way compact does. values that now fit are moved inline.
+            returns the Compactor, whose completed is False if a rewrite of the data file
+            interrupted it. raises InvalidInputError if the field would get narrower
+        """
+        self._assert_writable()
+        with self.data_file.lock.read():
+            record_format = self.data_file.record_format.widen(field, width)
+        if self.compactor is not None:
+            self.compactor.join()
+
+        self.compactor = Compactor(self.data_file, io_budget, step_records, record_format)
+        if background:
+            self.compactor.start()
+        else:
+            self.compactor.run()
+        return self.compactor
 
+    @operation('find')
     def find(self, primary_key):
         """ returns index, record of record with primary_key
             raises RecordNotFoundError if record not found
         """
         assert self.is_open()
-
-        # check end values
-        endpoints = [0, len(self.data_file)-1]
-        for point in endpoints:
-            try:
-                index, key, record = self._get_nonblank_record(point)
-            except RecordNotFoundError:
-                pass
-            else:
-                if key == primary_key:
-                    return index, record
-
-        return self._binary_find(primary_key, endpoints[0], endpoints[1])
+        with self.data_file.lock.read():
+            index = self.data_file.find_slot(primary_key)
+            return index, self.data_file[index]
+
+    @operation('create_index')
+    def create_index(self, field):
+        """ builds a persistent index of field, used by find_by and find_range """
+        self._assert_writable()
+        with self.data_file.lock.write():
+            self.data_file.create_index(field)
+
+    @operation('find_by')
+    def find_by(self, field, value):
+        """ returns [(index, record)] of records whose field equals value, in key order.
+            uses the index of field if there is one, otherwise scans the data file.
+            raises InvalidInputError if value does not have the field's type
+        """
+        assert self.is_open()
+        with self.data_file.lock.read():
+            field_index = self.data_file.field_indexes.get(field)
+            if field_index is not None:
+                return self._find_keys(field_index.find(value))
+
+            field_number = self.fields.index(field)
+            sort_value = self.data_file.record_format.sort_value
+            value = sort_value(field_number, value)
+            return [(i, record) for i, record in self.data_file.scan() if sort_value(field_number, record[field_number]) == value]
+
+    @operation('find_range')
+    def find_range(self, field, low=None, high=None):
+        """ returns [(index, record)] of records with low <= field <= high, in field order.
+            None means no bound. uses the index of field if there is one, otherwise scans the data file.
+            raises InvalidInputError if a bound does not have the field's type
+        """
+        assert self.is_open()
+        with self.data_file.lock.read():
+            field_index = self.data_file.field_indexes.get(field)
+            if field_index is not None:
+                return self._find_keys(field_index.find_range(low, high))
+
+            field_number = self.fields.index(field)
+            sort_value = self.data_file.record_format.sort_value
+            low = None if low is None else sort_value(field_number, low)
+            high = None if high is None else sort_value(field_number, high)
+            matches = []
+            for i, record in self.data_file.scan():
+                value = sort_value(field_number, record[field_number])
+                if (low is None or low <= value) and (high is None or value <= high):
+                    matches.append((value, get_key(record), i, record))
+            return [(i, record) for _, _, i, record in sorted(matches)]
+
+    def analytics(self):
+        """ returns an Analytics of the records, for vectorized filters and aggregates. needs numpy """
+        assert self.is_open()
+        return Analytics(self.data_file)
 
     def find_first_n_records(self, n):
         assert self.is_open()
-        records = []
-        for i in range(len(self.data_file)):
-            record = self.data_file[i]
+        return list(self.scan(limit=n))
 
-            if record is not None:
-                records.append(record)
+    def scan(self, start_key=None, end_key=None, limit=None):
+        """ yields records with start_key <= key <= end_key in key order, at most limit of them.
+            None means no bound. records are read lazily in large sequential blocks
+        """
+        assert self.is_open()
+        key_index = self.data_file.key_index
+        count = 0
+
+        while limit != count:
+            with self.data_file.lock.read():
+                first = 0 if start_key is None else key_index.position(start_key)
+                last = len(key_index) if end_key is None else key_index.position_after(end_key)
+                if first >= last:
+                    return
+                # read no further than the slot of the last record wanted
+                bounded = limit is not None and first + limit - count < last
+                if bounded:
+                    last = first + limit - count
+                    next_key = key_index.keys[last - 1] + 1
+                start = key_index.slots[first]
+                end = key_index.slots[last - 1] + 1
+                generation = self.data_file.generation, self.data_file.moves
 
-            if len(records) == n:
-                return records
+            try:
+                for _, record in self.data_file.scan(start, end, generation):
+                    key = get_key(record)
+                    if (start_key is not None and key < start_key) or (end_key is not None and key > end_key):
+                        continue # not in the range. only if the generation check missed a move
+                    yield record
+                    count += 1
+                    start_key = key + 1
+                    if count == limit:
+                        return
+                if not bounded:
+                    return
+                start_key = next_key # records were deleted meanwhile. continue after the range
+            except DataFileReplacedError:
+                pass # slots moved. continue after the last key returned
+
+    def select(self, fields=None, where=None, start_key=None, end_key=None, limit=None):
+        """ yields the values of fields (None for all of them) of the records with
+            start_key <= key <= end_key that satisfy every (field, op, value) of where, in key
+            order, at most limit of them, e.g.
+                database.select(['id', 'city'], where=[('score', '>=', 500), ('city', '!=', 'city7')])
+            predicates are tested on the raw bytes of each slot, so only the selected fields of
+            matching records are decoded. see Query for how values are compared.
+            raises InvalidInputError for unknown fields or operators
+        """
+        assert self.is_open()
+        with self.data_file.lock.read():
+            query = Query(self.data_file.record_format, fields, where)
+        return self._select(query, fields, where, start_key, end_key, limit)
+
+    @operation('export')
+    def export(self, path, export_format='text', start_key=None, end_key=None):
+        """ writes the records with start_key <= key <= end_key (None means no bound) to path
+            in export_format: text, csv or jsonl. returns the number of records written.
+            the records are read from a snapshot, so writes during the export neither wait for it nor show in it
+        """
+        with self.snapshot() as snapshot:
+            return snapshot.export(path, export_format, start_key, end_key)
 
-    def update(self, index, record, field, new_value):
-        """ each record is a list of values with equal length to fields """
+    def snapshot(self):
+        """ returns a read-only Snapshot of the records as they are now, which later writes,
+            rewrites and compactions do not change. close it when done
+        """
         assert self.is_open()
+        with self.data_file.lock.read():
+            return self.data_file.snapshot()
+
+    @operation('update')
+    def update(self, index, record, field, new_value):
+        """ each record is a list of values with equal length to fields.
+            raises InvalidInputError if field is the primary key, which would leave the record
+            out of key order
+        """
+        self._assert_writable()
+        if field == self.fields[0]:
+            raise InvalidInputError('cannot update the primary key')
         
         new_record = record.copy()
         field_index = self.data_file.fields.index(field)
         new_record[field_index] = new_value
-        self.data_file[index] = new_record
-
-    def delete(self, index):
-        """  """
-        assert self.is_open()
-        self.data_file[index] = self.data_file.BLANK_RECORD # write blank line
+        with self.data_file.lock.write():
+            self.data_file[self._current_index(index, record)] = new_record
+            mutation = self.data_file.commit()
+        self.data_file.wait_durable(mutation)
+
+    @operation('delete')
+    def delete(self, index, record=None):
+        """ deletes the record at index. pass the record found at index to make sure the
+            same record is deleted if a compaction has moved it since
+        """
+        self._assert_writable()
+        with self.data_file.lock.write():
+            if record is not None:
+                index = self._current_index(index, record)
+            del self.data_file[index] # write blank line
+            mutation = self.data_file.commit()
+        self.data_file.wait_durable(mutation)
 
+    @operation('insert')
     def insert(self, record):
         """ each record is a list of values with equal length to fields """
-        assert self.is_open()
-
+        self._assert_writable()
+        with self.data_file.lock.write():
+            self._insert(record)
+            mutation = self.data_file.commit()
+        self.data_file.wait_durable(mutation) # outside the lock, so other writers join the group
+
+    @operation('insert_many')
+    def insert_many(self, records):
+        """ inserts a batch of records with at most one rewrite of the data file.
+            returns a list with one entry per record: None if it was inserted, or the
+            DuplicatePrimaryKeyError or InvalidRecordSizeError that kept it out
+        """
+        self._assert_writable()
+        with self.data_file.lock.write():
+            results = self.data_file.insert_many(records)
+            mutation = self.data_file.commit()
+        self.data_file.wait_durable(mutation)
+        return results
+
+    def stats(self, reset=False):
+        """ returns the work done by the data file since the database was loaded, or since the last reset:
+                counters    slots_read, bytes_read, slots_written, bytes_logged (to the write-ahead log),
+                            bytes_written (to the data file), blank_slots_skipped,
+                            bloom_filter_negatives, bloom_filter_false_positives, compactions,
+                            and page_cache_hits, page_cache_misses, page_cache_evictions
+                timers      {'calls', 'seconds'} of reads, checkpoints, rewrites, rebalances and each operation
+            reset starts the counts again
+        """
+        if self.data_file is None:
+            return {'counters': {}, 'timers': {}}
+
+        stats = self.data_file.stats.snapshot()
+        page_cache = self.data_file.page_cache
+        stats['counters'].update(page_cache_hits=page_cache.hits, page_cache_misses=page_cache.misses, page_cache_evictions=page_cache.evictions)
+        if reset:
+            self.data_file.stats.reset()
+            page_cache.hits = page_cache.misses = page_cache.evictions = 0
+        return stats
+
+    @operation('sync')
+    def sync(self):
+        """ makes every mutation so far durable. each mutation already is once it returns """
+        self._assert_writable()
+        with self.data_file.lock.write():
+            self.data_file.commit(sync=True)
+
+
+    def _insert(self, record):
+        """ inserts record without committing it """
         key = get_key(record)
-
-        # check if record should be inserted at start or end of the file
-        first_index, first_key, _ = self._get_nonblank_record(self.data_file.MIN_INDEX)
-        last_index, last_key, _ = self._get_last_nonblank_record()
-        
-        if key in [first_key, last_key]:
+        if self.data_file.has_key(key):
             raise DuplicatePrimaryKeyError()
-        
-        if key < first_key:
+
+        # the neighbouring keys in the key index bound the gap the record belongs in
+        key_index = self.data_file.key_index
+        if len(key_index) == 0:
+            return self._insert_at(self.data_file.MAX_INDEX // 2, record)
+
+        position = key_index.position(key)
+        if position == 0:
             return self._insert_at(self.data_file.MIN_INDEX, record)
-        
-        if key > last_key:
+
+        if position == len(key_index):
             return self._insert_at(self.data_file.MAX_INDEX, record)
 
-        try:
-            index = self._binary_insert(key, first_index, last_index)
-        except NoSpaceToInsertError:
-            self.data_file.insert_and_rewrite(record)
+        start_index, end_index = key_index.slots[position - 1], key_index.slots[position]
+        if end_index > start_index + 1:
+            self.data_file[(start_index + end_index) // 2] = record
         else:
-            self.data_file[index] = record
+            self.data_file.insert_and_rebalance(record) # no blank slot between the neighbours
+
 
+    def _select(self, query, fields, where, start_key, end_key, limit):
+        key_index = self.data_file.key_index
+        count = 0
+
+        while limit != count:
+            with self.data_file.lock.read():
+                first = 0 if start_key is None else key_index.position(start_key)
+                last = len(key_index) if end_key is None else key_index.position_after(end_key)
+                if first >= last:
+                    return
+                start = key_index.slots[first]
+                end = key_index.slots[last - 1] + 1
+                generation = self.data_file.generation, self.data_file.moves
+                if query.record_format is not self.data_file.record_format: # converted since
+                    query = Query(self.data_file.record_format, fields, where)
+
+            try:
+                for _, key, values in self.data_file.select(query, start, end, generation):
+                    if (start_key is not None and key < start_key) or (end_key is not None and key > end_key):
+                        continue # not in the range. only if the generation check missed a move
+                    yield values
+                    count += 1
+                    start_key = key + 1
+                    if count == limit:
+                        return
+                return
+            except DataFileReplacedError:
+                pass # slots moved. continue after the last key returned
+
+    def _assert_writable(self):
+        assert self.is_open() and not self.data_file.read_only
+
+    def _find_keys(self, keys):
+        """ returns [(index, record)] of the records with primary keys keys """
+        indexes = [self.data_file.key_index.find(key) for key in keys]
+        return [(i, self.data_file[i]) for i in indexes]
+
+    def _current_index(self, index, record):
+        """ returns the index of record, which was at index before any rewrite or compaction since """
+        key = get_key(record)
+        if 0 <= index < len(self.data_file): # a compaction may have shrunk the file below index
+            current = self.data_file[index]
+            if current is not None and get_key(current) == key:
+                return index
+        return self.data_file.key_index.find(key)
 
     def _init_datafile(self):
         try:
@@ -124,61 +403,6 @@ class Database:
         else:
             self.data_file = DataFile(data_path, config_path)
 
-    def _binary_find(self, key, start_index, end_index):
-        """ start and end indices not inclusive """
-
-        mid = (end_index + start_index) // 2
-
-        if mid == start_index: # endpoints already checked, so key does not exist
-            raise RecordNotFoundError()
-        
-        index, record_key, record = self._get_nonblank_record(mid)
-
-        if record_key == key:
-            return index, record
-        elif record_key > key:
-            return self._binary_find(key, start_index, mid)
-        else:
-            return self._binary_find(key, mid, end_index)
-
-    def _binary_insert(self, key, start_index, end_index):
-        """ return index for which to store key in database.
-            start and end indices are guaranteed to contain records with keys unequal to given key
-        """
-
-        if end_index == start_index + 1:
-            # endpoints already checked, so no room to insert
-            raise NoSpaceToInsertError()
-
-        mid = (end_index + start_index) // 2
-        index, record_key, record = self._get_nonblank_record(mid)
-        # print(start_index, mid, index, end_index, key, record_key)
-
-        if index == end_index: # no records between mid and end_index
-            record = None
-
-            # check all records between start_index and mid in reverse order
-            for i in range(mid-1, start_index, -1):
-                record = self.data_file[i]
-                if record is not None:
-                    record_key = get_key(record)
-                    index = i
-            
-            if record is None:
-                return mid # no records between start and end indices
-
-        if record_key == key:
-            raise DuplicatePrimaryKeyError()
-            # try to find empty space before or after
-            # for i in [index-1, index+1]:
-            #     if self.data_file[i] is None:
-            #         return i
-            # raise NoSpaceToInsertError()
-        elif record_key > key:
-            return self._binary_insert(key, start_index, index)
-        else:
-            return self._binary_insert(key, index, end_index)
-
     def _find_data_files(self):
         """ attempts to find data and config files in self.dir """
         data_path = None
@@ -200,27 +424,10 @@ class Database:
         config_path = os.path.join(self.dir, config_path)
         return data_path, config_path
 
-    def _get_nonblank_record(self, index):
-        """ returns index, key, and record of first nonblank record at or after index """
-        for i in range(index, len(self.data_file)):
-            record = self.data_file[i]
-            if record is not None:
-                return i, get_key(record), record
-            
-        raise RecordNotFoundError()
-
-    def _get_last_nonblank_record(self):
-        """ returns index, key, and record of first last nonblank entry in database """
-        for i in range(len(self.data_file) - 1, -1, -1):
-            record = self.data_file[i]
-            if record is not None:
-                return i, get_key(record), record
-
-        raise RecordNotFoundError()
-
     def _insert_at(self, index, record):
-        """ tries to insert a record at index, rewriting the data_file if necessary """
+        """ tries to insert a record at index, rebalancing the data_file if necessary """
         if self.data_file[index] is None:
             self.data_file[index] = record
         else:
-            self.data_file.insert_and_rewrite(record)
\ No newline at end of file
+            self.data_file.insert_and_rebalance(record)
+
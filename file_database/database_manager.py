@@ -1,15 +1,26 @@
 import os
+import json
 from .util import *
 from .database import Database
 
 class DatabaseManager:
-    """ a class for managing multiple database instances """
+    """ a class for managing multiple database instances.
+
+        the databases in data_dir are listed in data_dir/catalog.json with their directory
+        and schema, so startup does not have to look inside every database directory.
+        Database objects are only built when a database is first used
+    """
+    CATALOG_FILE = 'catalog.json'
+    CATALOG_VERSION = 1
 
     def __init__(self, data_dir):
         self.data_dir = data_dir
         makedir(data_dir)
         self.current_database = None
-        self.databases = self.init_databases() # list of Database objects
+        self.catalog_path = os.path.join(data_dir, self.CATALOG_FILE)
+        self.catalog = {} # name: {'dir': directory name, 'schema': schema of its data file}
+        self.databases = {} # name: Database, for the databases used so far
+        self.load_catalog()
 
     def create_database(self, database_name, csv_path):
         if database_name in self.available_databases():
@@ -21,33 +32,95 @@ class DatabaseManager:
         database_dir = os.path.join(self.data_dir, database_name)
         database = Database(database_dir)
         database.import_data(database_name, csv_path)
-        self.databases.append(database)
+        self._add_to_catalog(database_name, database)
+        self._save_catalog()
 
 
     def open_database(self, name):
-        options = [d for d in self.databases if d.name == name]
-        assert len(options) == 1
-        self.current_database = options[0]
-        self.current_database.open()
+        database = self.get_database(name)
+        database.open() # raises DatabaseLockedError if another process is using it
+        self.current_database = database
 
 
     def close_database(self):
         self.current_database.close()
+        self.update_catalog(self.current_database.name)
         self.current_database = None
 
 
-    def init_databases(self):
-        output = []
-        for dir_name in os.listdir(self.data_dir):
-            path = os.path.join(self.data_dir, dir_name)
-            if os.path.isdir(path):
-                output.append(Database(path))
+    def get_database(self, name):
+        """ returns the Database called name, building it on first use. raises DatabaseNotFoundError """
+        if name not in self.databases:
+            if name not in self.catalog:
+                raise DatabaseNotFoundError(name)
+            self.databases[name] = Database(os.path.join(self.data_dir, self.catalog[name]['dir']))
+        return self.databases[name]
+
+    def load_catalog(self):
+        """ loads the catalog, bringing it up to date if directories were added or removed since it was saved.
+            the catalog is rewritten in place, so saving it does not change the directory's modification time
+        """
+        try:
+            with open(self.catalog_path, 'r') as f:
+                saved = json.load(f)
+            assert saved['version'] == self.CATALOG_VERSION
+        except (FileNotFoundError, ValueError, KeyError, AssertionError): # missing, torn or old catalog
+            saved = {'dir_mtime_ns': None, 'databases': {}}
+
+        self.catalog = saved['databases']
+        if saved['dir_mtime_ns'] != os.stat(self.data_dir).st_mtime_ns:
+            self.refresh_catalog()
+
+    def update_catalog(self, name):
+        """ records the current schema of database name, which convert_format may have changed """
+        database = self.databases[name]
+        if database.data_file is not None and database.data_file.record_format.schema() != self.schema(name):
+            self._add_to_catalog(name, database)
+            self._save_catalog()
+
+    def refresh_catalog(self):
+        """ adds databases whose directories are not in the catalog and drops those whose directories are gone.
+            only new directories are looked into
+        """
+        dir_names = set(entry.name for entry in os.scandir(self.data_dir) if entry.is_dir())
+        self.catalog = {name: entry for name, entry in self.catalog.items() if entry['dir'] in dir_names}
 
-        return output
+        known_dirs = set(entry['dir'] for entry in self.catalog.values())
+        for dir_name in sorted(dir_names - known_dirs):
+            database = Database(os.path.join(self.data_dir, dir_name))
+            self._add_to_catalog(database.name, database)
+        self._save_catalog()
 
 
     def database_is_open(self):
         return self.current_database != None
 
     def available_databases(self):
-        return [x.name for x in self.databases]
\ No newline at end of file
+        return sorted(self.catalog)
+
+    def schema(self, name):
+        """ returns the schema of database name as stored in its config file, without opening it """
+        return self.catalog[name]['schema']
+
+
+    def _add_to_catalog(self, name, database):
+        data_file = database.data_file
+        self.catalog[name] = {
+            'dir': os.path.basename(database.dir),
+            'schema': '' if data_file is None else data_file.record_format.schema(),
+        }
+        self.databases[name] = database
+
+    def _save_catalog(self):
+        # create the file first, so the modification time saved is the one after creating it
+        if not os.path.exists(self.catalog_path):
+            open(self.catalog_path, 'w').close()
+
+        catalog = {
+            'version': self.CATALOG_VERSION,
+            'dir_mtime_ns': os.stat(self.data_dir).st_mtime_ns,
+            'databases': self.catalog,
+        }
+        with open(self.catalog_path, 'r+') as f:
+            json.dump(catalog, f)
+            f.truncate()
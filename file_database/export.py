@@ -0,0 +1,48 @@
+import json
+from .csv_import import WRITE_BUFFER_SIZE
+from .util import *
+
+REPORT_SPACING = 2 # spaces between columns of a text report
+FORMATS = ['text', 'csv', 'jsonl']
+EXTENSIONS = {'text': 'txt', 'csv': 'csv', 'jsonl': 'jsonl'}
+
+def export_records(path, fields, field_to_length, records, export_format='text'):
+    """ writes records to path as
+            text    a report with aligned columns, sized from field_to_length
+            csv     a header line and comma-separated values, as import_data reads them
+            jsonl   one JSON object per line
+        records may be any iterable, e.g. Database.scan(); it is consumed lazily, through a
+        large write buffer, so memory use does not depend on the number of records.
+        returns the number of records written
+    """
+    if export_format not in FORMATS:
+        raise InvalidInputError(f'unknown export format {export_format}')
+
+    count = 0
+    def counted(records):
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    with open(path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        if export_format == 'text':
+            f.writelines(report_lines(fields, report_widths(fields, field_to_length), counted(records)))
+        elif export_format == 'csv':
+            f.write(','.join(fields) + '\n')
+            f.writelines(','.join(record) + '\n' for record in counted(records))
+        else:
+            f.writelines(json.dumps(dict(zip(fields, record))) + '\n' for record in counted(records))
+    return count
+
+def report_widths(fields, field_to_length):
+    """ returns the column widths of a text report: each field's stored width (or its name, if
+        longer) plus spacing. no pass over the records is needed
+    """
+    return [max(field_to_length[field], len(field)) + REPORT_SPACING for field in fields]
+
+def report_lines(fields, widths, records):
+    """ yields the lines of a text report: a header, then one line per record """
+    yield ''.join([pad(field, width) for field, width in zip(fields, widths)]) + '\n'
+    for record in records:
+        yield ''.join([pad(value, width) for value, width in zip(record, widths)]) + '\n'
@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from .util import *
+
+class FieldIndex:
+    """ sorted (value, primary key) pairs for one field of a data file.
+        entries do not hold slots, so rewrites and rebalancing that only move records leave
+        the index untouched, and lookups go through the key index to reach the records.
+        persisted next to the data file as {name}.{field}.index
+
+        values are compared in the form record_format.sort_value returns them: numbers for
+        int64 and float64 fields, and strings otherwise
+    """
+    def __init__(self, path, field_number, sort_value):
+        self.path = path
+        self.field_number = field_number
+        self.sort_value = sort_value # (field number, value) -> comparable value
+        self.entries = [] # sorted (value, primary key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def value_of(self, record):
+        return self.sort_value(self.field_number, record[self.field_number])
+
+    def find(self, value):
+        """ returns primary keys of records whose field equals value, in key order """
+        value = self.sort_value(self.field_number, value)
+        return self._keys_between(value, value)
+
+    def find_range(self, low=None, high=None):
+        """ returns primary keys of records with low <= value <= high, in value order.
+            None means no bound
+        """
+        low = None if low is None else self.sort_value(self.field_number, low)
+        high = None if high is None else self.sort_value(self.field_number, high)
+        return self._keys_between(low, high)
+
+    def add(self, record):
+        insort(self.entries, (self.value_of(record), get_key(record)))
+
+    def remove(self, record):
+        entry = (self.value_of(record), get_key(record))
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def rebuild(self, data_file):
+        """ rebuilds the index by scanning every slot of data_file """
+        self.entries = sorted((self.value_of(record), get_key(record)) for _, record in data_file.scan())
+
+    def load(self, fingerprint):
+        """ loads the index from self.path. returns False if it is missing or was
+            saved for a different version of the data file
+        """
+        try:
+            saved_fingerprint, keys, values = load_arrays(self.path, 'q', 'q', 'B')
+        except (FileNotFoundError, EOFError):
+            return False
+
+        # values are stored as text, one per line. values cannot contain newlines
+        values = values.tobytes().decode().split('\n') if len(keys) > 0 else []
+        if list(saved_fingerprint) != fingerprint or len(keys) != len(values):
+            return False
+
+        self.entries = [(self.sort_value(self.field_number, value), key) for value, key in zip(values, keys)]
+        return True
+
+    def save(self, fingerprint):
+        values = '\n'.join([repr(value) if isinstance(value, float) else str(value) for value, _ in self.entries])
+        save_arrays(
+            self.path,
+            array('q', fingerprint),
+            array('q', [key for _, key in self.entries]),
+            array('B', values.encode())
+        )
+
+    def _keys_between(self, low, high):
+        # (value,) sorts before and (value, inf) after every entry with that value
+        first = 0 if low is None else bisect_left(self.entries, (low,))
+        last = len(self.entries) if high is None else bisect_right(self.entries, (high, float('inf')))
+        return [key for _, key in self.entries[first:last]]
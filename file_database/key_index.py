@@ -0,0 +1,88 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from .util import *
+
+class KeyIndex:
+    """ sorted in-memory array of (primary key, slot) pairs for a data file.
+        persisted next to the data file so it does not have to be rebuilt on every open
+    """
+    def __init__(self, path):
+        self.path = path
+        self.keys = array('q')  # sorted primary keys
+        self.slots = array('q') # slots[i] is the data file slot of keys[i]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def find(self, key):
+        """ returns slot of record with key. raises RecordNotFoundError if key is not indexed """
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.slots[i]
+        raise RecordNotFoundError()
+
+    def position(self, key):
+        """ returns number of indexed keys less than key """
+        return bisect_left(self.keys, key)
+
+    def position_after(self, key):
+        """ returns number of indexed keys less than or equal to key """
+        return bisect_right(self.keys, key)
+
+    def add(self, key, slot):
+        """ raises DuplicatePrimaryKeyError if key is already indexed """
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            raise DuplicatePrimaryKeyError()
+        self.keys.insert(i, key)
+        self.slots.insert(i, slot)
+
+    def add_many(self, pairs):
+        """ adds (key, slot) pairs whose keys are not indexed yet in one merge """
+        self.reset(sorted(list(zip(self.keys, self.slots)) + pairs))
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            del self.slots[i]
+
+    def move(self, pairs):
+        """ updates the slots of already indexed keys. pairs is a list of (key, new slot) sorted by key """
+        i = 0
+        for key, slot in pairs:
+            i = bisect_left(self.keys, key, i)
+            self.slots[i] = slot
+
+    def rebuild(self, data_file):
+        """ rebuilds the index by scanning every slot of data_file """
+        pairs = [(get_key(record), i) for i, record in data_file.scan()]
+        self.reset(sorted(pairs))
+
+    def reset(self, pairs):
+        """ replaces the index with pairs, a list of (key, slot) sorted by key """
+        self.keys = array('q', [key for key, _ in pairs])
+        self.slots = array('q', [slot for _, slot in pairs])
+
+    def load(self, fingerprint):
+        """ loads the index from self.path. returns False if it is missing or was
+            saved for a different version of the data file
+        """
+        try:
+            saved_fingerprint, keys, slots = load_arrays(self.path, 'q', 'q', 'q')
+        except (FileNotFoundError, EOFError):
+            return False
+
+        if list(saved_fingerprint) != fingerprint or len(keys) != len(slots):
+            return False
+
+        self.keys = keys
+        self.slots = slots
+        return True
+
+    def save(self, fingerprint):
+        save_arrays(self.path, array('q', fingerprint), self.keys, self.slots)
@@ -0,0 +1,54 @@
+from array import array
+from .util import *
+
+class OccupancyMap:
+    """ one byte per data file slot, 1 if the slot holds a record and 0 if it is blank.
+        a byte per slot (rather than a bit) lets bytearray.count count the records of a
+        window in C without touching the data file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.slots = bytearray()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __getitem__(self, index):
+        return self.slots[index] == 1
+
+    def set(self, index):
+        self.slots[index] = 1
+
+    def clear(self, index):
+        self.slots[index] = 0
+
+    def clear_range(self, start, end):
+        self.slots[start:end] = bytes(end - start)
+
+    def count(self, start=0, end=None):
+        """ returns number of occupied slots in [start, end) """
+        return self.slots.count(1, start, len(self) if end is None else end)
+
+    def reset(self, num_slots, occupied_slots):
+        """ replaces the map with num_slots slots, of which occupied_slots hold records """
+        self.slots = bytearray(num_slots)
+        for slot in occupied_slots:
+            self.slots[slot] = 1
+
+    def load(self, fingerprint, num_slots):
+        """ loads the map from self.path. returns False if it is missing or was
+            saved for a different version of the data file
+        """
+        try:
+            saved_fingerprint, slots = load_arrays(self.path, 'q', 'B')
+        except (FileNotFoundError, EOFError):
+            return False
+
+        if list(saved_fingerprint) != fingerprint or len(slots) != num_slots:
+            return False
+
+        self.slots = bytearray(slots)
+        return True
+
+    def save(self, fingerprint):
+        save_arrays(self.path, array('q', fingerprint), array('B', self.slots))
@@ -0,0 +1,63 @@
+import os
+
+class OverflowHeap:
+    """ append-only file of the values too long to be stored in their slot, kept in {name}.overflow
+        next to the data file (see TextFormat). a record refers to such a value by its offset and
+        length in the file.
+
+        values are never overwritten or moved, so references stay valid across rewrites and
+        compactions, and a reader that holds the file can follow them however the data file
+        changes. the space of values that were updated or deleted is not reclaimed.
+        appends are synced before any line referring to them is logged or laid out
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.read_only = False
+        self.size = 0
+        self.synced_size = 0
+
+    def open(self, read_only=False, truncate=False):
+        """ opens the heap, creating it unless read_only. truncate empties it, for a new data file """
+        self.read_only = read_only
+        if read_only:
+            flags = os.O_RDONLY
+        else:
+            flags = os.O_RDWR | os.O_CREAT | (os.O_TRUNC if truncate else 0)
+        self.fd = os.open(self.path, flags, 0o644)
+        self.size = self.synced_size = os.fstat(self.fd).st_size
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def is_open(self):
+        return self.fd is not None
+
+    def reader(self):
+        """ returns a read-only heap with a descriptor of its own, which stays usable after this one is closed """
+        heap = OverflowHeap(self.path)
+        heap.read_only = True
+        if self.is_open():
+            heap.fd = os.dup(self.fd)
+            heap.size = heap.synced_size = self.size
+        return heap
+
+    def append(self, data):
+        """ stores data at the end of the heap and returns its offset. not durable until synced """
+        assert self.is_open() and not self.read_only
+        offset = self.size
+        os.pwrite(self.fd, data, offset)
+        self.size += len(data)
+        return offset
+
+    def read(self, offset, length):
+        """ returns the length bytes stored at offset """
+        return os.pread(self.fd, length, offset)
+
+    def sync(self):
+        """ makes every value appended so far durable """
+        if self.size > self.synced_size:
+            os.fsync(self.fd)
+            self.synced_size = self.size
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+class Page:
+    """ raw bytes of consecutive data file slots, and the records decoded from them so far """
+    def __init__(self, raw):
+        self.raw = raw
+        self.records = {} # slot offset within page: record or None
+
+class PageCache:
+    """ LRU cache of data file pages, bounded by budget bytes of raw page data.
+        the cache is write-through: writers invalidate the pages they touch.
+        safe to use from concurrent reader threads
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.pages = OrderedDict() # page number: Page, least recently used first
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, page_number):
+        """ returns cached Page or None """
+        with self.lock:
+            page = self.pages.get(page_number)
+            if page is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.pages.move_to_end(page_number)
+            return page
+
+    def put(self, page_number, raw):
+        """ caches raw as page page_number, evicting least recently used pages. returns the Page """
+        page = Page(raw)
+        if len(raw) > self.budget:
+            return page # too big to cache
+
+        with self.lock:
+            self._drop(page_number, page_number + 1)
+            while self.size + len(raw) > self.budget:
+                _, evicted = self.pages.popitem(last=False)
+                self.size -= len(evicted.raw)
+                self.evictions += 1
+
+            self.pages[page_number] = page
+            self.size += len(raw)
+        return page
+
+    def invalidate(self, first_page, end_page):
+        """ drops pages [first_page, end_page) """
+        with self.lock:
+            self._drop(first_page, end_page)
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.size = 0
+
+    def _drop(self, first_page, end_page):
+        if end_page - first_page > len(self.pages):
+            page_numbers = [p for p in self.pages if first_page <= p < end_page]
+        else:
+            page_numbers = [p for p in range(first_page, end_page) if p in self.pages]
+
+        for page_number in page_numbers:
+            self.size -= len(self.pages.pop(page_number).raw)
@@ -0,0 +1,153 @@
+import struct
+import operator
+from .util import *
+from .record_format import TextFormat, INT64_OFFSET, SPILL_MARKER
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<':  operator.lt,
+    '<=': operator.le,
+    '>':  operator.gt,
+    '>=': operator.ge,
+}
+
+class Query:
+    """ a projection and predicates compiled against a record format into functions of the raw
+        line of a slot, each reading only its field's bytes at the field's offset. match tests the
+        predicates on the undecoded line, and project decodes just the selected fields, so rows
+        that do not match and fields that are not selected are never decoded.
+
+        fields is the list of fields to return (None for all), and where a list of
+        (field, op, value), op being ==, !=, <, <=, > or >=, all of which a record must satisfy.
+        numeric fields, and text fields compared with an int or float value, are compared as
+        numbers, like Analytics.where; a text value that is not a number then does not match.
+        lines are bytes. raises InvalidInputError for unknown fields or operators, or a binary
+        bytes or varchar field compared with a number
+    """
+    def __init__(self, record_format, fields=None, where=None):
+        self.record_format = record_format
+        self.fields = list(record_format.field_to_length)
+        for field in (fields or []) + [field for field, _, _ in where or []]:
+            if field not in self.fields:
+                raise InvalidInputError(f'unknown field {field}')
+
+        if isinstance(record_format, TextFormat):
+            self.layout = _text_layout(record_format)
+        else:
+            self.layout = _binary_layout(record_format)
+        self.getters = [self._getter(self.fields.index(field)) for field in fields or self.fields]
+        self.tests = [self._test(self.fields.index(field), op, value) for field, op, value in where or []]
+        self.key = self._number(0)
+
+    def match(self, line):
+        """ returns True if the record in nonblank line satisfies every predicate """
+        for test in self.tests:
+            if not test(line):
+                return False
+        return True
+
+    def project(self, line):
+        """ returns the selected fields of the record in nonblank line """
+        return [get(line) for get in self.getters]
+
+
+    def _getter(self, field_number):
+        """ returns a function of a line returning the field as records hold it """
+        name, start, end = self.layout[field_number]
+        if name == 'text':
+            if field_number in self.record_format.spill_fields:
+                load = self.record_format.load
+                def get(line):
+                    value = line[start:end].decode().strip()
+                    return load(value) if value.startswith(SPILL_MARKER) else value
+                return get
+            return lambda line: line[start:end].decode().strip()
+        if name == 'int64':
+            return lambda line: str(int.from_bytes(line[start:end], 'big') - INT64_OFFSET)
+        if name == 'float64':
+            return lambda line: repr(struct.unpack('>d', line[start:end])[0])
+        if name == 'bytes':
+            return lambda line: line[start:end].rstrip(b'\0').decode()
+        return lambda line: line[start + 2:start + 2 + int.from_bytes(line[start:start + 2], 'big')].decode()
+
+    def _number(self, field_number):
+        """ returns a function of a line returning the field as a number, or None if it is not one """
+        name, start, end = self.layout[field_number]
+        if name == 'int64':
+            return lambda line: int.from_bytes(line[start:end], 'big') - INT64_OFFSET
+        if name == 'float64':
+            return lambda line: struct.unpack('>d', line[start:end])[0]
+        if name != 'text':
+            return None
+
+        def number(line):
+            raw = line[start:end] # int and float skip the padding
+            try:
+                return int(raw)
+            except ValueError:
+                try:
+                    return float(raw)
+                except ValueError:
+                    return None
+        return number
+
+    def _test(self, field_number, op, value):
+        """ returns a function of a line returning True if the field compares to value with op """
+        if op not in OPERATORS:
+            raise InvalidInputError(f'unknown operator {op}')
+        compare = OPERATORS[op]
+        name, start, end = self.layout[field_number]
+
+        if name in ['int64', 'float64'] or isinstance(value, (int, float)) or field_number == 0:
+            number = self._number(field_number)
+            if number is None:
+                raise InvalidInputError(f'{self.fields[field_number]} is not a number')
+            try:
+                value = float(value) if isinstance(value, str) else value
+            except ValueError:
+                raise InvalidInputError(f'{value} is not a number')
+            if name == 'int64' and isinstance(value, int) and -INT64_OFFSET <= value < INT64_OFFSET:
+                # stored offset big-endian, so the raw bytes order like the numbers
+                raw_value = (value + INT64_OFFSET).to_bytes(8, 'big')
+                return lambda line: compare(line[start:end], raw_value)
+            def test(line):
+                x = number(line)
+                return x is not None and compare(x, value)
+            return test
+
+        if op in ['==', '!='] and field_number not in self.record_format.spill_fields:
+            # equality of the raw bytes, without decoding
+            if name == 'text':
+                raw_value = value.strip().encode()
+                return lambda line: compare(line[start:end].strip(), raw_value)
+            if name == 'bytes':
+                raw_value = value.encode().ljust(end - start, b'\0')
+            else:
+                raw_value = len(value.encode()).to_bytes(2, 'big') + value.encode().ljust(end - start - 2, b'\0')
+            return lambda line: compare(line[start:end], raw_value)
+
+        get = self._getter(field_number)
+        return lambda line: compare(get(line), value)
+
+
+def _text_layout(record_format):
+    """ returns [('text', start, end)] of each field of a TextFormat line """
+    layout = []
+    start = 0
+    for width in record_format.lengths:
+        layout.append(('text', start, start + width))
+        start += width
+    return layout
+
+def _binary_layout(record_format):
+    """ returns [(type name, start, end)] of each field of a BinaryFormat line. a varchar's range
+        starts with its 2-byte length
+    """
+    layout = []
+    start = 1 # status byte
+    for name, n in record_format.types:
+        size = {'int64': 8, 'float64': 8, 'varchar': n + 2}.get(name, n)
+        layout.append((name, start, start + size))
+        start += size
+    return layout
@@ -0,0 +1,254 @@
+import re
+import struct
+from .util import *
+
+INT64_OFFSET = 2**63 # int64 fields are stored unsigned, so raw bytes sort like the numbers
+SPILL_MARKER = ',' # values cannot hold commas, so a field starting with one holds a reference to an overflow heap
+MIN_SPILL_WIDTH = 16 # room for the reference to a value in a heap of up to a few gigabytes
+
+class TextFormat:
+    """ records stored as space padded text fields followed by a newline.
+        schema is {field: width}. a width written 'n+' makes the field variable-length: values
+        of up to n characters are stored in the slot, and longer ones in overflow, an
+        OverflowHeap, the field holding the reference ',offset:length' instead. n must be at
+        least MIN_SPILL_WIDTH, and the primary key cannot be variable-length
+    """
+    def __init__(self, schema, overflow=None):
+        self.widths = dict(schema) # as in the schema
+        self.field_to_length = {f: int(str(w).rstrip('+')) for f, w in self.widths.items()}
+        self.lengths = list(self.field_to_length.values())
+        self.spill_fields = [i for i, w in enumerate(self.widths.values()) if str(w).endswith('+')] # field numbers
+        if 0 in self.spill_fields:
+            raise InvalidInputError('the primary key cannot be variable-length')
+        if any(self.lengths[i] < MIN_SPILL_WIDTH for i in self.spill_fields):
+            raise InvalidInputError(f'variable-length fields must be at least {MIN_SPILL_WIDTH} wide')
+
+        self.overflow = overflow
+        self.line_size = sum(self.lengths) + 1 # newline
+        self.blank = self.format([''] * len(self.field_to_length))
+
+    def format(self, record):
+        """ returns bytes of record padded with the correct field widths, spilling long values into overflow """
+        if self.spill_fields:
+            record = list(record)
+            for i in self.spill_fields:
+                if self._spills(i, record[i]):
+                    record[i] = self._spill(record[i])
+        return (''.join([pad(x, l) for x, l in zip(record, self.lengths)]) + '\n').encode()
+
+    def parse(self, line):
+        """ returns list of fields from line in database data file. removes newline at end """
+        line = bytes(line).decode()
+        try:
+            values = []
+            i = 0
+            for length in self.lengths:
+                values.append(line[i:i+length].strip())
+                i+=length
+            assert not all(x == '' for x in values)
+        except (AssertionError, IndexError):
+            return None
+
+        for i in self.spill_fields:
+            if values[i].startswith(SPILL_MARKER):
+                values[i] = self.load(values[i])
+        return values
+
+    def fits(self, record):
+        """ returns True if every value is short enough, or can be spilled into overflow """
+        offset = 0 if self.overflow is None else self.overflow.size
+        for i, (l, v) in enumerate(zip(self.lengths, record)):
+            if i in self.spill_fields and self._spills(i, v):
+                if self.overflow is None:
+                    return False
+                offset += len(v.encode()) # an upper bound, for records spilling several values
+                if len(_reference(offset, len(v.encode()))) > l:
+                    return False
+            elif l < len(v):
+                return False
+        return True
+
+    def with_overflow(self, overflow):
+        """ returns this format spilling long values into overflow """
+        if overflow is self.overflow:
+            return self
+        return TextFormat(self.widths, overflow)
+
+    def widen(self, field, width):
+        """ returns this format with field width wide, still variable-length if it is.
+            raises InvalidInputError if the field would get narrower
+        """
+        if width < self.field_to_length[field]:
+            raise InvalidInputError(f'{field} is already {self.field_to_length[field]} wide')
+        widths = dict(self.widths)
+        widths[field] = f'{width}+' if str(widths[field]).endswith('+') else width
+        return TextFormat(widths, self.overflow)
+
+    def sort_value(self, field_number, value):
+        """ returns value as records read back hold it, for comparing values of a field """
+        return value.strip()
+
+    def schema(self):
+        """ returns the schema as stored in the config file """
+        return ','.join([f'{f}:{w}' for f, w in self.widths.items()])
+
+    def load(self, reference):
+        """ returns the value a variable-length field refers to with reference """
+        offset, length = map(int, reference[len(SPILL_MARKER):].split(':'))
+        value = SpilledValue(self.overflow.read(offset, length).decode())
+        value.overflow, value.reference = self.overflow, reference
+        return value
+
+    def _spills(self, field_number, value):
+        """ returns True if value of variable-length field field_number is stored in overflow """
+        return len(value) > self.lengths[field_number] or value.startswith(SPILL_MARKER)
+
+    def _spill(self, value):
+        """ stores value in overflow, unless it was read from there, and returns its reference """
+        if isinstance(value, SpilledValue) and value.overflow is self.overflow:
+            return value.reference
+        data = value.encode()
+        return _reference(self.overflow.append(data), len(data))
+
+
+class SpilledValue(str):
+    """ value of a variable-length field read from an overflow heap. it keeps its reference, so
+        formatting it again for the same heap, e.g. when a rewrite or compaction copies the
+        record, does not store it again
+    """
+
+
+def _reference(offset, length):
+    return f'{SPILL_MARKER}{offset}:{length}'
+
+
+class BinaryFormat:
+    """ records stored as fixed-size binary structs: a status byte (1 for a record, 0 for a
+        blank slot) followed by the fields. schema is {field: type}, with types
+            int64       stored big-endian, offset to be unsigned, so raw bytes sort like the numbers
+            float64
+            bytes(n)    exactly n bytes, padded with NUL
+            varchar(n)  up to n bytes, stored as a 2-byte length and n bytes
+        the primary key must be int64, so keys are compared directly on raw bytes
+    """
+    TYPE_PATTERN = re.compile(r'(int64|float64)|(bytes|varchar)\((\d+)\)$')
+    DISPLAY_WIDTHS = {'int64': 20, 'float64': 24}
+
+    def __init__(self, schema):
+        self.field_to_type = dict(schema)
+        self.types = [] # (type name, n)
+        struct_format = '>B'
+        self.field_to_length = {} # display widths
+        for field, field_type in self.field_to_type.items():
+            match = self.TYPE_PATTERN.match(field_type)
+            if match is None:
+                raise InvalidInputError(f'unknown field type {field_type}')
+
+            if match.group(1):
+                name, n = match.group(1), 0
+                struct_format += 'Q' if name == 'int64' else 'd'
+                self.field_to_length[field] = self.DISPLAY_WIDTHS[name]
+            else:
+                name, n = match.group(2), int(match.group(3))
+                struct_format += f'{n}s' if name == 'bytes' else f'H{n}s'
+                self.field_to_length[field] = n
+            self.types.append((name, n))
+
+        assert self.types[0][0] == 'int64', 'primary key must be int64'
+        self.spill_fields = [] # fields have fixed sizes, so values never spill
+        self.struct = struct.Struct(struct_format)
+        self.line_size = self.struct.size
+        self.blank = bytes(self.line_size)
+
+    def format(self, record):
+        """ returns bytes of record packed into its struct. record must fit """
+        values = [1]
+        for (name, n), value in zip(self.types, record):
+            if name == 'int64':
+                values.append(int(value) + INT64_OFFSET)
+            elif name == 'float64':
+                values.append(float(value))
+            elif name == 'bytes':
+                values.append(value.encode())
+            else:
+                values.append(len(value.encode()))
+                values.append(value.encode())
+        return self.struct.pack(*values)
+
+    def parse(self, line):
+        """ returns list of fields as strings, or None for a blank slot """
+        values = self.struct.unpack(line)
+        if values[0] == 0:
+            return None
+
+        record = []
+        i = 1
+        for name, n in self.types:
+            if name == 'int64':
+                record.append(str(values[i] - INT64_OFFSET))
+            elif name == 'float64':
+                record.append(repr(values[i]))
+            elif name == 'bytes':
+                record.append(values[i].rstrip(b'\0').decode())
+            else:
+                record.append(values[i + 1][:values[i]].decode())
+                i += 1
+            i += 1
+        return record
+
+    def fits(self, record):
+        """ returns True if every value converts to its field type and is short enough """
+        for (name, n), value in zip(self.types, record):
+            try:
+                if name == 'int64':
+                    if not -INT64_OFFSET <= int(value) < INT64_OFFSET:
+                        return False
+                elif name == 'float64':
+                    float(value)
+                elif len(value.encode()) > n:
+                    return False
+            except ValueError:
+                return False
+        return True
+
+    def sort_value(self, field_number, value):
+        """ returns value as a number for int64 and float64 fields, for comparing values of a field.
+            raises InvalidInputError if value is not a number
+        """
+        name, _ = self.types[field_number]
+        try:
+            if name == 'int64':
+                return int(value)
+            if name == 'float64':
+                return float(value)
+        except ValueError:
+            raise InvalidInputError(f'{value} is not a number')
+        return value.rstrip('\0') if name == 'bytes' else value
+
+    def with_overflow(self, overflow):
+        """ returns this format. binary values never spill """
+        return self
+
+    def widen(self, field, width):
+        """ returns this format with bytes or varchar field holding up to width bytes.
+            raises InvalidInputError if field is a number or would get narrower
+        """
+        name, n = self.types[list(self.field_to_type).index(field)]
+        if name not in ['bytes', 'varchar']:
+            raise InvalidInputError(f'{field} is a number')
+        if width < n:
+            raise InvalidInputError(f'{field} is already {n} wide')
+        field_to_type = dict(self.field_to_type)
+        field_to_type[field] = f'{name}({width})'
+        return BinaryFormat(field_to_type)
+
+    def schema(self):
+        """ returns the schema as stored in the config file """
+        return ','.join([f'{f}:{t}' for f, t in self.field_to_type.items()])
+
+
+def make_record_format(schema):
+    """ returns TextFormat if schema only has widths, otherwise BinaryFormat """
+    if all(isinstance(x, int) or re.fullmatch(r'\d+\+', x) for x in schema.values()):
+        return TextFormat(schema)
+    return BinaryFormat(schema)
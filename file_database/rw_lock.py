@@ -0,0 +1,177 @@
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError: # not available on windows. sections then only exclude those of the same process
+    fcntl = None
+
+class ReadWriteLock:
+    """ lets any number of threads read at once, or a single thread write.
+        a waiting writer keeps new readers out, and readers already waiting when a writer
+        finishes go before the next writer, so neither side can starve the other.
+        both sides are reentrant, and the thread holding the write lock may also read.
+        usage:
+            with lock.read(): ...
+            with lock.write(): ...
+    """
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = {} # thread id: number of read locks held
+        self.writer = None # thread id of the writer
+        self.write_depth = 0
+        self.writers_waiting = 0
+        self.readers_waiting = 0
+        self.writes = 0 # writes finished so far
+        self.readers_admitted = 0 # readers waiting when the last write finished, which go before the next one
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def acquire_read(self):
+        thread = threading.get_ident()
+        with self.condition:
+            # threads already holding a lock skip the queue, or they could wait on themselves
+            if thread != self.writer and thread not in self.readers:
+                writes = self.writes
+                self.readers_waiting += 1
+                while self.writer is not None or (self.writers_waiting and self.writes == writes):
+                    self.condition.wait()
+                self.readers_waiting -= 1
+                if self.writes != writes:
+                    self.readers_admitted -= 1
+            self.readers[thread] = self.readers.get(thread, 0) + 1
+
+    def release_read(self):
+        thread = threading.get_ident()
+        with self.condition:
+            self.readers[thread] -= 1
+            if self.readers[thread] == 0:
+                del self.readers[thread]
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        thread = threading.get_ident()
+        with self.condition:
+            if thread == self.writer:
+                self.write_depth += 1
+                return
+
+            assert thread not in self.readers, 'a read lock cannot be upgraded to a write lock'
+            self.writers_waiting += 1
+            while self.writer is not None or self.readers or self.readers_admitted:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writer = thread
+            self.write_depth = 1
+
+    def release_write(self):
+        with self.condition:
+            self.write_depth -= 1
+            if self.write_depth == 0:
+                self.writer = None
+                self.writes += 1
+                self.readers_admitted = self.readers_waiting
+                self.condition.notify_all()
+
+
+class FileReadWriteLock(ReadWriteLock):
+    """ a ReadWriteLock whose outermost sections also lock a file with fcntl.flock, so that they
+        exclude the sections of other processes. processes that only read the data file lock the
+        file shared around their reads, and the single process writing it locks the file
+        exclusively around its writes. the writer's reads, and the writes a reader makes to its
+        own memory, take no file lock.
+        lock_file turns the file lock on. a reader can set stale, called with the read lock held
+        at the start of each outermost read, and catch_up, called with the write lock held when
+        stale returns True, to catch up with changes made by the writer before it reads.
+        there is no file lock where fcntl is unavailable
+    """
+    def __init__(self):
+        super().__init__()
+        self.path = None
+        self.shared = True
+        self.stale = None
+        self.catch_up = None
+        self.files = {} # thread id: file locked for the thread's outermost section
+
+    def lock_file(self, path, shared):
+        """ locks path around sections from now on: shared around reads if shared, otherwise
+            exclusively around writes
+        """
+        if fcntl is not None:
+            self.path = path
+        self.shared = shared
+
+    def unlock_file(self):
+        """ stops locking the file. sections holding it keep it until they end """
+        self.path = None
+        self.stale = self.catch_up = None
+
+    def acquire_read(self):
+        thread = threading.get_ident()
+        outermost = self.shared and self.path is not None and thread != self.writer and thread not in self.readers
+        if outermost:
+            self._lock(thread, fcntl.LOCK_SH)
+        super().acquire_read()
+        if not outermost or self.stale is None:
+            return
+
+        try:
+            if self.stale():
+                # the read lock cannot be upgraded, so it is given up while catching up
+                super().release_read()
+                with self.write():
+                    self.catch_up()
+                super().acquire_read()
+        except BaseException:
+            if thread in self.readers:
+                super().release_read()
+            self._unlock(thread)
+            raise
+
+    def release_read(self):
+        thread = threading.get_ident()
+        super().release_read()
+        if self.shared and thread in self.files and thread not in self.readers:
+            self._unlock(thread)
+
+    def acquire_write(self):
+        super().acquire_write()
+        thread = threading.get_ident()
+        if not self.shared and self.path is not None and self.write_depth == 1:
+            try:
+                self._lock(thread, fcntl.LOCK_EX)
+            except BaseException:
+                super().release_write()
+                raise
+
+    def release_write(self):
+        thread = threading.get_ident()
+        if not self.shared and self.write_depth == 1 and thread in self.files:
+            self._unlock(thread)
+        super().release_write()
+
+    def _lock(self, thread, operation):
+        """ locks the file with a descriptor of the thread's own, as flock locks belong to descriptors """
+        f = open(self.path, 'a')
+        try:
+            fcntl.flock(f, operation)
+        except BaseException:
+            f.close()
+            raise
+        self.files[thread] = f
+
+    def _unlock(self, thread):
+        self.files.pop(thread).close() # releases the lock
@@ -0,0 +1,169 @@
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .database_manager import DatabaseManager
+from .util import *
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7411
+MAX_LINE_SIZE = 16 * 1024 * 1024 # bytes in one request, e.g. a large insert_many
+MAX_SCAN_RECORDS = 1000 # records returned by one scan request
+
+class DatabaseServer:
+    """ asyncio TCP server exposing the databases of a DatabaseManager.
+
+        the protocol is line-delimited JSON. each request is an object with an "op" and its
+        arguments, and an optional "id" that is echoed back, e.g.
+            {"id": 1, "op": "find", "database": "people", "key": 42}
+        each response is {"id": 1, "result": ...} or {"id": 1, "error": "RecordNotFoundError", "message": ""}.
+
+        clients can pipeline: send many requests without waiting for their responses.
+        requests on one connection run in order, and their responses come back in that order.
+        requests run on a pool of max_workers threads, so file I/O never blocks the event loop
+        and connections are served in parallel. databases are opened on first use and stay
+        open, with warm caches, until the server stops
+    """
+    def __init__(self, data_dir, host=DEFAULT_HOST, port=DEFAULT_PORT, max_workers=8):
+        self.database_manager = DatabaseManager(data_dir)
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.server = None
+
+        self.open_lock = threading.Lock()
+        self.OPS = {
+            'list':             self.list_databases,
+            'create':           self.create_database,
+            'find':             self.find,
+            'find_by':          self.find_by,
+            'find_range':       self.find_range,
+            'scan':             self.scan,
+            'insert':           self.insert,
+            'insert_many':      self.insert_many,
+            'update':           self.update,
+            'delete':           self.delete,
+            'create_index':     self.create_index,
+            'stats':            self.stats,
+        }
+
+    def run(self):
+        """ serves until interrupted """
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port, limit=MAX_LINE_SIZE)
+        self.port = self.server.sockets[0].getsockname()[1] # port 0 picks a free port
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def close(self):
+        """ closes every open database once running requests are done """
+        self.executor.shutdown()
+        for name, database in self.database_manager.databases.items():
+            if database.is_open():
+                database.close()
+                self.database_manager.update_catalog(name)
+
+
+    # operations. each runs on the thread pool and returns a JSON-serializable result
+    def list_databases(self):
+        return self.database_manager.available_databases()
+
+    def create_database(self, name, csv_path):
+        with self.open_lock:
+            self.database_manager.create_database(name, csv_path)
+
+    # slot indexes mean nothing to clients, so lookups return records only
+    def find(self, database, key):
+        _, record = self._database(database).find(key)
+        return record
+
+    def find_by(self, database, field, value):
+        return [record for _, record in self._database(database).find_by(field, value)]
+
+    def find_range(self, database, field, low=None, high=None):
+        return [record for _, record in self._database(database).find_range(field, low, high)]
+
+    def scan(self, database, start_key=None, end_key=None, limit=MAX_SCAN_RECORDS):
+        limit = MAX_SCAN_RECORDS if limit is None else min(limit, MAX_SCAN_RECORDS)
+        return list(self._database(database).scan(start_key, end_key, limit))
+
+    def insert(self, database, record):
+        self._database(database).insert(record)
+
+    def insert_many(self, database, records):
+        results = self._database(database).insert_many(records)
+        return [None if error is None else type(error).__name__ for error in results]
+
+    def update(self, database, key, field, value):
+        db = self._database(database)
+        index, record = db.find(key)
+        db.update(index, record, field, value)
+
+    def delete(self, database, key):
+        db = self._database(database)
+        index, record = db.find(key)
+        db.delete(index, record)
+
+    def create_index(self, database, field):
+        self._database(database).create_index(field)
+
+    def stats(self, database, reset=False):
+        return self._database(database).stats(reset)
+
+
+    async def _serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError): # line over MAX_LINE_SIZE, or connection reset
+                    break
+                if not line:
+                    break
+
+                writer.write(await loop.run_in_executor(self.executor, self._handle, line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _handle(self, line):
+        """ returns the response line to request line """
+        response = {}
+        try:
+            request = json.loads(line)
+            if 'id' in request:
+                response['id'] = request.pop('id')
+            op = self.OPS[request.pop('op')]
+            response['result'] = op(**request)
+        except (KeyError, TypeError, ValueError) as e: # malformed request
+            response['error'] = InvalidInputError.__name__
+            response['message'] = repr(e)
+        except Exception as e:
+            response['error'] = type(e).__name__
+            response['message'] = str(e)
+        return (json.dumps(response) + '\n').encode()
+
+    def _database(self, name):
+        """ returns the open database called name. raises DatabaseNotFoundError """
+        with self.open_lock:
+            database = self.database_manager.get_database(name)
+            if not database.is_open():
+                database.open()
+            return database
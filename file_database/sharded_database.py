@@ -0,0 +1,356 @@
+import os
+import shutil
+import functools
+import multiprocessing
+from bisect import bisect_right
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from .util import *
+from .database import Database
+from .data_file import DataFile
+from .analytics import Analytics
+from .rw_lock import ReadWriteLock
+
+SCAN_BATCH_SIZE = 1000 # records scan reads from a shard at a time
+
+class ShardedDatabase:
+    """ a database split by primary key range into shards, each a Database in a subdirectory.
+        a rewrite only rewrites one shard, and map_shards, map_analytics and parallel_scan run
+        on a process pool with one job per shard, so they use every core.
+
+        the shard map is kept in {name}.shards:
+            name
+            max_shard_records
+            one line per shard, in key order: directory:lowest key (empty for the first shard)
+        point operations go to the one shard whose range holds the key. a shard that grows past
+        max_shard_records is split in two at its median key
+    """
+    DEFAULT_NUM_SHARDS = 4
+    DEFAULT_MAX_SHARD_RECORDS = 1000000
+    SHARD_PREFIX = 'shard_'
+
+    def __init__(self, data_dir, max_workers=None):
+        self.dir = data_dir
+        makedir(self.dir)
+        self.max_workers = max_workers # processes in the pool, default one per cpu
+        self.pool = None
+
+        # shards[i] holds keys in [bounds[i - 1], bounds[i]), unbounded at both ends
+        self.shard_dirs = []
+        self.shards = []
+        self.bounds = []
+
+        # threads hold lock.read() to use the shards and lock.write() to change the shard map
+        self.lock = ReadWriteLock()
+        self.read_only = False
+
+        self.name = None
+        self.max_shard_records = self.DEFAULT_MAX_SHARD_RECORDS
+        try:
+            self._load_shard_map()
+        except NoFilesFoundError:
+            pass
+
+    @property
+    def fields(self):
+        return self.shards[0].fields
+
+    def __len__(self):
+        return len(self.shards)
+
+    def import_data(self, name, csv_path, num_shards=DEFAULT_NUM_SHARDS, max_shard_records=DEFAULT_MAX_SHARD_RECORDS, **options):
+        """ imports a csv file into num_shards shards of about equal size. options are passed to
+            Database.import_data. all shards share the schema the whole file needs
+        """
+        assert self.name is None
+
+        shard_dir = self._new_shard_dir()
+        Database(shard_dir).import_data(name, csv_path, **options)
+        self.name = name
+        self.max_shard_records = max_shard_records
+        self.shard_dirs = [os.path.basename(shard_dir)]
+        self.shards = [Database(shard_dir)]
+        self._save_shard_map()
+
+        self.open()
+        try:
+            with self.lock.write():
+                self._split(0, num_shards)
+        finally:
+            self.close()
+
+    def open(self, read_only=False):
+        """ opens every shard, see Database.open. raises DatabaseLockedError """
+        assert not self.is_open()
+        opened = []
+        try:
+            for shard in self.shards:
+                shard.open(read_only)
+                opened.append(shard)
+        except DatabaseLockedError:
+            for shard in opened:
+                shard.close()
+            raise
+
+        self.read_only = read_only
+        if not read_only:
+            self._remove_unused_shards()
+
+    def is_open(self):
+        return len(self.shards) > 0 and self.shards[0].is_open()
+
+    def close(self):
+        assert self.is_open()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        with self.lock.write():
+            for shard in self.shards:
+                shard.close()
+
+    def find(self, primary_key):
+        """ returns index, record of the record with primary_key. the index is the record's slot in its shard.
+            raises RecordNotFoundError
+        """
+        with self.lock.read():
+            return self._shard_for(primary_key).find(primary_key)
+
+    def update(self, index, record, field, new_value):
+        with self.lock.read():
+            self._shard_for(get_key(record)).update(index, record, field, new_value)
+
+    def delete(self, index, record):
+        """ deletes record, found at index by find """
+        with self.lock.read():
+            self._shard_for(get_key(record)).delete(index, record)
+
+    def insert(self, record):
+        with self.lock.read():
+            shard = self._shard_for(get_key(record))
+            shard.insert(record)
+        self._split_if_full(shard)
+
+    def insert_many(self, records):
+        """ inserts records with one Database.insert_many per shard. returns a list with one entry
+            per record: None if it was inserted, or the error that kept it out
+        """
+        results = [None] * len(records)
+        with self.lock.read():
+            batches = {} # shard number: [(position in records, record)]
+            for i, record in enumerate(records):
+                batches.setdefault(self._shard_number(get_key(record)), []).append((i, record))
+
+            for shard_number, batch in batches.items():
+                shard_results = self.shards[shard_number].insert_many([record for _, record in batch])
+                for (i, _), result in zip(batch, shard_results):
+                    results[i] = result
+            touched = [self.shards[shard_number] for shard_number in batches]
+
+        for shard in touched:
+            self._split_if_full(shard)
+        return results
+
+    def sync(self):
+        with self.lock.read():
+            for shard in self.shards:
+                shard.sync()
+
+    def stats(self):
+        """ returns {shard directory: Database.stats() of the shard} """
+        with self.lock.read():
+            return {shard_dir: shard.stats() for shard_dir, shard in zip(self.shard_dirs, self.shards)}
+
+    def scan(self, start_key=None, end_key=None, limit=None):
+        """ yields records with start_key <= key <= end_key in key order, at most limit of them.
+            None means no bound. shards are read SCAN_BATCH_SIZE records at a time, so a shard
+            split between two batches is followed
+        """
+        count = 0
+        while limit != count:
+            batch_size = SCAN_BATCH_SIZE if limit is None else min(SCAN_BATCH_SIZE, limit - count)
+            with self.lock.read():
+                i = 0 if start_key is None else self._shard_number(start_key)
+                shard_end = self.bounds[i] - 1 if i < len(self.bounds) else None # last key in the shard's range
+                last = shard_end if end_key is None or (shard_end is not None and shard_end < end_key) else end_key
+                batch = list(self.shards[i].scan(start_key, last, batch_size))
+
+            yield from batch
+            count += len(batch)
+            if len(batch) == batch_size:
+                start_key = get_key(batch[-1]) + 1
+            elif shard_end is None or (end_key is not None and end_key <= shard_end):
+                return
+            else:
+                start_key = shard_end + 1
+
+    def map_shards(self, mapper, start_key=None, end_key=None):
+        """ returns [mapper(records)] for each shard whose range meets [start_key, end_key], in key
+            order, records iterating over the shard's records in that range in key order.
+            mapper runs in a worker process, so it must be picklable: a module-level function or a
+            functools.partial of one
+        """
+        return self._run(_map_records, mapper, start_key, end_key)
+
+    def map_analytics(self, mapper):
+        """ returns [mapper(Analytics of the shard)] for each shard, in key order. see map_shards """
+        return self._run(_map_analytics, mapper)
+
+    def parallel_scan(self, start_key=None, end_key=None, where=None):
+        """ returns the records with start_key <= key <= end_key for which where(record) is True,
+            or all of them if where is None, in key order. where must be picklable, see map_shards
+        """
+        results = self.map_shards(functools.partial(_select, where), start_key, end_key)
+        return [record for records in results for record in records]
+
+
+    def _shard_number(self, key):
+        return bisect_right(self.bounds, key)
+
+    def _shard_for(self, key):
+        assert self.is_open()
+        return self.shards[self._shard_number(key)]
+
+    def _run(self, worker, mapper, start_key=None, end_key=None):
+        """ runs worker(data path, config path, dirty lines, slot range, mapper) for each shard
+            meeting [start_key, end_key] in the process pool. returns the results in key order
+        """
+        assert self.is_open()
+        if self.pool is None:
+            # spawned rather than forked, as the parent has threads (e.g. background compactions)
+            self.pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+        with self.lock.read(), ExitStack() as stack:
+            first = 0 if start_key is None else self._shard_number(start_key)
+            last = len(self.shards) - 1 if end_key is None else self._shard_number(end_key)
+
+            jobs = []
+            for shard in self.shards[first:last + 1]:
+                data_file = shard.data_file
+                stack.enter_context(data_file.lock.read()) # no writes until the workers are done
+                slots = _slot_range(data_file.key_index, start_key, end_key)
+                jobs.append(self.pool.submit(worker, data_file.data_path, data_file.config_path, dict(data_file.dirty), slots, mapper))
+            return [job.result() for job in jobs]
+
+    def _split_if_full(self, shard):
+        if self.read_only or len(shard.data_file.key_index) <= self.max_shard_records:
+            return
+        with self.lock.write():
+            # another thread may have split it already
+            if shard in self.shards and len(shard.data_file.key_index) > self.max_shard_records:
+                self._split(self.shards.index(shard), 2)
+
+    def _split(self, shard_number, parts):
+        """ replaces open shard shard_number by parts open shards with about as many records each.
+            the new shards are written in full before the shard map names them, so a crash leaves
+            either the old shard or the new ones
+        """
+        old_shard = self.shards[shard_number]
+        data_file = old_shard.data_file
+        key_index = data_file.key_index
+        if len(key_index) < parts:
+            return
+
+        positions = [len(key_index) * j // parts for j in range(parts + 1)]
+        new_dirs, new_shards = [], []
+        for start, end in zip(positions, positions[1:]):
+            shard_dir = self._new_shard_dir()
+            part = DataFile(os.path.join(shard_dir, f'{self.name}.data'), os.path.join(shard_dir, f'{self.name}.config'))
+            part.configure_layout(data_file.fill_factor, data_file.hot_ranges, data_file.max_density)
+            part.configure_bloom_filter(data_file.false_positive_rate)
+            slots = data_file.scan(key_index.slots[start], key_index.slots[end - 1] + 1)
+            part.import_records(self.name, (record for _, record in slots), data_file.record_format)
+
+            shard = Database(shard_dir)
+            shard.open()
+            for field in data_file.field_indexes:
+                shard.create_index(field)
+            new_dirs.append(os.path.basename(shard_dir))
+            new_shards.append(shard)
+
+        new_bounds = [key_index.keys[position] for position in positions[1:-1]]
+        old_dir = self.shard_dirs[shard_number]
+        old_shard.close()
+
+        self.shard_dirs[shard_number:shard_number + 1] = new_dirs
+        self.shards[shard_number:shard_number + 1] = new_shards
+        self.bounds[shard_number:shard_number] = new_bounds
+        self._save_shard_map()
+        shutil.rmtree(os.path.join(self.dir, old_dir))
+
+    def _new_shard_dir(self):
+        """ creates and returns the directory of a new shard, numbered after every existing one """
+        numbers = [int(name[len(self.SHARD_PREFIX):]) for name in os.listdir(self.dir)
+                   if name.startswith(self.SHARD_PREFIX) and name[len(self.SHARD_PREFIX):].isdigit()]
+        shard_dir = os.path.join(self.dir, f'{self.SHARD_PREFIX}{max(numbers, default=-1) + 1}')
+        makedir(shard_dir)
+        return shard_dir
+
+    def _remove_unused_shards(self):
+        """ removes shard directories left behind by a split that did not finish """
+        for name in os.listdir(self.dir):
+            if name.startswith(self.SHARD_PREFIX) and name not in self.shard_dirs:
+                shutil.rmtree(os.path.join(self.dir, name))
+
+    def _shard_map_path(self):
+        for name in os.listdir(self.dir):
+            if name.endswith('.shards'):
+                return os.path.join(self.dir, name)
+        raise NoFilesFoundError()
+
+    def _load_shard_map(self):
+        """ reads the shard map and builds the shards' Database objects. raises NoFilesFoundError """
+        with open(self._shard_map_path(), 'r') as f:
+            self.name = f.readline().strip()
+            self.max_shard_records = int(f.readline().strip())
+            for i, line in enumerate(f.read().split()):
+                shard_dir, low = line.split(':')
+                self.shard_dirs.append(shard_dir)
+                if i > 0:
+                    self.bounds.append(int(low))
+        self.shards = [Database(os.path.join(self.dir, shard_dir)) for shard_dir in self.shard_dirs]
+
+    def _save_shard_map(self):
+        """ stores the shard map, replacing the old one atomically """
+        path = os.path.join(self.dir, f'{self.name}.shards')
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.name)
+            f.write('\n')
+            f.write(str(self.max_shard_records))
+            f.write('\n')
+            lows = [''] + [str(low) for low in self.bounds]
+            f.write('\n'.join([f'{shard_dir}:{low}' for shard_dir, low in zip(self.shard_dirs, lows)]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+
+def _slot_range(key_index, start_key, end_key):
+    """ returns the slots [start, end) holding keys in [start_key, end_key], None meaning no bound """
+    first = 0 if start_key is None else key_index.position(start_key)
+    last = len(key_index) if end_key is None else key_index.position_after(end_key)
+    if first >= last:
+        return 0, 0
+    return key_index.slots[first], key_index.slots[last - 1] + 1
+
+# worker process jobs of ShardedDatabase._run
+def _attach(data_path, config_path, dirty):
+    data_file = DataFile(data_path, config_path)
+    data_file.attach(dirty)
+    return data_file
+
+def _map_records(data_path, config_path, dirty, slots, mapper):
+    data_file = _attach(data_path, config_path, dirty)
+    try:
+        return mapper(record for _, record in data_file.scan(*slots))
+    finally:
+        data_file.close()
+
+def _map_analytics(data_path, config_path, dirty, slots, mapper):
+    data_file = _attach(data_path, config_path, dirty)
+    try:
+        return mapper(Analytics(data_file))
+    finally:
+        data_file.close()
+
+def _select(where, records):
+    return [record for record in records if where is None or where(record)]
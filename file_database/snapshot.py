@@ -0,0 +1,139 @@
+import os
+import mmap
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from .util import *
+from .export import export_records
+
+class Snapshot:
+    """ read-only view of a data file as it was when the snapshot was taken.
+
+        the snapshot keeps its own descriptor of the data file, so a rewrite that replaces the
+        file leaves the snapshot reading the old one, and copies of the key index and of the
+        lines not yet checkpointed. before a checkpoint overwrites slots of the file in place,
+        the data file hands their old lines to preserve (copy on write). reads never take the
+        data file's lock, so snapshots do not block writers, and stay usable after the data file
+        is closed. a snapshot taken by a process that opened the data file read only is not
+        protected from the checkpoints of the process writing it, which write lines in place.
+        close the snapshot when done, e.g.
+            with database.snapshot() as snapshot:
+                snapshot.export('report.txt')
+    """
+    def __init__(self, data_file):
+        """ takes a snapshot of data_file. call while holding data_file.lock """
+        self.fields = data_file.fields
+        self.field_to_length = data_file.field_to_length
+        self.overflow = data_file.overflow.reader() # values are never moved in it, so the snapshot only needs to keep it open
+        self.record_format = data_file.record_format.with_overflow(self.overflow)
+        self.line_size = data_file.line_size
+        self.read_block_size = data_file.READ_BLOCK_SIZE
+        self.num_records = len(data_file)
+
+        self.keys = array('q', data_file.key_index.keys)
+        self.slots = array('q', data_file.key_index.slots)
+
+        # slot: line as of the snapshot, for lines newer in the file. the writer adds lines while readers read them
+        self.overlay = dict(data_file.dirty)
+        self.overlay_lock = threading.Lock()
+
+        self.fd = os.dup(data_file.file.fileno())
+        self.mmap = None
+        if self.num_records > 0:
+            self.mmap = mmap.mmap(self.fd, self.num_records * self.line_size, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        """ returns the number of records """
+        return len(self.keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.overlay_lock: # not while a writer preserves lines
+            if self.fd is None:
+                return
+            if self.mmap is not None:
+                self.mmap.close()
+                self.mmap = None
+            os.close(self.fd)
+            self.fd = None
+            self.overflow.close()
+
+    def is_open(self):
+        return self.fd is not None
+
+    def find(self, primary_key):
+        """ returns the record with primary_key. raises RecordNotFoundError """
+        assert self.is_open()
+        i = bisect_left(self.keys, primary_key)
+        if i == len(self.keys) or self.keys[i] != primary_key:
+            raise RecordNotFoundError()
+        slot = self.slots[i]
+        return self.record_format.parse(self._read_lines(slot, slot + 1))
+
+    def scan(self, start_key=None, end_key=None, limit=None):
+        """ yields records with start_key <= key <= end_key in key order, at most limit of them.
+            None means no bound
+        """
+        assert self.is_open()
+        first = 0 if start_key is None else bisect_left(self.keys, start_key)
+        last = len(self.keys) if end_key is None else bisect_right(self.keys, end_key)
+        if limit is not None:
+            last = min(last, first + limit)
+        if first >= last:
+            return
+
+        start, end = self.slots[first], self.slots[last - 1] + 1
+        block_lines = max(self.read_block_size // self.line_size, 1)
+        blank = self.record_format.blank
+        for block_start in range(start, end, block_lines):
+            block_end = min(block_start + block_lines, end)
+            block = self._read_lines(block_start, block_end)
+            for offset in range(0, len(block), self.line_size):
+                line = block[offset:offset + self.line_size]
+                if line != blank:
+                    yield self.record_format.parse(line)
+
+    def export(self, path, export_format='text', start_key=None, end_key=None):
+        """ see Database.export """
+        return export_records(path, self.fields, self.field_to_length, self.scan(start_key, end_key), export_format)
+
+    def preserve(self, slots):
+        """ called by the data file before it overwrites sorted slots in place. keeps the lines
+            of the slots that the snapshot does not have yet
+        """
+        with self.overlay_lock:
+            if not self.is_open():
+                return
+            slots = [slot for slot in slots if slot not in self.overlay and slot < self.num_records]
+            run_start = 0
+            for i in range(1, len(slots) + 1):
+                if i == len(slots) or slots[i] != slots[i - 1] + 1:
+                    start = slots[run_start]
+                    block = os.pread(self.fd, (slots[i - 1] + 1 - start) * self.line_size, start * self.line_size)
+                    for j in range(run_start, i):
+                        offset = (slots[j] - start) * self.line_size
+                        self.overlay[slots[j]] = block[offset:offset + self.line_size]
+                    run_start = i
+
+
+    def _read_lines(self, start, end):
+        """ returns the lines of slots [start, end) as of the snapshot """
+        block = self.mmap[start * self.line_size:end * self.line_size]
+        with self.overlay_lock:
+            if end - start <= len(self.overlay):
+                slots = [i for i in range(start, end) if i in self.overlay]
+            else:
+                slots = [i for i in self.overlay if start <= i < end]
+            if not slots:
+                return block
+
+            block = bytearray(block)
+            for i in slots:
+                offset = (i - start) * self.line_size
+                block[offset:offset + self.line_size] = self.overlay[i]
+        return bytes(block)
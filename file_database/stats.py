@@ -0,0 +1,141 @@
+import time
+import pstats
+import cProfile
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+class Stats:
+    """ counters and timers of the work done by a data file, e.g.
+            counters    slots_read, bytes_read, bytes_logged, bytes_written, blank_slots_skipped
+            timers      read, checkpoint, rewrite, rebalance, and one per Database operation
+        a timer keeps its number of calls and the total time spent in them.
+        counters are not locked, so concurrent readers may occasionally lose an increment
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = {} # name: count
+        self.timers = {} # name: [calls, nanoseconds]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, nanoseconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, nanoseconds]
+        else:
+            timer[0] += 1
+            timer[1] += nanoseconds
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter_ns() - start)
+
+    def snapshot(self):
+        """ returns {'counters': {name: count}, 'timers': {name: {'calls': calls, 'seconds': seconds}}} """
+        return {
+            'counters': dict(self.counters),
+            'timers': {name: {'calls': calls, 'seconds': ns / 1e9} for name, (calls, ns) in list(self.timers.items())},
+        }
+
+
+# hook wrapped around every Database and CLI operation. None (the default) costs one comparison per operation
+_hook = None
+
+def set_hook(hook):
+    """ wraps each operation in hook(name), a context manager, e.g. ProfileHook() or TraceHook(). None removes it """
+    global _hook
+    _hook = hook
+
+def traced(name):
+    """ returns the hook's context manager for operation name """
+    return nullcontext() if _hook is None else _hook(name)
+
+def operation(name):
+    """ decorator of Database methods: times the method in the data file's stats as name,
+        inside the hook if one is set
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                if _hook is None:
+                    return method(self, *args, **kwargs)
+                with _hook(name):
+                    return method(self, *args, **kwargs)
+            finally:
+                if self.data_file is not None:
+                    self.data_file.stats.add_time(name, time.perf_counter_ns() - start)
+        return wrapper
+    return decorator
+
+
+class ProfileHook:
+    """ runs operations under one cProfile profiler. nested operations share the outer one's profiling """
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.depth = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, name):
+        with self.lock:
+            self.depth += 1
+            if self.depth == 1:
+                self.profile.enable()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.profile.disable()
+
+    def print_stats(self, sort='cumulative', limit=30):
+        pstats.Stats(self.profile).sort_stats(sort).print_stats(limit)
+
+    def dump(self, path):
+        """ writes the profile to path, for pstats or a viewer such as snakeviz """
+        self.profile.dump_stats(path)
+
+
+class TraceHook:
+    """ records a span per operation: {'name', 'parent', 'thread', 'start', 'seconds'}, start
+        being a time.time() timestamp. the last max_spans spans are kept in spans, and each is
+        passed to sink(span) as it ends if a sink is given, e.g. to forward it to a tracer
+    """
+    def __init__(self, sink=None, max_spans=10000):
+        self.sink = sink
+        self.spans = deque(maxlen=max_spans)
+        self.local = threading.local() # names of the spans open in each thread
+
+    @contextmanager
+    def __call__(self, name):
+        stack = self.local.__dict__.setdefault('stack', [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start_time = time.time()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            stack.pop()
+            span = {
+                'name': name,
+                'parent': parent,
+                'thread': threading.get_ident(),
+                'start': start_time,
+                'seconds': (time.perf_counter_ns() - start) / 1e9,
+            }
+            self.spans.append(span)
+            if self.sink is not None:
+                self.sink(span)
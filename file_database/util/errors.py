@@ -36,3 +36,19 @@ class InvalidRecordSizeError(Exception):
 class NoSpaceToInsertError(Exception):
     """Raised when there is not room to insert a new record in the current database file"""
     pass
+
+class DataFileReplacedError(Exception):
+    """Raised when a data file is replaced by a rewrite or compaction, or its records are moved by a rebalance, while it is being scanned"""
+    pass
+
+class DatabaseLockedError(Exception):
+    """Raised when a database is opened while another process holds a conflicting lock on it"""
+    pass
+
+class DatabaseNotFoundError(Exception):
+    """Raised when a request names a database that does not exist"""
+    pass
+
+class ServerError(Exception):
+    """Raised by a client when the server fails a request with an error it does not know"""
+    pass
@@ -1,4 +1,5 @@
 import os
+from array import array
 from .errors import *
 
 def get_user_input(message):
@@ -84,3 +85,31 @@ def pad(string, length):
 def get_key(record):
     """ returns key from record """
     return int(record[0]) # TODO fix this for non ints
+
+def file_fingerprint(path):
+    """ returns [size, modification time] of a file. used to detect stale sidecar files """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def save_arrays(path, *arrays):
+    """ writes arrays to path, each preceded by its length. the file is replaced atomically """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for a in arrays:
+            array('q', [len(a)]).tofile(f)
+            a.tofile(f)
+    os.replace(tmp_path, path)
+
+def load_arrays(path, *typecodes):
+    """ reads arrays written by save_arrays, one per typecode.
+        raises FileNotFoundError or EOFError if path is missing or truncated
+    """
+    arrays = []
+    with open(path, 'rb') as f:
+        for typecode in typecodes:
+            length = array('q')
+            length.fromfile(f, 1)
+            a = array(typecode)
+            a.fromfile(f, length[0])
+            arrays.append(a)
+    return arrays
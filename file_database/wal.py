@@ -0,0 +1,158 @@
+import os
+import struct
+import zlib
+import threading
+
+class WriteAheadLog:
+    """ append-only log of the lines written to a data file since its last checkpoint.
+        each entry holds the first slot written and the new contents of one or more consecutive
+        slots, so replaying the log in order is idempotent.
+
+        entries are group committed: commit() numbers a mutation, and wait() blocks until it is
+        fsynced. the first waiter fsyncs everything committed so far, and the writers committing
+        while its fsync runs wait to be synced together by the next, so a batch costs one fsync.
+
+        the log header stores the inode of the data file it applies to. a rewrite replaces the
+        data file, so a log left behind by a crash right after a rewrite is recognised and ignored.
+        it also counts the checkpoints, so that readers in other processes can tell that lines
+        they have not read yet may have reached the data file
+    """
+    MAGIC = b'FDBWAL02'
+    HEADER = struct.Struct('<8sQQ') # magic, data file inode, number of checkpoints
+    ENTRY = struct.Struct('<qII') # first slot, payload size, crc32 of payload
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.read_only = False
+        self.lock = threading.Lock()
+        self.synced = threading.Condition(self.lock) # notified after each fsync
+        self.syncing = False # whether a waiter is fsyncing for its group
+        self.committed = 0 # number of the last mutation committed
+        self.synced_through = 0 # number of the last mutation fsynced
+        self.num_bytes = 0
+        self.checkpoints = 0
+
+    def open(self, read_only=False):
+        """ opens the log. a read only log can only be read with header and entries """
+        self.read_only = read_only
+        if read_only:
+            # unbuffered, as the process writing the log changes it under the reader
+            self.file = open(self.path, 'rb', buffering=0) if os.path.exists(self.path) else None
+            return
+
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        self.file = open(self.path, mode)
+        self.num_bytes = self.file.seek(0, os.SEEK_END)
+        header = self.header()
+        self.checkpoints = 0 if header is None else header[1]
+
+    def close(self):
+        if self.file is not None and not self.read_only:
+            self.sync()
+        with self.lock:
+            self.synced.wait_for(lambda: not self.syncing)
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.synced.notify_all()
+
+    def header(self):
+        """ returns (data file inode, number of checkpoints) from the log header, or None if there is no valid one """
+        with self.lock:
+            if self.file is None:
+                return None
+            self.file.flush()
+            header = os.pread(self.file.fileno(), self.HEADER.size, 0)
+            if len(header) < self.HEADER.size:
+                return None
+            magic, data_inode, checkpoints = self.HEADER.unpack(header)
+            return (data_inode, checkpoints) if magic == self.MAGIC else None
+
+    def size(self):
+        """ returns the size of the log in bytes, as other processes see it """
+        with self.lock:
+            return os.fstat(self.file.fileno()).st_size
+
+    def entries(self, data_inode, offset=HEADER.size):
+        """ returns [(first slot, payload)] logged for the data file with data_inode from byte
+            offset on, stopping at the first torn or corrupt entry, and the offset after the last one
+        """
+        header = self.header()
+        if header is None or header[0] != data_inode:
+            return [], offset
+
+        with self.lock:
+            fd = self.file.fileno()
+            data = os.pread(fd, max(os.fstat(fd).st_size - offset, 0), offset)
+
+        entries = []
+        position = 0
+        while position + self.ENTRY.size <= len(data):
+            slot, size, crc = self.ENTRY.unpack_from(data, position)
+            payload = data[position + self.ENTRY.size:position + self.ENTRY.size + size]
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                break
+            entries.append((slot, payload))
+            position += self.ENTRY.size + size
+        return entries, offset + position
+
+    def append(self, slot, payload):
+        """ logs payload as the new contents of the slots starting at slot. not durable until synced """
+        with self.lock:
+            self.file.write(self.ENTRY.pack(slot, len(payload), zlib.crc32(payload)))
+            self.file.write(payload)
+            self.num_bytes += self.ENTRY.size + len(payload)
+
+    def commit(self):
+        """ marks the end of a mutation. returns the number of the mutation, to wait for """
+        with self.lock:
+            self.file.flush() # readers in other processes see whole mutations
+            self.committed += 1
+            return self.committed
+
+    def wait(self, mutation):
+        """ blocks until the mutation numbered mutation by commit is durable, or the log is closed.
+            call it without holding locks other committers need, so they can join the group
+        """
+        with self.lock:
+            while self.synced_through < mutation and self.file is not None:
+                if self.syncing:
+                    self.synced.wait()
+                    continue
+
+                # lead the group: fsync every mutation committed so far, without the lock, so
+                # the next group can be logged meanwhile
+                self.syncing = True
+                self.file.flush()
+                through = self.committed
+                fd = self.file.fileno()
+                self.lock.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self.lock.acquire()
+                    self.syncing = False
+                    self.synced.notify_all()
+                self.synced_through = max(self.synced_through, through)
+
+    def sync(self):
+        """ makes everything logged so far durable """
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.synced_through = self.committed
+            self.synced.notify_all()
+
+    def reset(self, data_inode):
+        """ empties the log after a checkpoint of the data file with data_inode """
+        with self.lock:
+            self.file.seek(0)
+            self.file.truncate()
+            self.checkpoints += 1
+            self.file.write(self.HEADER.pack(self.MAGIC, data_inode, self.checkpoints))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.num_bytes = self.HEADER.size
+            self.synced_through = self.committed # the checkpoint made them durable in the data file
+            self.synced.notify_all()
@@ -1,7 +1,28 @@
 import os
+import json
+import argparse
 from file_database import CommandLineInterface
+from file_database.stats import set_hook, ProfileHook, TraceHook
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='interactive interface to the databases')
+    parser.add_argument('--profile', metavar='PATH', help='profile each command with cProfile and write the profile to PATH on exit')
+    parser.add_argument('--trace', metavar='PATH', help='append a JSON span per command and database operation to PATH')
+    args = parser.parse_args()
+
+    if args.profile:
+        hook = ProfileHook()
+    elif args.trace:
+        trace_file = open(args.trace, 'a', buffering=1)
+        hook = TraceHook(lambda span: trace_file.write(json.dumps(span) + '\n'))
+    else:
+        hook = None
+    set_hook(hook)
+
     data_storage_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
     cli = CommandLineInterface(data_storage_path=data_storage_path)
-    cli.start()
\ No newline at end of file
+    try:
+        cli.start()
+    finally:
+        if args.profile:
+            hook.dump(args.profile)
@@ -0,0 +1,16 @@
+import os
+import argparse
+from file_database import DatabaseServer
+from file_database.server import DEFAULT_HOST, DEFAULT_PORT
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='serves the databases over TCP')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=8, help='threads running requests')
+    args = parser.parse_args()
+
+    data_storage_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
+    server = DatabaseServer(data_storage_path, args.host, args.port, args.workers)
+    print(f'Serving {data_storage_path} on {args.host}:{args.port}')
+    server.run()
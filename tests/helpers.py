@@ -0,0 +1,25 @@
+import os
+import shutil
+import tempfile
+import unittest
+from file_database.database import Database
+
+class DatabaseTestCase(unittest.TestCase):
+    """ runs each test in a temporary directory, with make_database to import records into it """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True) # after databases are closed
+
+    def make_database(self, records, fields=('id', 'name'), **options):
+        """ imports records, lists of strings, and returns the database opened """
+        csv_path = os.path.join(self.dir, 'records.csv')
+        with open(csv_path, 'w') as f:
+            f.write(','.join(fields) + '\n')
+            f.writelines(','.join(record) + '\n' for record in records)
+
+        data_dir = os.path.join(self.dir, 'db')
+        Database(data_dir).import_data('test', csv_path, **options)
+        database = Database(data_dir)
+        database.open()
+        self.addCleanup(lambda: database.close() if database.is_open() else None)
+        return database
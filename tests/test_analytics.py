@@ -0,0 +1,71 @@
+import unittest
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+try:
+    import numpy as np
+except ImportError: # analytics are only available with numpy installed
+    np = None
+
+FIELDS = ('id', 'name', 'city', 'score')
+
+def person(k):
+    return [str(k), f'name{k % 10}', f'city{k % 7}', str(k * 37 % 1000)]
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestAnalytics(DatabaseTestCase):
+    def make_people(self, **options):
+        database = self.make_database([person(k) for k in range(1, 3000, 2)], fields=FIELDS, **options)
+        # lines not checkpointed yet, which the analytics read from the log
+        database.insert(['2', 'name2', 'cityX', '999'])
+        database.delete(*database.find(5))
+        database.update(*database.find(7), 'score', '12')
+        self.records = list(database.scan())
+        return database
+
+    def check_queries(self, database):
+        analytics = database.analytics()
+        score = lambda record: float(record[3])
+        self.assertEqual(analytics.count(), len(self.records))
+
+        mask = analytics.where('score', '>=', 500) & (analytics.where('city', '==', 'city3') | analytics.where('city', '==', 'cityX'))
+        expected = [record for record in self.records if score(record) >= 500 and record[2] in ['city3', 'cityX']]
+        self.assertEqual(analytics.keys(mask), [get_key(record) for record in expected])
+        self.assertEqual(analytics.records(mask, limit=3), expected[:3])
+        self.assertEqual(analytics.sum('score', ~analytics.where('id', '<', 100)), sum(score(record) for record in self.records if get_key(record) >= 100))
+        self.assertEqual(analytics.min('score'), min(score(record) for record in self.records))
+        self.assertIsNone(analytics.max('score', analytics.where('id', '<', 0)))
+
+        expected = {}
+        for record in self.records:
+            if record[1] < 'name5':
+                expected.setdefault(record[2], []).append(score(record))
+        name_mask = analytics.where('name', '<', 'name5')
+        self.assertEqual(analytics.group_by('city', mask=name_mask), {city: len(scores) for city, scores in expected.items()})
+        self.assertEqual(analytics.group_by('city', 'max', 'score', name_mask), {city: max(scores) for city, scores in expected.items()})
+        self.assertEqual(analytics.group_by('city', 'sum', 'score', name_mask), {city: sum(scores) for city, scores in expected.items()})
+
+    def test_text_records(self):
+        self.check_queries(self.make_people())
+
+    def test_binary_records(self):
+        self.check_queries(self.make_people(field_types={'id': 'int64', 'name': 'varchar(8)', 'city': 'bytes(6)', 'score': 'float64'}))
+
+    def test_spilled_columns(self):
+        records = [[str(k), 'long name ' * 3 + str(k) if k % 20 == 0 else f'name{k}'] for k in range(1000, 2000)]
+        database = self.make_database(records, inline_fraction=0.9)
+        self.assertEqual(database.data_file.record_format.spill_fields, [1])
+
+        analytics = database.analytics()
+        self.assertEqual(analytics.keys(analytics.where('name', '==', 'long name ' * 3 + '1040')), [1040])
+        self.assertEqual(analytics.count(analytics.where('name', '<', 'm')), 50)
+        self.assertEqual(analytics.group_by('name', mask=analytics.where('id', '<', 1003)), {'name1001': 1, 'name1002': 1, 'long name long name long name 1000': 1})
+
+    def test_errors(self):
+        analytics = self.make_people().analytics()
+        with self.assertRaises(InvalidInputError):
+            analytics.where('name', '>', 5)
+        with self.assertRaises(InvalidInputError):
+            analytics.where('score', '~', 5)
+        with self.assertRaises(InvalidInputError):
+            analytics.group_by('city', 'mean', 'score')
@@ -0,0 +1,59 @@
+from file_database.util import *
+from file_database.record_format import BinaryFormat, make_record_format
+from tests.helpers import DatabaseTestCase
+
+FIELD_TYPES = {'id': 'int64', 'name': 'varchar(12)', 'score': 'float64', 'code': 'bytes(4)'}
+
+class TestBinaryFormat(DatabaseTestCase):
+    def test_round_trip(self):
+        record_format = make_record_format(FIELD_TYPES)
+        self.assertIsInstance(record_format, BinaryFormat)
+        for record in [['-5', 'é', '-0.5', 'ab'], ['0', '', '0.0', ''], [str(2**63 - 1), 'twelve bytes', '1e+300', 'abcd']]:
+            line = record_format.format(record)
+            self.assertEqual(len(line), record_format.line_size)
+            self.assertEqual(record_format.parse(line), record)
+        self.assertIsNone(record_format.parse(record_format.blank))
+
+    def test_keys_order_as_raw_bytes(self):
+        record_format = make_record_format(FIELD_TYPES)
+        keys = [-2**63, -1000, -1, 0, 1, 255, 256, 2**63 - 1]
+        lines = [record_format.format([str(k), '', '0', '']) for k in keys]
+        self.assertEqual(sorted(lines), lines)
+
+    def test_fits(self):
+        record_format = make_record_format(FIELD_TYPES)
+        self.assertTrue(record_format.fits(['1', 'twelve bytes', '2.5', 'abcd']))
+        self.assertFalse(record_format.fits(['1', 'thirteen byte', '2.5', 'abcd']))
+        self.assertFalse(record_format.fits(['1', 'é' * 7, '2.5', '']))
+        self.assertFalse(record_format.fits(['x', '', '2.5', '']))
+        self.assertFalse(record_format.fits(['1', '', 'high', '']))
+        self.assertFalse(record_format.fits([str(2**63), '', '0', '']))
+
+    def test_unknown_type(self):
+        with self.assertRaises(InvalidInputError):
+            make_record_format({'id': 'int64', 'name': 'text'})
+
+    def test_database_round_trip(self):
+        records = [[str(k), f'name{k}', f'{k / 4}', f'c{k % 10}'] for k in range(-500, 500, 5)]
+        database = self.make_database(records, fields=list(FIELD_TYPES), field_types=FIELD_TYPES)
+        self.assertEqual(list(database.scan()), [[k, n, repr(float(s)), c] for k, n, s, c in records])
+
+        database.insert(['-3', 'inserted', '1.25', 'new'])
+        database.update(*database.find(100), 'name', 'updated')
+        with self.assertRaises(InvalidRecordSizeError):
+            database.insert(['7', 'much too long a name', '0', ''])
+        database.close()
+        database.open()
+        self.assertIsInstance(database.data_file.record_format, BinaryFormat)
+        self.assertEqual(database.find(-3)[1], ['-3', 'inserted', '1.25', 'new'])
+        self.assertEqual(database.find(100)[1], ['100', 'updated', '25.0', 'c0'])
+
+    def test_convert_text_to_binary_and_back(self):
+        records = [[str(k), f'name{k}', f'{k}.5', 'ab'] for k in range(0, 1000, 10)]
+        database = self.make_database(records, fields=list(FIELD_TYPES))
+        database.convert_format(FIELD_TYPES)
+        self.assertIsInstance(database.data_file.record_format, BinaryFormat)
+        self.assertEqual(database.find(990)[1], ['990', 'name990', '990.5', 'ab'])
+
+        database.convert_format({'id': 3, 'name': 7, 'score': 5, 'code': 2})
+        self.assertEqual(list(database.scan()), records)
@@ -0,0 +1,54 @@
+import os
+from file_database.util import *
+from file_database.bloom_filter import BloomFilter
+from tests.helpers import DatabaseTestCase
+
+class TestBloomFilter(DatabaseTestCase):
+    def test_false_positive_rate(self):
+        bloom_filter = BloomFilter(os.path.join(self.dir, 'test.bloom'), 0.01)
+        bloom_filter.reset(range(0, 20000, 2))
+        self.assertTrue(all(key in bloom_filter for key in range(0, 20000, 2)))
+        false_positives = sum(1 for key in range(1, 20000, 2) if key in bloom_filter)
+        self.assertLess(false_positives, 10000 * 0.02)
+
+    def test_grows_past_its_capacity(self):
+        bloom_filter = BloomFilter(os.path.join(self.dir, 'test.bloom'), 0.01)
+        bloom_filter.reset([])
+        for key in range(bloom_filter.capacity + 1):
+            bloom_filter.add(key)
+        self.assertTrue(bloom_filter.is_full())
+
+        database = self.make_database([[str(k), 'x'] for k in range(1000, 1020)])
+        capacity = database.data_file.bloom_filter.capacity
+        keys = range(2000, 2000 + capacity + 1)
+        for k in keys:
+            database.insert([str(k), 'y'])
+        self.assertGreater(database.data_file.bloom_filter.capacity, capacity)
+        self.assertFalse(database.data_file.bloom_filter.is_full())
+        self.assertTrue(all(database.data_file.has_key(k) for k in keys))
+
+    def test_misses_skip_the_key_index(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 20000, 2)], false_positive_rate=0.001)
+        database.stats(reset=True)
+        for k in range(1, 2001, 2):
+            with self.assertRaises(RecordNotFoundError):
+                database.find(k)
+        counters = database.stats()['counters']
+        self.assertEqual(counters['bloom_filter_negatives'] + counters.get('bloom_filter_false_positives', 0), 1000)
+        self.assertGreater(counters['bloom_filter_negatives'], 990)
+
+    def test_persisted_and_kept_up_to_date(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 2000, 2)])
+        database.insert(['1', 'y'])
+        database.insert_many([[str(k), 'y'] for k in range(3, 2000, 4)])
+        database.delete(*database.find(0))
+        database.close()
+        self.assertTrue(os.path.exists(os.path.join(database.dir, 'test.bloom')))
+
+        database.open()
+        self.assertEqual(database.find(1)[1], ['1', 'y'])
+        self.assertEqual(database.find(1999)[1], ['1999', 'y'])
+        with self.assertRaises(RecordNotFoundError):
+            database.find(0)
+        with self.assertRaises(DuplicatePrimaryKeyError):
+            database.insert(['3', 'y'])
@@ -0,0 +1,20 @@
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+class TestCompaction(DatabaseTestCase):
+    def test_index_found_before_compaction(self):
+        database = self.make_database([[str(k), f'name{k}'] for k in range(2000)])
+        index, record = database.find(1999)
+        for k in range(1, 1990):
+            database.delete(*database.find(k))
+
+        compactor = database.compact(background=False)
+        self.assertTrue(compactor.completed)
+        self.assertGreater(index, len(database.data_file))
+
+        database.update(index, record, 'name', 'updated')
+        self.assertEqual(database.find(1999)[1], ['1999', 'updated'])
+        index, record = database.find(1998)
+        database.delete(len(database.data_file) + 100, record)
+        with self.assertRaises(RecordNotFoundError):
+            database.find(1998)
@@ -0,0 +1,37 @@
+import os
+import random
+from file_database.csv_import import SortedCsv
+from tests.helpers import DatabaseTestCase
+
+class TestCsvImport(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        keys = list(range(5000))
+        random.Random(0).shuffle(keys)
+        self.records = [[str(k), f'name{k % 97}'] for k in keys]
+        self.csv_path = os.path.join(self.dir, 'people.csv')
+        with open(self.csv_path, 'w') as f:
+            f.write('id,name\n')
+            f.writelines(','.join(record) + '\n' for record in self.records)
+
+    def check_sorted_csv(self, workers):
+        with SortedCsv(self.csv_path, self.dir, workers, chunk_size=4096) as csv:
+            self.assertGreater(len(csv.run_paths), 1) # several chunks to merge
+            self.assertEqual(csv.fields, ['id', 'name'])
+            self.assertEqual(csv.num_records, 5000)
+            self.assertEqual(csv.max_column_widths, [4, 6])
+            self.assertEqual(list(csv.records()), sorted(self.records, key=lambda record: int(record[0])))
+            run_dir = csv.run_dir
+        self.assertFalse(os.path.exists(run_dir))
+
+    def test_sorted_csv_in_process(self):
+        self.check_sorted_csv(workers=1)
+
+    def test_sorted_csv_with_worker_processes(self):
+        self.check_sorted_csv(workers=2)
+
+    def test_import_unsorted_csv(self):
+        database = self.make_database(self.records)
+        self.assertEqual(list(database.scan()), sorted(self.records, key=lambda record: int(record[0])))
+        self.assertEqual(database.data_file.record_format.field_to_length, {'id': 4, 'name': 6})
+        self.assertEqual(database.find(4321)[1], ['4321', f'name{4321 % 97}'])
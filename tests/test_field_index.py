@@ -0,0 +1,59 @@
+import os
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+class TestFieldIndex(DatabaseTestCase):
+    def make_people(self, **options):
+        records = [[str(k), f'city{k % 7}', str(k % 100)] for k in range(0, 3000, 3)]
+        return self.make_database(records, fields=('id', 'city', 'score'), **options)
+
+    def find_by_scan(self, database, field, value):
+        field_number = database.fields.index(field)
+        return [record for record in database.scan() if record[field_number].strip() == value]
+
+    def test_find_by_matches_a_scan(self):
+        database = self.make_people()
+        expected = self.find_by_scan(database, 'city', 'city3')
+        database.create_index('city')
+        self.assertEqual([record for _, record in database.find_by('city', 'city3')], expected)
+        self.assertEqual(database.find_by('city', 'nowhere'), [])
+
+    def test_index_follows_writes(self):
+        database = self.make_people()
+        database.create_index('city')
+        database.insert(['1', 'city3', '5'])
+        database.update(*database.find(3), 'city', 'city3')
+        database.delete(*database.find(24))
+        database.insert_many([['2', 'city3', '5'], ['4', 'city0', '5']])
+        database.compact(background=False)
+
+        keys = [get_key(record) for _, record in database.find_by('city', 'city3')]
+        self.assertEqual(keys, [get_key(record) for record in self.find_by_scan(database, 'city', 'city3')])
+        self.assertIn(1, keys)
+        self.assertIn(2, keys)
+        self.assertIn(3, keys)
+        self.assertNotIn(24, keys)
+
+    def test_index_persists_across_reopen(self):
+        database = self.make_people()
+        database.create_index('city')
+        database.insert(['1', 'city3', '5'])
+        database.close()
+        self.assertTrue(os.path.exists(os.path.join(database.dir, 'test.city.index')))
+
+        database.open()
+        self.assertIn('city', database.data_file.field_indexes)
+        keys = [get_key(record) for _, record in database.find_by('city', 'city3')]
+        self.assertEqual(keys, [get_key(record) for record in self.find_by_scan(database, 'city', 'city3')])
+        self.assertIn(1, keys)
+
+    def test_find_range_on_numbers(self):
+        database = self.make_people(field_types={'id': 'int64', 'city': 'varchar(8)', 'score': 'int64'})
+        expected = database.find_range('score', '8', '12')
+        database.create_index('score')
+        found = database.find_range('score', '8', '12')
+        self.assertEqual(found, expected)
+        self.assertEqual([int(record[2]) for _, record in found], sorted(int(record[2]) for _, record in found))
+        self.assertEqual({int(record[2]) for _, record in found}, set(range(8, 13)))
+        with self.assertRaises(InvalidInputError):
+            database.find_by('score', 'ten')
@@ -0,0 +1,30 @@
+from tests.helpers import DatabaseTestCase
+
+class TestInsert(DatabaseTestCase):
+    def test_insert_between_neighbouring_keys(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 20000, 10)])
+        data_file = database.data_file
+        before, after = data_file.key_index.find(10000), data_file.key_index.find(10010)
+        self.assertGreater(after - before, 1)
+
+        database.stats(reset=True)
+        database.insert(['10005', 'y'])
+        # the key index gives the gap, so only the page of the slot written is read
+        self.assertLessEqual(database.stats()['counters']['slots_read'], data_file.page_lines)
+        self.assertNotIn('rebalance', database.stats()['timers'])
+        self.assertEqual(database.find(10005), ((before + after) // 2, ['10005', 'y']))
+
+    def test_insert_outside_the_keys(self):
+        database = self.make_database([[str(k), 'x'] for k in range(100, 200)])
+        database.insert(['50', 'y'])
+        database.insert(['250', 'y'])
+        keys = [int(record[0]) for record in database.scan()]
+        self.assertEqual(keys, [50] + list(range(100, 200)) + [250])
+
+    def test_insert_into_full_gap_rebalances(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 2000, 10)])
+        for k in range(1001, 1010):
+            database.insert([str(k), 'y'])
+        self.assertGreater(database.stats()['timers']['rebalance']['calls'], 0)
+        keys = [int(record[0]) for record in database.scan()]
+        self.assertEqual(keys, sorted(set(range(0, 2000, 10)) | set(range(1001, 1010))))
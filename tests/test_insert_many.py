@@ -0,0 +1,45 @@
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+class TestInsertMany(DatabaseTestCase):
+    def test_results_per_record(self):
+        database = self.make_database([[str(k), 'name'] for k in range(0, 1000, 10)])
+        results = database.insert_many([['5', 'new'], ['10', 'dup'], ['15', 'much too long'], ['5', 'dup'], ['25', 'new']])
+
+        self.assertEqual(results[0], None)
+        self.assertIsInstance(results[1], DuplicatePrimaryKeyError)
+        self.assertIsInstance(results[2], InvalidRecordSizeError)
+        self.assertIsInstance(results[3], DuplicatePrimaryKeyError)
+        self.assertEqual(results[4], None)
+        self.assertEqual(database.find(5)[1], ['5', 'new'])
+        self.assertEqual(database.find(10)[1], ['10', 'name'])
+        with self.assertRaises(RecordNotFoundError):
+            database.find(15)
+
+    def test_records_fitting_their_gaps_are_written_in_place(self):
+        database = self.make_database([[str(k), 'name'] for k in range(0, 1000, 10)])
+        new_keys = [k + 5 for k in range(0, 990, 10)]
+        database.stats(reset=True)
+        results = database.insert_many([[str(k), 'new'] for k in reversed(new_keys)])
+
+        self.assertEqual(results, [None] * len(new_keys))
+        self.assertNotIn('rewrite', database.stats()['timers'])
+        keys = [int(record[0]) for record in database.scan()]
+        self.assertEqual(keys, sorted(set(range(0, 1000, 10)) | set(new_keys)))
+
+    def test_batch_too_large_for_a_gap_rewrites_the_file(self):
+        database = self.make_database([[str(k), 'name'] for k in range(0, 1000, 10)])
+        new_keys = list(range(501, 510)) + [993, 997]
+        database.stats(reset=True)
+        results = database.insert_many([[str(k), 'new'] for k in new_keys] + [['0', 'dup']])
+
+        self.assertEqual(results[:-1], [None] * len(new_keys))
+        self.assertIsInstance(results[-1], DuplicatePrimaryKeyError)
+        self.assertEqual(database.stats()['timers']['rewrite']['calls'], 1)
+        keys = [int(record[0]) for record in database.scan()]
+        self.assertEqual(keys, sorted(set(range(0, 1000, 10)) | set(new_keys)))
+        self.assertEqual(database.find(505)[1], ['505', 'new'])
+
+        database.close()
+        database.open()
+        self.assertEqual(database.find(997)[1], ['997', 'new'])
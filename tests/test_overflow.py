@@ -0,0 +1,54 @@
+import os
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+def name(k):
+    return f'long name {k} ' + 'x' * 40 if k % 20 == 0 else f'name{k}'
+
+class TestOverflow(DatabaseTestCase):
+    def make_people(self):
+        return self.make_database([[str(k), name(k)] for k in range(1000, 3000)], inline_fraction=0.9)
+
+    def test_long_values_spill(self):
+        database = self.make_people()
+        record_format = database.data_file.record_format
+        self.assertEqual(record_format.widths['name'], '16+')
+        self.assertLess(record_format.line_size, 40)
+        self.assertGreater(os.path.getsize(os.path.join(database.dir, 'test.overflow')), 100 * 40)
+
+        self.assertEqual(database.find(1020)[1], ['1020', name(1020)])
+        self.assertEqual(database.find(1021)[1], ['1021', name(1021)])
+        self.assertEqual(list(database.scan()), [[str(k), name(k)] for k in range(1000, 3000)])
+
+    def test_writes_of_long_values(self):
+        database = self.make_people()
+        long_value = 'a value far longer than the field ' * 3
+        database.insert(['5000', long_value])
+        database.update(*database.find(1021), 'name', long_value)
+        database.update(*database.find(1040), 'name', 'short again')
+        database.insert_many([['5001', long_value], ['5002', 'short']])
+
+        database.close()
+        database.open()
+        self.assertEqual(database.find(5000)[1], ['5000', long_value])
+        self.assertEqual(database.find(1021)[1], ['1021', long_value])
+        self.assertEqual(database.find(1040)[1], ['1040', 'short again'])
+        self.assertEqual(database.find(5001)[1], ['5001', long_value])
+
+        database.compact(background=False)
+        self.assertEqual(database.find(1021)[1], ['1021', long_value])
+        self.assertEqual(database.find(5002)[1], ['5002', 'short'])
+
+    def test_select_and_find_by_spilled_values(self):
+        database = self.make_people()
+        self.assertEqual(list(database.select(['id'], where=[('name', '==', name(1060))])), [['1060']])
+        self.assertEqual([record for _, record in database.find_by('name', name(1080))], [['1080', name(1080)]])
+
+        database.create_index('name')
+        self.assertEqual([record for _, record in database.find_by('name', name(1080))], [['1080', name(1080)]])
+
+    def test_widen_field_moves_values_inline(self):
+        database = self.make_people()
+        database.widen_field('name', 60, background=False)
+        self.assertEqual(database.data_file.record_format.field_to_length['name'], 60)
+        self.assertEqual(list(database.scan()), [[str(k), name(k)] for k in range(1000, 3000)])
@@ -0,0 +1,69 @@
+import os
+import sys
+import subprocess
+from file_database.database import Database
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+# writes the database in a separate process: inserts the odd keys, deletes the keys 2 mod 4 and
+# updates the keys 0 mod 8, checkpointing often. creates the file argv[2] when done
+WRITER = '''
+import sys
+from file_database.database import Database
+database = Database(sys.argv[1])
+database.open()
+database.data_file.CHECKPOINT_BYTES = 4096
+database.data_file.WRITE_THROUGH_LINES = 32
+print('open', flush=True)
+sys.stdin.readline()
+for k in range(1, 2000, 2):
+    database.insert([str(k), f'name{k:04}'])
+    if k % 4 == 1:
+        database.delete(*database.find(k + 1))
+    if k % 8 == 1:
+        index, record = database.find(k - 1)
+        database.update(index, record, 'name', 'updated')
+open(sys.argv[2], 'w').close()
+sys.stdin.readline()
+database.close()
+'''
+
+class TestProcesses(DatabaseTestCase):
+    def test_read_while_another_process_writes(self):
+        database = self.make_database([[str(k), f'name{k:04}'] for k in range(0, 2000, 2)])
+        database.close()
+        done_path = os.path.join(self.dir, 'done')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        writer = subprocess.Popen([sys.executable, '-c', WRITER, database.dir, done_path], cwd=root,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.addCleanup(writer.wait)
+        self.addCleanup(writer.stdin.close)
+        self.addCleanup(writer.stdout.close)
+        self.assertEqual(writer.stdout.readline(), 'open\n')
+
+        with self.assertRaises(DatabaseLockedError):
+            Database(database.dir).open()
+        reader = Database(database.dir)
+        reader.open(read_only=True)
+        self.addCleanup(reader.close)
+
+        writer.stdin.write('go\n')
+        writer.stdin.flush()
+        kept = set(range(0, 2000, 4))
+        while not os.path.exists(done_path):
+            keys = [get_key(record) for record in reader.scan()]
+            self.assertEqual(keys, sorted(set(keys)))
+            self.assertLessEqual(kept, set(keys))
+            self.assertEqual(reader.find(1000)[1][0], '1000')
+
+        expected = sorted(kept | set(range(1, 2000, 2)))
+        self.assertEqual([get_key(record) for record in reader.scan()], expected)
+        self.assertEqual(reader.find(8)[1], ['8', 'updated'])
+        with self.assertRaises(RecordNotFoundError):
+            reader.find(2)
+
+        writer.stdin.write('close\n')
+        writer.stdin.flush()
+        self.assertEqual(writer.wait(), 0)
+        self.assertEqual([get_key(record) for record in reader.scan()], expected)
+        self.assertEqual(reader.find_by('name', 'updated'), [reader.find(k) for k in range(0, 2000, 8)])
@@ -0,0 +1,34 @@
+import os
+import sys
+import subprocess
+from file_database.database import Database
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+# mutates the database in a separate process, which exits after syncing the log without closing it
+CRASH = '''
+import os, sys
+from file_database.database import Database
+database = Database(sys.argv[1])
+database.open()
+database.insert(['15', 'name15'])
+database.delete(*database.find(0))
+database.sync()
+os._exit(0)
+'''
+
+class TestRecovery(DatabaseTestCase):
+    def test_read_only_open_after_crash(self):
+        database = self.make_database([[str(k), f'name{k}'] for k in range(0, 100, 10)])
+        database.close()
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, '-c', CRASH, database.dir], cwd=root, check=True)
+
+        database = Database(database.dir)
+        database.open(read_only=True)
+        self.addCleanup(database.close)
+        self.assertEqual(database.find(15)[1], ['15', 'name15'])
+        with self.assertRaises(RecordNotFoundError):
+            database.find(0)
+        self.assertEqual([get_key(record) for record in database.scan()], [10, 15, 20, 30, 40, 50, 60, 70, 80, 90])
@@ -0,0 +1,91 @@
+from unittest import mock
+from tests.helpers import DatabaseTestCase
+
+class TestScan(DatabaseTestCase):
+    def test_scan_during_clustered_inserts(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 2000, 10)])
+        database.data_file.READ_BLOCK_SIZE = 8 * database.data_file.line_size # many blocks
+
+        keys = []
+        inserted = set()
+        for record in database.scan():
+            keys.append(int(record[0]))
+            if keys[-1] % 100 == 0 and keys[-1] < 1900:
+                # enough keys in one gap to rebalance the window around the scan position
+                for k in range(keys[-1] + 51, keys[-1] + 60):
+                    database.insert([str(k), 'y'])
+                    inserted.add(k)
+
+        self.assertEqual(keys, sorted(set(keys)))
+        self.assertEqual(set(keys), set(range(0, 2000, 10)) | inserted)
+        self.assertGreater(database.stats()['timers']['rebalance']['calls'], 0)
+
+    def test_select_during_clustered_inserts(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 2000, 10)])
+        database.data_file.READ_BLOCK_SIZE = 8 * database.data_file.line_size
+
+        keys = []
+        for (key,) in database.select(['id'], where=[('name', '==', 'x')]):
+            keys.append(int(key))
+            if keys[-1] % 100 == 0 and keys[-1] < 1900:
+                for k in range(keys[-1] + 51, keys[-1] + 60):
+                    database.insert([str(k), 'y'])
+
+        self.assertEqual(keys, list(range(0, 2000, 10)))
+
+    def test_short_scan_reads_only_its_range(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 20000, 2)])
+        database.stats(reset=True)
+        self.assertEqual(database.find_first_n_records(1), [['0', 'x']])
+        self.assertLess(database.stats()['counters']['slots_read'], 10)
+
+    def test_scan_after_compaction_between_lookup_and_read(self):
+        database = self.make_database([[str(k), 'x'] for k in range(2000)])
+        for k in range(0, 1500):
+            database.delete(*database.find(k))
+
+        data_file = database.data_file
+        scan = data_file.scan
+        def compact_then_scan(*args):
+            # the slots were looked up before the compaction moved every record
+            data_file.scan = scan # the compaction scans too
+            database.compact(background=False)
+            return scan(*args)
+
+        with mock.patch.object(data_file, 'scan', side_effect=compact_then_scan):
+            keys = [int(record[0]) for record in database.scan(1600, 1700)]
+        self.assertEqual(keys, list(range(1600, 1701)))
+
+    def test_select_after_compaction_between_lookup_and_read(self):
+        database = self.make_database([[str(k), 'x'] for k in range(2000)])
+        for k in range(0, 1500):
+            database.delete(*database.find(k))
+
+        data_file = database.data_file
+        select = data_file.select
+        def compact_then_select(*args):
+            data_file.select = select
+            database.compact(background=False)
+            return select(*args)
+
+        with mock.patch.object(data_file, 'select', side_effect=compact_then_select):
+            keys = [int(key) for key, in database.select(['id'], start_key=1600, end_key=1700)]
+        self.assertEqual(keys, list(range(1600, 1701)))
+
+    def test_scan_after_rebalance_between_lookup_and_read(self):
+        database = self.make_database([[str(k), 'x'] for k in range(0, 2000, 10)])
+        inserted = list(range(1001, 1010)) + list(range(1101, 1110))
+
+        data_file = database.data_file
+        scan = data_file.scan
+        def rebalance_then_scan(*args):
+            # the slots were looked up before the rebalances moved the records around them
+            data_file.scan = scan # the rebalances scan too
+            for k in inserted:
+                database.insert([str(k), 'y'])
+            return scan(*args)
+
+        with mock.patch.object(data_file, 'scan', side_effect=rebalance_then_scan):
+            keys = [int(record[0]) for record in database.scan(950, 1150)]
+        self.assertGreater(database.stats()['timers']['rebalance']['calls'], 0)
+        self.assertEqual(keys, sorted(set(range(950, 1151, 10)) | set(inserted)))
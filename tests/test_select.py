@@ -0,0 +1,51 @@
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+FIELDS = ('id', 'name', 'city', 'score')
+FIELD_TYPES = {'id': 'int64', 'name': 'varchar(8)', 'city': 'bytes(6)', 'score': 'float64'}
+
+def person(k):
+    return [str(k), f'name{k % 10}', f'city{k % 7}', str(k * 37 % 1000)]
+
+class TestSelect(DatabaseTestCase):
+    def check_select(self, database):
+        records = list(database.scan())
+        score = lambda record: float(record[3])
+        where = [('score', '>=', 500), ('city', '!=', 'city3'), ('name', '<', 'name5')]
+        expected = [[record[0], record[2]] for record in records if score(record) >= 500 and record[2] != 'city3' and record[1] < 'name5']
+        self.assertEqual(list(database.select(['id', 'city'], where)), expected)
+        self.assertEqual(list(database.select(['id', 'city'], where, limit=5)), expected[:5])
+        self.assertEqual(list(database.select(['id', 'city'], where, 1000, 2000)), [values for values in expected if 1000 <= int(values[0]) <= 2000])
+
+        self.assertEqual(list(database.select()), records)
+        self.assertEqual(list(database.select(['score'], [('id', '==', 21)])), [[database.find(21)[1][3]]])
+        self.assertEqual(list(database.select(where=[('id', '<', 0)])), [])
+
+    def test_text_records(self):
+        database = self.make_database([person(k) for k in range(1, 3000, 2)], fields=FIELDS)
+        database.insert(['2', 'name2', 'city0', '999'])
+        self.check_select(database)
+        # text fields compared with a number are compared as numbers
+        expected = [[record[0]] for record in database.scan() if int(record[3]) > 997]
+        self.assertEqual(list(database.select(['id'], [('score', '>', 997)])), expected)
+
+    def test_binary_records(self):
+        database = self.make_database([person(k) for k in range(1, 3000, 2)], fields=FIELDS, field_types=FIELD_TYPES)
+        database.insert(['2', 'name2', 'city0', '999'])
+        self.check_select(database)
+        with self.assertRaises(InvalidInputError):
+            database.select(where=[('city', '==', 5)])
+
+    def test_select_after_convert_format(self):
+        database = self.make_database([person(k) for k in range(1, 3000, 2)], fields=FIELDS)
+        results = database.select(['id'], [('city', '==', 'city3')])
+        first = next(results)
+        database.convert_format(FIELD_TYPES) # the query is compiled again for the new format
+        self.assertEqual([first] + list(results), [[str(k)] for k in range(1, 3000, 2) if k % 7 == 3])
+
+    def test_errors(self):
+        database = self.make_database([person(k) for k in range(10)], fields=FIELDS)
+        with self.assertRaises(InvalidInputError):
+            database.select(['nowhere'])
+        with self.assertRaises(InvalidInputError):
+            database.select(where=[('score', '~', 5)])
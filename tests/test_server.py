@@ -0,0 +1,45 @@
+import os
+import asyncio
+import threading
+from file_database import DatabaseServer, DatabaseClient
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+class TestServer(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = DatabaseServer(os.path.join(self.dir, 'data'), port=0)
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.server.start())
+            started.set()
+            loop.run_forever()
+            tasks = asyncio.all_tasks(loop) # connections still being served
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait()
+        self.addCleanup(self.server.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(loop.call_soon_threadsafe, loop.stop)
+
+        self.client = DatabaseClient(port=self.server.port)
+        self.addCleanup(self.client.close)
+        csv_path = os.path.join(self.dir, 'people.csv')
+        with open(csv_path, 'w') as f:
+            f.write('id,name\n')
+            f.writelines(f'{k},name{k}\n' for k in range(1000, 1100))
+        self.client.create_database('people', csv_path)
+
+    def test_update_rejects_primary_key(self):
+        with self.assertRaises(InvalidInputError):
+            self.client.update('people', 1001, 'id', '5000')
+        self.assertEqual([get_key(record) for record in self.client.scan('people')], list(range(1000, 1100)))
+
+        self.client.update('people', 1001, 'name', 'updated')
+        self.assertEqual(self.client.find('people', 1001), ['1001', 'updated'])
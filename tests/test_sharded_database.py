@@ -0,0 +1,76 @@
+import os
+import functools
+from file_database.util import *
+from file_database.sharded_database import ShardedDatabase
+from tests.helpers import DatabaseTestCase
+
+# mappers run in worker processes, so they are module-level functions
+def high_score(record):
+    return int(record[2]) >= 900
+
+def count_records(records, parity):
+    return sum(1 for record in records if get_key(record) % 2 == parity)
+
+class TestShardedDatabase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.records = [[str(k), f'name{k}', str(k * 37 % 1000)] for k in range(0, 6000, 3)]
+        csv_path = os.path.join(self.dir, 'people.csv')
+        with open(csv_path, 'w') as f:
+            f.write('id,name,score\n')
+            f.writelines(','.join(record) + '\n' for record in self.records)
+
+        self.data_dir = os.path.join(self.dir, 'sharded')
+        ShardedDatabase(self.data_dir).import_data('people', csv_path, num_shards=4, max_shard_records=600)
+        self.database = self.open_database()
+
+    def open_database(self):
+        database = ShardedDatabase(self.data_dir, max_workers=2)
+        database.open()
+        self.addCleanup(lambda: database.close() if database.is_open() else None)
+        return database
+
+    def test_import_splits_evenly(self):
+        self.assertEqual(len(self.database), 4)
+        self.assertEqual(self.database.bounds, [1500, 3000, 4500])
+        self.assertEqual(list(self.database.scan()), self.records)
+
+    def test_scan_across_shards(self):
+        database = self.database
+        self.assertEqual(list(database.scan(1400, 3100)), [record for record in self.records if 1400 <= get_key(record) <= 3100])
+        self.assertEqual(list(database.scan(1400, limit=700)), [record for record in self.records if get_key(record) >= 1400][:700])
+        self.assertEqual(list(database.scan(7000)), [])
+
+    def test_inserts_split_a_full_shard(self):
+        database = self.database
+        new_records = [[str(k), 'new', '0'] for k in range(1, 1500, 3)]
+        results = database.insert_many(new_records[:200])
+        self.assertEqual(results, [None] * 200)
+        for record in new_records[200:]:
+            database.insert(record)
+        self.assertIsInstance(database.insert_many([['1', 'dup', '0']])[0], DuplicatePrimaryKeyError)
+
+        self.assertGreater(len(database), 4)
+        expected = sorted(self.records + new_records, key=get_key)
+        self.assertEqual(list(database.scan()), expected)
+        database.update(*database.find(4), 'name', 'updated')
+        database.delete(*database.find(7))
+        database.close()
+
+        database = self.open_database()
+        self.assertGreater(len(database), 4)
+        self.assertEqual(database.find(4)[1], ['4', 'updated', '0'])
+        with self.assertRaises(RecordNotFoundError):
+            database.find(7)
+        self.assertEqual(len(os.listdir(self.data_dir)), len(database) + 1) # the split shards were removed
+
+    def test_parallel_scan(self):
+        database = self.database
+        database.insert(['1', 'new', '999']) # not checkpointed, so the workers read it from the log
+        expected = sorted([record for record in self.records if high_score(record)] + [['1', 'new', '999']], key=get_key)
+        self.assertEqual(database.parallel_scan(where=high_score), expected)
+        self.assertEqual(database.parallel_scan(1000, 2000, high_score), [record for record in expected if 1000 <= get_key(record) <= 2000])
+
+        counts = database.map_shards(functools.partial(count_records, parity=1), 0, 2000)
+        self.assertEqual(len(counts), 2)
+        self.assertEqual(sum(counts), sum(1 for record in self.records + [['1']] if get_key(record) <= 2000 and get_key(record) % 2 == 1))
@@ -0,0 +1,54 @@
+import os
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+class TestSnapshot(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.records = [[str(k), f'name{k:04}'] for k in range(0, 3000, 3)]
+        self.database = self.make_database(self.records)
+
+    def change_everything(self):
+        database = self.database
+        database.insert(['1', 'inserted'])
+        database.update(*database.find(3), 'name', 'updated')
+        database.delete(*database.find(6))
+        for k in range(1501, 1530):
+            if k % 3:
+                database.insert([str(k), 'inserted'])
+
+    def test_writes_do_not_show(self):
+        with self.database.snapshot() as snapshot:
+            self.change_everything()
+            with self.database.data_file.lock.write():
+                self.database.data_file.checkpoint() # overwrites the slots in place
+            self.assertGreater(self.database.stats()['timers']['rebalance']['calls'], 0)
+            self.assertEqual(list(snapshot.scan()), self.records)
+            self.assertEqual(snapshot.find(3), ['3', 'name0003'])
+            with self.assertRaises(RecordNotFoundError):
+                snapshot.find(1)
+        self.assertEqual(self.database.find(3)[1], ['3', 'updated'])
+
+    def test_rewrites_and_compactions_do_not_show(self):
+        with self.database.snapshot() as snapshot:
+            self.database.insert_many([[str(k), 'inserted'] for k in range(1, 3000, 3)]) # too many for the gaps
+            self.assertEqual(self.database.stats()['timers']['rewrite']['calls'], 1)
+            self.database.delete(*self.database.find(6))
+            self.database.compact(background=False)
+            self.database.close() # the snapshot keeps its own descriptors
+
+            self.assertEqual(len(snapshot), len(self.records))
+            self.assertEqual(list(snapshot.scan(300, 600, limit=50)), [record for record in self.records if 300 <= get_key(record) <= 600][:50])
+
+    def test_export(self):
+        path = os.path.join(self.dir, 'export.csv')
+        with self.database.snapshot() as snapshot:
+            self.change_everything()
+            self.assertEqual(snapshot.export(path, 'csv', 0, 30), 11)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'id,name\n' + ''.join(f'{k},name{k:04}\n' for k in range(0, 31, 3)))
+
+        # Database.export reads from a snapshot of its own
+        self.assertEqual(self.database.export(path, 'csv', 0, 6), 3)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'id,name\n0,name0000\n1,inserted\n3,updated\n')
@@ -0,0 +1,56 @@
+import os
+import threading
+from unittest import mock
+from file_database.util import *
+from tests.helpers import DatabaseTestCase
+
+class TestGroupCommit(DatabaseTestCase):
+    def test_mutation_durable_on_return(self):
+        database = self.make_database([[str(k), f'name{k}'] for k in range(0, 200, 2)])
+        wal = database.data_file.wal
+        for k in range(1, 21, 2):
+            database.insert([str(k), f'name{k}'])
+            self.assertEqual(wal.synced_through, wal.committed)
+
+    def test_concurrent_writers_share_fsyncs(self):
+        database = self.make_database([[str(k), f'name{k}'] for k in range(0, 1600, 2)])
+        wal = database.data_file.wal
+        syncs = []
+        fsync = os.fsync
+        def counted_fsync(fd):
+            if fd == wal.file.fileno():
+                syncs.append(fd)
+            fsync(fd)
+
+        def insert(first):
+            for k in range(first, 1600, 8):
+                database.insert([str(k), f'name{k}'])
+
+        threads = [threading.Thread(target=insert, args=(first,)) for first in range(1, 8, 2)]
+        with mock.patch('os.fsync', counted_fsync):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(wal.synced_through, wal.committed)
+        self.assertEqual(wal.committed, 800)
+        self.assertLess(len(syncs), 800)
+        self.assertEqual([get_key(record) for record in database.scan()], list(range(1600)))
+
+class TestWriteThrough(DatabaseTestCase):
+    def test_large_rebalances_bypass_dirty_lines(self):
+        database = self.make_database([[str(k * 1000), f'name{k * 1000:06}'] for k in range(500)])
+        data_file = database.data_file
+        data_file.WRITE_THROUGH_LINES = 32
+        moves = data_file.moves
+        for k in range(250001, 250400):
+            database.insert([str(k), f'name{k:06}'])
+            self.assertLessEqual(len(data_file.dirty), 32)
+        self.assertGreater(data_file.moves, moves)
+
+        keys = sorted([k * 1000 for k in range(500)] + list(range(250001, 250400)))
+        self.assertEqual([get_key(record) for record in database.scan()], keys)
+        database.close()
+        database.open()
+        self.assertEqual([get_key(record) for record in database.scan()], keys)
+        self.assertEqual(database.find(250399)[1], ['250399', 'name250399'])